@@ -0,0 +1,74 @@
+"""
+Memory footprint of the headless detection model.
+
+Builds a detector with N processes, N resources and N allocation plus N
+request edges, and reports the bytes attributed to each process, resource
+and edge as measured by tracemalloc (NumPy arrays included).
+
+    python benchmarks/memory_footprint.py --nodes 1000000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+# Add the parent directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.deadlock_detector import DeadlockDetector
+
+
+def measure(step) -> int:
+    """Bytes still allocated after running step()"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    step()
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=1_000_000,
+                        help="number of processes and of resources (default: 1M)")
+    args = parser.parse_args()
+    n = args.nodes
+
+    tracemalloc.start()
+    detector = DeadlockDetector(incremental=False, contiguous_labels=False)
+    processes, resources = [], []
+    started = time.perf_counter()
+
+    process_bytes = measure(lambda: processes.extend(detector.add_process() for _ in range(n)))
+    resource_bytes = measure(lambda: resources.extend(detector.add_resource() for _ in range(n)))
+
+    def add_edges():
+        # Process i holds resource i and waits for resource i + 1
+        for i in range(n):
+            detector.allocate_resource(resources[i], processes[i])
+        for i in range(n):
+            detector.request_resource(processes[i], resources[(i + 1) % n])
+        detector.store.compact()
+
+    edge_bytes = measure(add_edges)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"nodes per kind    : {n:,}")
+    print(f"bytes per process : {process_bytes / n:8.1f}")
+    print(f"bytes per resource: {resource_bytes / n:8.1f}")
+    print(f"bytes per edge    : {edge_bytes / (2 * n):8.1f}")
+    print(f"graph store       : {detector.store.nbytes() / 2**20:8.1f} MiB")
+    print(f"peak traced       : {peak / 2**20:8.1f} MiB")
+    print(f"build time        : {elapsed:8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
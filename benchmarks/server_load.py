@@ -0,0 +1,85 @@
+"""
+Load test for the asyncio detection service.
+
+Starts gui.server in a child process, opens many concurrent connections,
+pipelines allocate/release pairs on each of them, fires one concurrent
+detect call per connection and reports request throughput and how many
+detection runs the detect calls were coalesced into.
+
+    python benchmarks/server_load.py --connections 2000 --pairs 25
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+# Add the parent directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.server import DetectorClient
+
+
+async def connect(port: int, attempts: int = 50) -> DetectorClient:
+    for _ in range(attempts):
+        try:
+            return await DetectorClient.connect(port=port)
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"service did not start on port {port}")
+
+
+async def load(port: int, connections: int, pairs: int):
+    first = await connect(port)
+    clients = [first] + list(await asyncio.gather(
+        *(DetectorClient.connect(port=port) for _ in range(connections - 1))))
+
+    started = time.perf_counter()
+    replies = []
+    for i, client in enumerate(clients):
+        for j in range(pairs):
+            replies.append(client.send("allocate", process=f"C{i}", resource=f"L{i}.{j}"))
+            replies.append(client.send("release", process=f"C{i}", resource=f"L{i}.{j}"))
+    await asyncio.gather(*(client.writer.drain() for client in clients))
+    results = await asyncio.gather(*replies)
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for reply in results if not reply.get("ok"))
+
+    before = await first.call("query")
+    started = time.perf_counter()
+    await asyncio.gather(*(client.call("detect") for client in clients))
+    detect_elapsed = time.perf_counter() - started
+    after = await first.call("query")
+
+    print(f"connections     : {connections}")
+    print(f"requests        : {len(results):,} ({failed} failed)")
+    print(f"throughput      : {len(results) / elapsed:,.0f} requests/s")
+    print(f"detect calls    : {connections} in {detect_elapsed * 1000:.1f} ms, "
+          f"{after['detections'] - before['detections']} detection runs")
+    await asyncio.gather(*(client.close() for client in clients))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--pairs", type=int, default=25,
+                        help="allocate/release pairs pipelined per connection")
+    parser.add_argument("--port", type=int, default=7979)
+    args = parser.parse_args()
+
+    server = subprocess.Popen([sys.executable, "-m", "gui.server", "--port", str(args.port)],
+                              cwd=parent_dir)
+    try:
+        asyncio.run(load(args.port, args.connections, args.pairs))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
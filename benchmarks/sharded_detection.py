@@ -0,0 +1,169 @@
+"""
+Message traffic and detection latency of distributed deadlock detection.
+
+Replays a lock-event trace (or a synthetic one) through 1, 2, 4, ...
+shard processes and reports, per shard count, the deadlocks found, the
+messages exchanged by kind and the detection latency.  The deadlocks are
+checked against a single centralized StreamingDetector.  --mode selects
+probe-based edge chasing (gui.distributed) or site summaries merged by a
+coordinator process (gui.coordinator).
+
+    python benchmarks/sharded_detection.py --shards 1 2 4 8
+    python benchmarks/sharded_detection.py --mode coordinator --shards 2 4 8
+    python benchmarks/sharded_detection.py --trace trace.jsonl --shards 2 4
+"""
+
+import argparse
+import heapq
+import os
+import random
+import sys
+from typing import List
+
+# Add the parent directory to the Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.coordinator import run_hierarchical
+from gui.distributed import run_sharded
+from gui.stream import Event, StreamingDetector, guess_format, read_events
+
+
+def synthetic_trace(threads: int, locks: int, events: int, seed: int = 0,
+                    patience: int = 2000) -> List[Event]:
+    """
+    Threads that take up to two random locks, hold them briefly and release
+    them.  A thread blocked on a lock gets it when it frees up, in arrival
+    order, so lock-order inversions turn into deadlocks.  The thread whose
+    request closed a deadlock gives up `patience` events later, cancelling
+    the request and releasing its locks, so new deadlocks keep forming.
+    """
+    rnd = random.Random(seed)
+    owner, waiting, gives_up = {}, {}, {}
+    queues = {}  # Waiting threads per lock
+    held = {t: [] for t in range(threads)}
+    running = list(range(threads))
+    slot = {t: t for t in running}
+    deadlines = []
+    trace = []
+    step = 0
+
+    def run(t):
+        slot[t] = len(running)
+        running.append(t)
+
+    def release(t, lock, when):
+        trace.append(Event("release", f"T{t}", f"L{lock}", None, when))
+        queue = queues.get(lock)
+        if not queue:
+            del owner[lock]
+            return
+        other = queue.pop(0)
+        owner[lock] = other
+        held[other].append(lock)
+        del waiting[other]
+        gives_up.pop(other, None)
+        trace.append(Event("acquire", f"T{other}", f"L{lock}", None, when))
+        run(other)
+
+    while len(trace) < events:
+        step += 1
+        # Give up on schedule, or early once every thread is blocked
+        while deadlines and (deadlines[0][0] <= len(trace) or not running):
+            deadline, t = heapq.heappop(deadlines)
+            if gives_up.get(t) != deadline:
+                continue
+            lock = waiting.pop(t)
+            del gives_up[t]
+            queues[lock].remove(t)
+            trace.append(Event("cancel", f"T{t}", f"L{lock}", None, float(step)))
+            while held[t]:
+                release(t, held[t].pop(), float(step))
+            run(t)
+        if not running:
+            break
+        t = running[rnd.randrange(len(running))]
+        if held[t] and (len(held[t]) >= 2 or rnd.random() < 0.5):
+            release(t, held[t].pop(), float(step))
+            continue
+        lock = rnd.randrange(locks)
+        if lock in held[t]:
+            continue
+        if lock not in owner:
+            owner[lock] = t
+            held[t].append(lock)
+            trace.append(Event("acquire", f"T{t}", f"L{lock}", None, float(step)))
+            continue
+        waiting[t] = lock
+        queues.setdefault(lock, []).append(t)
+        last = running.pop()
+        if last != t:
+            running[slot[t]] = last
+            slot[last] = slot[t]
+        trace.append(Event("request", f"T{t}", f"L{lock}", None, float(step)))
+        # Follow the owners' waits; coming back to t means a deadlock
+        other, seen = owner[lock], set()
+        while other != t and other not in seen and other in waiting:
+            seen.add(other)
+            other = owner[waiting[other]]
+        if other == t:
+            gives_up[t] = len(trace) + patience
+            heapq.heappush(deadlines, (len(trace) + patience, t))
+    return trace[:events]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="shard counts to measure (default: 1 2 4 8)")
+    parser.add_argument("--trace", help="JSONL/CSV trace to replay instead of a synthetic one")
+    parser.add_argument("--threads", type=int, default=500, help="synthetic threads")
+    parser.add_argument("--locks", type=int, default=2000, help="synthetic locks")
+    parser.add_argument("--events", type=int, default=200_000, help="synthetic trace length")
+    parser.add_argument("--patience", type=int, default=2000,
+                        help="synthetic events before a deadlocked thread gives up")
+    parser.add_argument("--chunk", type=int, default=64, help="events per dispatch message")
+    parser.add_argument("--rate", type=float, default=4000,
+                        help="events per second fed to the shards, 0 for as fast as possible "
+                             "(default 4000; shards that fall behind miss short-lived deadlocks)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=("probes", "coordinator"), default="probes",
+                        help="edge-chasing probes (default) or a summary coordinator")
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace, newline="") as source:
+            trace = list(read_events(source, guess_format(args.trace)))
+    else:
+        trace = synthetic_trace(args.threads, args.locks, args.events, args.seed, args.patience)
+
+    expected = {frozenset(p for p, _ in report.cycle)
+                for report in StreamingDetector(evict_idle=False).run(trace)}
+    print(f"events: {len(trace):,}  centralized deadlocks: {len(expected)}")
+    run = run_sharded if args.mode == "probes" else run_hierarchical
+    print(f"{'shards':>6} {'found':>6} {'missed':>6} {'extra':>6} {'dup':>5} {'msgs':>8} "
+          f"{'msg/evt':>8} {'p50 ms':>8} {'p99 ms':>8} {'wall s':>7}  messages by kind")
+    for shards in args.shards:
+        result = run(trace, shards, args.chunk, args.rate or None)
+        found = {frozenset(p for p, _ in report.cycle) for report in result.deadlocks}
+        latencies = [report.latency * 1000 for report in result.deadlocks]
+        messages = result.messages
+        total = sum(count for kind, count in messages.items() if kind != "bytes")
+        kinds = " ".join(f"{kind}={count}" for kind, count in sorted(messages.items()))
+        print(f"{shards:>6} {len(found):>6} {len(expected - found):>6} {len(found - expected):>6} "
+              f"{result.duplicates:>5} {total:>8} {total / max(1, len(trace)):>8.3f} "
+              f"{percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.99):>8.2f} "
+              f"{result.elapsed:>7.2f}  {kinds}")
+
+
+if __name__ == "__main__":
+    main()
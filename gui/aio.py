@@ -0,0 +1,353 @@
+"""
+Deadlock detection for asyncio tasks.
+
+Thread-level tools see a deadlocked event loop as an idle thread.  Here the
+wait-for graph is built from the tasks themselves:
+
+- Lock, Semaphore, Event and Condition are drop-in asyncio replacements
+  that remember which task holds them and which tasks are blocked on them.
+  An Event is waited for on behalf of its setter, the task that is
+  expected to set it, declared with Event(setter=task) or event.setter.
+- A task suspended on another task, directly or through gather(), waits
+  for that task.  This is read from the task's pending future.
+
+TaskMonitor runs as a task on the monitored loop.  Each tick it scans at
+most `budget` tasks, round robin, for at most `slice_ms` milliseconds, and
+applies the changes in what they wait for and who holds it to a
+StreamingDetector, so a tick never stalls the loop however many tasks
+exist.  Tasks are processes; locks, events and
+awaited tasks are resources held by their owner, their setter or the
+awaited task itself.  Because the graph is assembled from scans taken at
+different times, a cycle is re-checked against the live tasks before it is
+reported, and kept as a suspect until it is confirmed or broken.
+
+    monitor = TaskMonitor(on_deadlock=print).start()
+"""
+
+import asyncio
+import itertools
+import sys
+import traceback
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from gui.stream import StreamingDetector
+
+_blocked: Dict[asyncio.Task, object] = {}  # Task -> primitive it is blocked on
+_keys = itertools.count(1)
+_ORIGINALS = {name: getattr(asyncio, name) for name in ("Lock", "Semaphore", "Event", "Condition")}
+
+
+def _key(name: Optional[str], kind: str) -> str:
+    return f"{name or kind}#{next(_keys)}"
+
+
+class Lock(asyncio.Lock):
+    """asyncio.Lock that knows its owner task"""
+
+    def __init__(self, name: Optional[str] = None):
+        super().__init__()
+        self.name = _key(name, "Lock")
+        self.owner: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> bool:
+        task = asyncio.current_task()
+        if self.locked():
+            _blocked[task] = self
+        try:
+            await super().acquire()
+        finally:
+            _blocked.pop(task, None)
+        self.owner = task
+        return True
+
+    def release(self):
+        self.owner = None
+        super().release()
+
+    def _holders(self) -> Dict[asyncio.Task, int]:
+        return {self.owner: 1} if self.owner is not None and self.locked() else {}
+
+
+class Semaphore(asyncio.Semaphore):
+    """
+    asyncio.Semaphore that knows which tasks hold its units.  A release by
+    a task that holds none is booked against the longest-standing holder.
+    """
+
+    def __init__(self, value: int = 1, name: Optional[str] = None):
+        super().__init__(value)
+        self.name = _key(name, "Semaphore")
+        self.instances = max(1, value)
+        self.holders: Dict[asyncio.Task, int] = {}
+
+    async def acquire(self) -> bool:
+        task = asyncio.current_task()
+        if self.locked():
+            _blocked[task] = self
+        try:
+            await super().acquire()
+        finally:
+            _blocked.pop(task, None)
+        self.holders[task] = self.holders.get(task, 0) + 1
+        return True
+
+    def release(self):
+        holders = self.holders
+        task = asyncio.current_task()
+        owner = task if task in holders else next(iter(holders), None)
+        if owner is not None:
+            if holders[owner] == 1:
+                del holders[owner]
+            else:
+                holders[owner] -= 1
+        super().release()
+
+    def _holders(self) -> Dict[asyncio.Task, int]:
+        return self.holders
+
+
+class Event(asyncio.Event):
+    """asyncio.Event whose waiters wait for the task expected to set it"""
+
+    def __init__(self, setter: Optional[asyncio.Task] = None, name: Optional[str] = None):
+        super().__init__()
+        self.name = _key(name, "Event")
+        self.setter = setter
+
+    async def wait(self) -> bool:
+        if self.is_set():
+            return True
+        task = asyncio.current_task()
+        _blocked[task] = self
+        try:
+            return await super().wait()
+        finally:
+            _blocked.pop(task, None)
+
+    def _holders(self) -> Dict[asyncio.Task, int]:
+        setter = self.setter
+        if setter is None or self.is_set() or setter.done():
+            return {}
+        return {setter: 1}
+
+
+class Condition(asyncio.Condition):
+    """asyncio.Condition over an instrumented Lock by default"""
+
+    def __init__(self, lock: Optional[asyncio.Lock] = None):
+        super().__init__(Lock() if lock is None else lock)
+
+
+class TaskDeadlock(NamedTuple):
+    cycle: List[Tuple[str, str]]  # (task, what it waits for) in wait order
+    stacks: Dict[str, str]        # Formatted await chain of each task on the cycle
+
+    def format(self) -> str:
+        lines = ["Deadlock: " + " -> ".join(f"{task} waits for {target}"
+                                            for task, target in self.cycle)]
+        for task, stack in self.stacks.items():
+            lines.append(f"\nTask {task}:\n{stack}")
+        return "\n".join(lines)
+
+
+def _print_deadlock(report: TaskDeadlock):
+    print(report.format(), file=sys.stderr, flush=True)
+
+
+def waits_of(task: asyncio.Task) -> Dict[object, Tuple[Dict[asyncio.Task, int], int]]:
+    """
+    What a task currently waits for: resource -> (holders with their
+    counts, capacity).  The resource is an instrumented primitive or, for
+    a task awaiting other tasks, each of those tasks.
+    """
+    primitive = _blocked.get(task)
+    if primitive is not None:
+        return {primitive: (primitive._holders(), getattr(primitive, "instances", 1))}
+    waiter = getattr(task, "_fut_waiter", None)
+    if isinstance(waiter, asyncio.Task):
+        awaited = [waiter]
+    else:
+        awaited = [child for child in getattr(waiter, "_children", ())
+                   if isinstance(child, asyncio.Task)]
+    return {other: ({other: 1}, 1) for other in awaited if not other.done()}
+
+
+def await_stack(task: asyncio.Task) -> str:
+    """The chain of coroutine frames a suspended task is awaiting through"""
+    frames = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    if not frames:
+        return "  (no stack)\n"
+    return "".join(traceback.format_list(traceback.StackSummary.extract(frames)))
+
+
+def _label(resource) -> str:
+    if isinstance(resource, asyncio.Task):
+        return f"task {resource.get_name()}"
+    return resource.name
+
+
+class TaskMonitor:
+    """Periodically rebuilds the task wait-for graph and reports deadlocks"""
+
+    def __init__(self, interval: float = 0.1, budget: int = 1000, slice_ms: float = 5.0,
+                 on_deadlock: Optional[Callable[[TaskDeadlock], None]] = None):
+        self.interval = interval
+        self.budget = max(1, budget)
+        self.slice = slice_ms / 1000.0
+        self.on_deadlock = on_deadlock or _print_deadlock
+        self.streaming = StreamingDetector()
+        self.waits: Dict[asyncio.Task, Dict[object, int]] = {}  # Task -> resource -> capacity
+        self.holds: Dict[object, Dict[asyncio.Task, int]] = {}  # As applied to the detector
+        self.waiters: Dict[object, set] = {}
+        self.suspects: List[List[Tuple[asyncio.Task, object]]] = []
+        self.reported: set = set()
+        self._sweep: List[asyncio.Task] = []
+        self._task: Optional[asyncio.Task] = None
+        # Statistics
+        self.ticks = 0
+        self.scanned = 0
+        self.deadlocks = 0
+        self.max_tick = 0.0
+
+    def start(self) -> 'TaskMonitor':
+        """Run on the current event loop until stop()"""
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="TaskMonitor")
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.tick()
+
+    def tick(self) -> List[TaskDeadlock]:
+        """Scan the next tasks within the budget and report confirmed deadlocks"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        self.ticks += 1
+        if not self._sweep:
+            # Start a new sweep, including finished tasks that still wait in the graph
+            live = asyncio.all_tasks(loop)
+            live.discard(self._task)
+            self.reported = {key for key in self.reported if key <= live}
+            self._sweep = list(live.union(self.waits))
+        deadline = started + self.slice
+        for _ in range(min(self.budget, len(self._sweep))):
+            if loop.time() > deadline:
+                break
+            task = self._sweep.pop()
+            self.scanned += 1
+            self._update(task, {} if task.done() else waits_of(task))
+
+        reports = []
+        suspects, self.suspects = self.suspects, []
+        for cycle in suspects:
+            state = self._check(cycle)
+            if state is True:
+                reports.append(self._report(cycle))
+            elif state is None:
+                self.suspects.append(cycle)
+        for report in reports:
+            self.deadlocks += 1
+            self.on_deadlock(report)
+        self.max_tick = max(self.max_tick, loop.time() - started)
+        return reports
+
+    def _update(self, task: asyncio.Task, waits: Dict[object, Tuple[Dict[asyncio.Task, int], int]]):
+        """Apply the difference between what task waited for and waits for now"""
+        apply = self.streaming.apply
+        old = self.waits.pop(task, {})
+        for resource in old:
+            if resource not in waits:
+                apply("cancel", task, resource)
+                waiters = self.waiters[resource]
+                waiters.discard(task)
+                if not waiters:
+                    del self.waiters[resource]
+                    self._set_holders(resource, {}, old[resource])
+        for resource, (holders, instances) in waits.items():
+            self._set_holders(resource, holders, instances)
+            if resource not in old:
+                self.waiters.setdefault(resource, set()).add(task)
+                self._suspect(apply("request", task, resource, 1, instances))
+        if waits:
+            self.waits[task] = {resource: instances for resource, (_, instances) in waits.items()}
+
+    def _set_holders(self, resource, holders: Dict[asyncio.Task, int], instances: int):
+        apply = self.streaming.apply
+        current = self.holds.get(resource, {})
+        for task, count in current.items():
+            if holders.get(task) != count:
+                apply("release", task, resource)
+        for task, count in holders.items():
+            if current.get(task) != count:
+                self._suspect(apply("acquire", task, resource, count, instances))
+        if holders:
+            self.holds[resource] = dict(holders)
+        else:
+            self.holds.pop(resource, None)
+
+    def _suspect(self, cycle):
+        if cycle:
+            steps = self.streaming.describe(cycle)
+            key = frozenset(task for task, _ in steps)
+            if key not in self.reported:
+                self.suspects.append(steps)
+
+    def _check(self, cycle: List[Tuple[asyncio.Task, object]]) -> Optional[bool]:
+        """
+        True if every wait on the cycle holds for the live tasks, False if
+        the detector no longer has the cycle, None while undecided
+        """
+        for task, resource in cycle:
+            if resource not in self.waits.get(task, ()):
+                return False
+        for i, (task, resource) in enumerate(cycle):
+            holder = cycle[(i + 1) % len(cycle)][0]
+            live = waits_of(task).get(resource)
+            if live is None or holder not in live[0]:
+                return None
+        self.reported.add(frozenset(task for task, _ in cycle))
+        return True
+
+    def _report(self, cycle: List[Tuple[asyncio.Task, object]]) -> TaskDeadlock:
+        steps, stacks = [], {}
+        for task, resource in cycle:
+            name = task.get_name()
+            steps.append((name, _label(resource)))
+            stacks[name] = await_stack(task)
+        return TaskDeadlock(steps, stacks)
+
+    def stats(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "scanned": self.scanned,
+            "waiting": len(self.waits),
+            "suspects": len(self.suspects),
+            "deadlocks": self.deadlocks,
+            "max_tick_ms": self.max_tick * 1000,
+        }
+
+
+def install():
+    """Replace the asyncio primitives with the instrumented ones"""
+    asyncio.Lock = Lock
+    asyncio.Semaphore = Semaphore
+    asyncio.Event = Event
+    asyncio.Condition = Condition
+
+
+def uninstall():
+    for name, original in _ORIGINALS.items():
+        setattr(asyncio, name, original)
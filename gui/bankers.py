@@ -0,0 +1,79 @@
+"""
+Banker's algorithm for deadlock avoidance.
+
+The safety check is vectorized the same way as the matrix detection in
+gui/matrix_detection.py: every round finishes all processes whose
+remaining need fits into the work vector.  check_requests() evaluates a
+whole batch of candidate requests in one call, one safety check per
+candidate run side by side as (batch, process) arrays.
+"""
+
+import numpy as np
+
+# Upper bound on the (batch, process, resource) comparison block
+BLOCK_ELEMENTS = 1 << 24
+
+
+def is_safe_state(available: np.ndarray, allocation: np.ndarray, need: np.ndarray) -> bool:
+    """Return True if every process can run to completion in some order"""
+    work = np.array(available, dtype=np.int64)
+    allocation = np.asarray(allocation)
+    need = np.asarray(need)
+    pending = np.arange(allocation.shape[0])
+    while pending.size:
+        ready = (need[pending] <= work).all(axis=1)
+        if not ready.any():
+            return False
+        work += allocation[pending[ready]].sum(axis=0)
+        pending = pending[~ready]
+    return True
+
+
+def check_requests(available: np.ndarray, allocation: np.ndarray, need: np.ndarray,
+                   processes: np.ndarray, requests: np.ndarray) -> np.ndarray:
+    """
+    Evaluate a batch of requests independently against the same state.
+    processes[b] is the row of the requesting process and requests[b] its
+    request vector.  Returns a boolean array, True where granting request
+    b alone would be valid (within need and available) and leave the
+    system in a safe state.
+    """
+    available = np.asarray(available, dtype=np.int64)
+    allocation = np.asarray(allocation, dtype=np.int64)
+    need = np.asarray(need, dtype=np.int64)
+    processes = np.asarray(processes, dtype=np.int64)
+    requests = np.asarray(requests, dtype=np.int64).reshape(len(processes), -1)
+
+    result = np.zeros(len(processes), dtype=bool)
+    valid = ((requests <= need[processes]) & (requests <= available)).all(axis=1)
+    candidates = np.flatnonzero(valid)
+    block = max(1, BLOCK_ELEMENTS // max(1, need.size))
+    for start in range(0, candidates.size, block):
+        batch = candidates[start:start + block]
+        result[batch] = _batch_safety(available, allocation, need,
+                                      processes[batch], requests[batch])
+    return result
+
+
+def _batch_safety(available: np.ndarray, allocation: np.ndarray, need: np.ndarray,
+                  processes: np.ndarray, requests: np.ndarray) -> np.ndarray:
+    """Safety check of each tentatively granted request, side by side"""
+    batch = np.arange(len(processes))
+    # The granted request only changes the requester's row
+    own_need = need[processes] - requests
+
+    work = available[None, :] - requests
+    finished = np.zeros((len(processes), need.shape[0]), dtype=bool)
+    while True:
+        fits = (need[None, :, :] <= work[:, None, :]).all(axis=2)
+        fits[batch, processes] = (own_need <= work).all(axis=1)
+        ready = fits & ~finished
+        if not ready.any():
+            break
+        finished |= ready
+        reclaimed = ready.astype(np.int64) @ allocation
+        # Correct the requester's row for the tentatively granted instances
+        own_ready = ready[batch, processes]
+        reclaimed[own_ready] += requests[own_ready]
+        work += reclaimed
+    return finished.all(axis=1)
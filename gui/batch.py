@@ -0,0 +1,213 @@
+"""
+Transactional batch mutations for DeadlockDetector.
+
+A batch of request/allocate/release/cancel operations is first replayed
+against a small overlay of the edge counts it touches, so that every
+operation is validated without modifying the detector.  Only the net
+change per (process, resource) pair is then written to the graph store,
+the wait-for edges of the touched resources are diffed once, and
+detection runs a single time over the region reachable from the wait-for
+edges the batch added.
+"""
+
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from gui.process import Process, Resource
+
+Operation = Tuple  # (kind, process, resource[, count])
+Pair = Tuple[int, int]
+
+KINDS = ("request", "allocate", "release", "cancel")
+
+
+class BatchError(ValueError):
+    """An operation of a batch is invalid; nothing was applied"""
+
+    def __init__(self, index: Optional[int], operation: Optional[Operation], reason: str):
+        where = "batch" if index is None else f"operation {index} {operation!r}"
+        super().__init__(f"{where}: {reason}")
+        self.index = index
+        self.operation = operation
+        self.reason = reason
+
+
+class Batch:
+    """Buffered operations applied as one transaction by a DeadlockDetector"""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.operations: List[Operation] = []
+        self.deadlocks = []
+
+    def request(self, process, resource, count: int = 1):
+        self.operations.append(("request", process, resource, count))
+
+    def allocate(self, resource, process, count: int = 1):
+        self.operations.append(("allocate", process, resource, count))
+
+    def release(self, process, resource, count: Optional[int] = None):
+        self.operations.append(("release", process, resource, count))
+
+    def cancel(self, process, resource):
+        self.operations.append(("cancel", process, resource, None))
+
+    def __len__(self) -> int:
+        return len(self.operations)
+
+    def __enter__(self) -> 'Batch':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.deadlocks = self.detector.apply_batch(self.operations)
+
+
+class _Overlay:
+    """Edge counts as they would be after the operations replayed so far"""
+
+    def __init__(self, store):
+        self.store = store
+        self.requests: Dict[Pair, int] = {}
+        self.holds: Dict[Pair, int] = {}
+        self.held: Dict[int, int] = {}
+
+    def request(self, pid: int, rid: int) -> int:
+        pair = (pid, rid)
+        if pair in self.requests:
+            return self.requests[pair]
+        return self.store.requests.get(pid, rid)
+
+    def holding(self, pid: int, rid: int) -> int:
+        pair = (pid, rid)
+        if pair in self.holds:
+            return self.holds[pair]
+        return self.store.holds.get(pid, rid)
+
+    def available(self, rid: int) -> int:
+        return self.store.instances[rid] - self.held.get(rid, self.store.held[rid])
+
+    def set_holding(self, pid: int, rid: int, count: int):
+        self.held[rid] = self.held.get(rid, self.store.held[rid]) + count - self.holding(pid, rid)
+        self.holds[(pid, rid)] = count
+
+    def replay(self, index: int, operation: Operation):
+        """Apply one operation to the overlay, raising BatchError if invalid"""
+        kind, process, resource = operation[:3]
+        count = operation[3] if len(operation) > 3 else None
+        pid, rid = process.id, resource.id
+        if kind == "request":
+            count = 1 if count is None else count
+            pending = self.request(pid, rid) + count
+            if count <= 0 or self.holding(pid, rid) + pending > self.store.instances[rid]:
+                raise BatchError(index, operation, "request exceeds the resource's instances")
+            self.requests[(pid, rid)] = pending
+        elif kind == "allocate":
+            count = 1 if count is None else count
+            if count <= 0 or self.available(rid) < count:
+                raise BatchError(index, operation, "not enough free instances")
+            self.requests[(pid, rid)] = max(0, self.request(pid, rid) - count)
+            self.set_holding(pid, rid, self.holding(pid, rid) + count)
+        elif kind == "release":
+            held = self.holding(pid, rid)
+            if not held:
+                raise BatchError(index, operation, "resource is not held by the process")
+            remaining = held - max(count, 0) if count is not None and count < held else 0
+            self.set_holding(pid, rid, remaining)
+        elif kind == "cancel":
+            if not self.request(pid, rid):
+                raise BatchError(index, operation, "no pending request to cancel")
+            self.requests[(pid, rid)] = 0
+        else:
+            raise BatchError(index, operation, f"unknown operation, expected one of {KINDS}")
+
+
+def _wait_edges(store, resources: Iterable[int]) -> Counter:
+    """Wait-for edges (waiter, holder) induced by the given resources"""
+    edges: Counter = Counter()
+    for rid in resources:
+        holders = store.holds.into(rid)
+        if not holders:
+            continue
+        for waiter in store.requests.into(rid):
+            for holder in holders:
+                if waiter != holder:
+                    edges[(waiter, holder)] += 1
+    return edges
+
+
+def _write(store, requests: Dict[Pair, int], holds: Dict[Pair, int]):
+    for (pid, rid), count in requests.items():
+        store.requests.set(pid, rid, count)
+    for (pid, rid), count in holds.items():
+        store.set_holding(pid, rid, count)
+
+
+def _update_wait_for(wait_for, removed: Counter, added: Counter):
+    for (waiter, holder), count in removed.items():
+        for _ in range(count):
+            wait_for.remove_edge(waiter, holder)
+    for (waiter, holder), count in added.items():
+        for _ in range(count):
+            wait_for.add_edge(waiter, holder)
+
+
+def _update_components(detector, requests: Dict[Pair, int], holds: Dict[Pair, int]):
+    components = detector.components
+    for changes in (requests, holds):
+        for (pid, rid), count in changes.items():
+            uid = detector.process_views[pid].uid
+            if count:
+                components.link(uid, detector.resource_views[rid].uid)
+            else:
+                components.unlink(uid)
+
+
+def apply_operations(detector, operations: Iterable[Operation]) -> list:
+    """Validate, apply and run detection for a batch; see DeadlockDetector.apply_batch"""
+    store = detector.store
+    overlay = _Overlay(store)
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, tuple) or not 3 <= len(operation) <= 4:
+            raise BatchError(index, operation, "expected (kind, process, resource[, count])")
+        process, resource = operation[1], operation[2]
+        if not isinstance(process, Process) or not isinstance(resource, Resource):
+            raise BatchError(index, operation, "operands must be a Process and a Resource")
+        count = operation[3] if len(operation) > 3 else None
+        if count is not None and not isinstance(count, int):
+            raise BatchError(index, operation, "count must be an integer")
+        if not detector._is_live(process, resource):
+            raise BatchError(index, operation, "process or resource is not part of this detector")
+        overlay.replay(index, operation)
+
+    # Keep only net changes, remembering the previous counts for rollback
+    requests = {pair: c for pair, c in overlay.requests.items() if c != store.requests.get(*pair)}
+    holds = {pair: c for pair, c in overlay.holds.items() if c != store.holds.get(*pair)}
+    if not requests and not holds:
+        return []
+    previous_requests = {pair: store.requests.get(*pair) for pair in requests}
+    previous_holds = {pair: store.holds.get(*pair) for pair in holds}
+
+    touched = {rid for _, rid in requests} | {rid for _, rid in holds}
+    before = _wait_edges(store, touched)
+    _write(store, requests, holds)
+    after = _wait_edges(store, touched)
+    removed, added = before - after, after - before
+
+    if detector.avoidance and holds and not detector.is_safe_state():
+        _write(store, previous_requests, previous_holds)
+        raise BatchError(None, None, "resulting state is unsafe")
+
+    if detector.incremental:
+        _update_wait_for(detector.wait_for, removed, added)
+    if detector.components is not None:
+        _update_components(detector, requests, holds)
+
+    # Every new cycle goes through an added edge, so it is reachable from
+    # the holders those edges point at
+    if not added:
+        return []
+    deadlocks = detector.find_deadlocks_from(holder for _, holder in added)
+    return [d for d in deadlocks
+            if any(detector.process_views[w] in d.processes and detector.process_views[h] in d.processes
+                   for w, h in added)]
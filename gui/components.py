@@ -0,0 +1,179 @@
+"""
+Weakly connected components of the resource allocation graph.
+
+Wait-for cycles never leave a weakly connected component, and production
+graphs are mostly many small, disconnected islands.  ComponentIndex keeps
+a union-find over process and resource uids that is updated as edges are
+added, remembers which components changed since the last check and caches
+the deadlocks of the others.  Removing an edge cannot split a union-find
+set, so after many removals the index is rebuilt from the graph store;
+until then a set may cover several real components, which only makes a
+check slightly larger, never wrong.
+
+find_deadlocks() re-checks the changed components only.  Small ones are
+searched together in-process; large ones are shipped as CSR arrays to a
+concurrent.futures executor (normally a ProcessPoolExecutor), one task
+per component, so detection spreads across cores.
+"""
+
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from gui.scc import cyclic_components, witness_cycle
+
+
+def _process_key(uid: int) -> int:
+    return uid << 1
+
+
+def _resource_key(uid: int) -> int:
+    return (uid << 1) | 1
+
+
+def component_cycles(num_nodes: int, indptr: np.ndarray,
+                     indices: np.ndarray) -> List[Tuple[List[int], List[int]]]:
+    """
+    (component, witness edge positions) for every cyclic strongly connected
+    component of a CSR graph; module-level so that it can run in a worker.
+    """
+    indptr, indices = indptr.tolist(), indices.tolist()
+    return [(component, witness_cycle(component, indptr, indices))
+            for component in cyclic_components(num_nodes, indptr, indices)]
+
+
+class ComponentIndex:
+    """Union-find of processes and resources joined by request/hold edges"""
+
+    def __init__(self, detector, rebuild_after: int = 4096):
+        self.detector = detector
+        self.parent: Dict[int, int] = {}
+        self.members: Dict[int, List[int]] = {}  # Root -> keys, merged small into large
+        self.dirty: Set[int] = set()             # Roots changed since the last check
+        self.cache: Dict[int, list] = {}         # Root -> deadlocks at the last check
+        self.removed = 0                         # Edge and node removals since the rebuild
+        self.rebuild_after = rebuild_after
+        self.rebuild()
+
+    def find(self, key: int) -> int:
+        parent = self.parent
+        root = key
+        while parent[root] != root:
+            root = parent[root]
+        while parent[key] != root:  # Path compression
+            parent[key], key = root, parent[key]
+        return root
+
+    def _add(self, key: int) -> int:
+        if key not in self.parent:
+            self.parent[key] = key
+            self.members[key] = [key]
+            return key
+        return self.find(key)
+
+    def _touch(self, root: int):
+        self.dirty.add(root)
+        self.cache.pop(root, None)
+
+    def link(self, process_uid: int, resource_uid: int):
+        """An edge between a process and a resource was added"""
+        a = self._add(_process_key(process_uid))
+        b = self._add(_resource_key(resource_uid))
+        if a != b:
+            if len(self.members[a]) < len(self.members[b]):
+                a, b = b, a
+            self.parent[b] = a
+            self.members[a].extend(self.members.pop(b))
+            self.dirty.discard(b)
+            self.cache.pop(b, None)
+        self._touch(a)
+
+    def unlink(self, process_uid: int):
+        """An edge of the process was removed; its component may have shrunk"""
+        key = _process_key(process_uid)
+        if key in self.parent:
+            self._touch(self.find(key))
+            self.removed += 1
+
+    def rebuild(self):
+        """Recompute the sets from the live edges of the graph store"""
+        self.parent.clear()
+        self.members.clear()
+        self.dirty.clear()
+        self.cache.clear()
+        self.removed = 0
+        detector = self.detector
+        store = detector.store
+        for relation in (store.requests, store.holds):
+            src, dst, _ = relation.coo()
+            for pid, rid in zip(src.tolist(), dst.tolist()):
+                self.link(detector.process_views[pid].uid, detector.resource_views[rid].uid)
+
+    def find_deadlocks(self, executor: Optional[Executor] = None,
+                       parallel_size: int = 20_000) -> list:
+        """
+        Deadlocks of the whole graph, re-checking only changed components.
+        Components with at least parallel_size processes run on the
+        executor when one is given.
+        """
+        if self.removed > max(self.rebuild_after, len(self.parent) >> 1):
+            self.rebuild()
+        detector = self.detector
+        processes = detector.processes
+        small: List[Tuple[int, List[int]]] = []
+        large: Dict[int, List[int]] = {}
+        for root in self.dirty:
+            slots = [processes[key >> 1].id for key in self.members[root]
+                     if not key & 1 and (key >> 1) in processes]
+            if executor is not None and len(slots) >= max(parallel_size, 2):
+                large[root] = slots
+            else:
+                small.append((root, slots))
+        self.dirty.clear()
+
+        if small:
+            owner = {}
+            for root, slots in small:
+                self.cache[root] = []
+                for pid in slots:
+                    owner[pid] = root
+            for deadlock in detector.find_deadlocks_from(owner):
+                self.cache[owner[next(iter(deadlock.processes)).id]].append(deadlock)
+        if large:
+            self._run_parallel(executor, large)
+
+        return [deadlock for found in self.cache.values() for deadlock in found]
+
+    def _run_parallel(self, executor: Executor, large: Dict[int, List[int]]):
+        """Extract each large component's CSR graph and detect in the executor"""
+        detector = self.detector
+        waiter, holder, via = detector.store.wait_for_edges()
+        labels = np.full(detector.store.num_processes, -1, dtype=np.int64)
+        roots = list(large)
+        for label, root in enumerate(roots):
+            labels[large[root]] = label
+        edge_labels = labels[waiter]
+        order = np.argsort(edge_labels, kind="stable")  # Keeps edges sorted by waiter
+        bounds = np.searchsorted(edge_labels[order], np.arange(len(roots) + 1))
+
+        futures = []
+        for label, root in enumerate(roots):
+            edges = order[bounds[label]:bounds[label + 1]]
+            nodes = np.asarray(sorted(large[root]), dtype=np.int64)
+            local_waiter = np.searchsorted(nodes, waiter[edges])
+            local_holder = np.searchsorted(nodes, holder[edges]).astype(np.int32)
+            indptr = np.concatenate([[0], np.cumsum(np.bincount(local_waiter, minlength=len(nodes)))])
+            future = executor.submit(component_cycles, len(nodes), indptr, local_holder)
+            futures.append((root, nodes.tolist(), indptr, via[edges].tolist(), future))
+
+        for root, nodes, indptr, edge_via, future in futures:
+            self.cache[root] = detector._collect_deadlocks(nodes, indptr.tolist(), None, edge_via,
+                                                           found=future.result())
+
+    def clear(self):
+        self.parent.clear()
+        self.members.clear()
+        self.dirty.clear()
+        self.cache.clear()
+        self.removed = 0
@@ -0,0 +1,434 @@
+"""
+Hierarchical, coordinator-based global deadlock detection.
+
+Resources are partitioned across sites by the same hash as gui.distributed.
+Each site is an OS process that runs a StreamingDetector over its own
+resources and reports cycles among them itself.  For everything else, a
+site ships a condensed summary of its wait-for graph to one coordinator
+process, which merges the summaries and detects the global cycles.
+
+A process is a boundary process when it has edges at two or more sites.
+The coordinator learns this from presence notices, sent only when a
+process appears at or vanishes from a site, and tells the sites involved.
+A site's summary keeps only edges between boundary processes.  Each edge
+X -> Y stands for a local wait path from X to Y through internal processes,
+and every cycle that crosses sites is a cycle of such edges.  Summaries are
+delta encoded: after each batch of events a site sends only the edges added
+to or removed from its summary, with boundary names interned per site on
+first use.  Bandwidth therefore follows the rate of change, not the graph
+size.  So does the site's own work: it remembers which processes each
+boundary process's paths went through, and re-condenses only from the
+boundary processes whose region a batch changed.  The coordinator keeps
+the merged edges in an IncrementalCycleDetector, so each added edge is
+checked against the order it already maintains.
+
+Summaries from different sites are not a consistent snapshot, so the
+merged graph can close cycles whose edges never existed together.
+Before a merged cycle is reported, each site owning one of its resources
+re-checks its edges in turn, as gui.distributed does for returned probes.
+"""
+
+import itertools
+import multiprocessing
+import pickle
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from gui.distributed import ShardedReport, ShardedResult, Step, shard_of
+from gui.incremental import IncrementalCycleDetector
+from gui.stream import Event, StreamingDetector
+
+Edge = Tuple[str, str]
+
+
+class Site:
+    """One detection site; run() is the body of its OS process"""
+
+    def __init__(self, index: int, inbox, coordinator, results):
+        self.index = index
+        self.inbox = inbox
+        self.coordinator = coordinator
+        self.results = results
+        self.streaming = StreamingDetector()
+        self.present: Set[str] = set()
+        self.boundary: Set[str] = set()
+        self.summary: Dict[Edge, List[Step]] = {}
+        self.condensed: Dict[str, Dict[Edge, List[Step]]] = {}  # Summary edges by source
+        self.regions: Dict[str, Set[str]] = {}  # Processes each source's paths went through
+        self.readers: Dict[str, Set[str]] = {}  # Process -> sources whose region has it
+        self.ids: Dict[str, int] = {}  # Boundary names already sent to the coordinator
+        self.sent: Counter = Counter()
+        self.received = 0
+        self.bytes = 0
+
+    def run(self):
+        while True:
+            message = self.inbox.get()
+            kind = message[0]
+            if kind == "stop":
+                self.results.put(("stats", self.index, dict(self.sent), self.bytes))
+                return
+            if kind == "count":
+                self.results.put(("count", self.index, sum(self.sent.values()), self.received))
+                continue
+            if kind == "events":
+                self._on_events(message[1])
+            elif kind == "boundary":
+                self.received += 1
+                self.boundary |= set(message[1])
+                self.boundary -= set(message[2])
+                self._publish(message[3], message[1] + message[2])
+            elif kind == "confirm":
+                self.received += 1
+                self._on_confirm(*message[1:])
+
+    def _send(self, message: tuple):
+        self.sent[message[0]] += 1
+        self.bytes += len(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+        self.coordinator.put(message)
+
+    def _on_events(self, events: List[tuple]):
+        streaming = self.streaming
+        touched, resources = set(), set()
+        latest = 0.0
+        for dispatched, op, process, resource, count, instances in events:
+            cycle = streaming.apply(op, process, resource, count, instances)
+            if cycle:
+                self.results.put(("deadlock", self.index, streaming.describe(cycle),
+                                  time.monotonic() - dispatched, False))
+            touched.add(process)
+            resources.add(resource)
+            latest = max(latest, dispatched)
+
+        # Wait-for edges changed out of the touched processes and out of
+        # every process still requesting a touched resource
+        detector = streaming.detector
+        changed = set(touched)
+        for resource in resources:
+            lock = streaming.resources.get(resource)
+            if lock is not None:
+                changed.update(streaming.names[("P", detector.process_views[pid].uid)]
+                               for pid in detector.store.requests.into(lock.id))
+
+        # Presence: a process is at this site while it holds or waits for
+        # one of its resources (idle ones are evicted by the streaming detector)
+        appeared = [p for p in touched if p in streaming.processes and p not in self.present]
+        vanished = [p for p in touched if p not in streaming.processes and p in self.present]
+        self._publish(latest, changed)
+        if appeared or vanished:
+            self.present.update(appeared)
+            self.present.difference_update(vanished)
+            self._send(("presence", self.index, appeared, vanished, latest))
+
+    def _on_confirm(self, confirmation: int, cycle: List[Step], positions: List[int]):
+        """Re-check the cycle's edges through our resources for the coordinator"""
+        streaming = self.streaming
+        store = streaming.detector.store
+        confirmed = True
+        for position in positions:
+            waiter = streaming.processes.get(cycle[position][0])
+            holder = streaming.processes.get(cycle[(position + 1) % len(cycle)][0])
+            lock = streaming.resources.get(cycle[position][1])
+            if (waiter is None or holder is None or lock is None
+                    or not store.requests.get(waiter.id, lock.id)
+                    or not store.holds.get(holder.id, lock.id)):
+                confirmed = False
+                break
+        self._send(("confirmed", confirmation, confirmed))
+
+    def _condense(self, source: str) -> Tuple[Dict[Edge, List[Step]], Set[str]]:
+        """
+        Wait paths from a boundary process through internal processes to
+        other boundary processes, and the processes they went through
+        """
+        streaming = self.streaming
+        detector = streaming.detector
+        names = streaming.names
+        store = detector.store
+        summary: Dict[Edge, List[Step]] = {}
+        region = {source}
+        view = streaming.processes.get(source)
+        if view is None:
+            return summary, region
+        paths = {view.id: []}
+        frontier = [view.id]
+        while frontier:
+            pid = frontier.pop()
+            name = names[("P", detector.process_views[pid].uid)]
+            for holder, rid in store.wait_successors(pid):
+                if holder in paths:
+                    continue
+                path = paths[pid] + [(name, names[("R", detector.resource_views[rid].uid)])]
+                target = names[("P", detector.process_views[holder].uid)]
+                region.add(target)
+                if target in self.boundary:
+                    if target != source:
+                        summary.setdefault((source, target), path)
+                else:
+                    paths[holder] = path
+                    frontier.append(holder)
+        return summary, region
+
+    def _publish(self, dispatched: float, changed: Iterable[str]):
+        """
+        Re-condense from the boundary processes whose region holds a
+        changed process and send the changes of the summary
+        """
+        stale = set()
+        for name in changed:
+            stale.update(self.readers.get(name, ()))
+            if name in self.boundary:
+                stale.add(name)
+        added, removed = [], []
+        for source in stale:
+            for name in self.regions.pop(source, ()):
+                readers = self.readers[name]
+                readers.discard(source)
+                if not readers:
+                    del self.readers[name]
+            old = self.condensed.pop(source, {})
+            new: Dict[Edge, List[Step]] = {}
+            if source in self.boundary:
+                new, region = self._condense(source)
+                self.regions[source] = region
+                for name in region:
+                    self.readers.setdefault(name, set()).add(source)
+                if new:
+                    self.condensed[source] = new
+            for edge, path in new.items():
+                if edge not in old:
+                    added.append(edge)
+                self.summary[edge] = path
+            for edge in old:
+                if edge not in new:
+                    removed.append(edge)
+                    del self.summary[edge]
+        if not added and not removed:
+            return
+        new_names = []
+        for edge in added:
+            for name in edge:
+                if name not in self.ids:
+                    self.ids[name] = len(self.ids)
+                    new_names.append(name)
+        ids = self.ids
+        summary = self.summary
+        self._send(("summary", self.index, new_names,
+                    [(ids[x], ids[y], summary[(x, y)]) for x, y in added],
+                    [(ids[x], ids[y]) for x, y in removed], dispatched))
+
+
+class Coordinator:
+    """Merges site summaries and detects the cycles that cross sites"""
+
+    def __init__(self, inbox, sites: list, results):
+        self.inbox = inbox
+        self.sites = sites
+        self.results = results
+        self.names: List[List[str]] = [[] for _ in sites]  # Per-site interned names
+        self.located: Dict[str, Set[int]] = {}             # Process -> sites it is at
+        self.paths: Dict[Tuple[str, str], Dict[int, List[Step]]] = {}
+        self.wait_for = IncrementalCycleDetector()
+        # Merged cycles awaiting their sites: (cycle, positions by site, dispatched)
+        self.confirming: Dict[int, Tuple[List[Step], List[Tuple[int, List[int]]], float]] = {}
+        self.confirmations = itertools.count()
+        self.received = Counter()
+        self.sent = 0
+
+    def run(self):
+        while True:
+            message = self.inbox.get()
+            kind = message[0]
+            if kind == "stop":
+                self.results.put(("stats", "coordinator", {"boundary": self.sent}, 0))
+                return
+            if kind == "count":
+                self.results.put(("count", "coordinator", self.sent, sum(self.received.values())))
+                continue
+            self.received[kind] += 1
+            if kind == "presence":
+                self._on_presence(*message[1:])
+            elif kind == "confirmed":
+                self._on_confirmed(*message[1:])
+            else:
+                self._on_summary(*message[1:])
+
+    def _on_presence(self, site: int, appeared: List[str], vanished: List[str], dispatched: float):
+        notices: Dict[int, Tuple[list, list]] = {}
+        for name in appeared:
+            sites = self.located.setdefault(name, set())
+            sites.add(site)
+            if len(sites) == 2:
+                for other in sites:
+                    notices.setdefault(other, ([], []))[0].append(name)
+            elif len(sites) > 2:
+                notices.setdefault(site, ([], []))[0].append(name)
+        for name in vanished:
+            sites = self.located.get(name)
+            if sites is None:
+                continue
+            sites.discard(site)
+            if len(sites) == 1:
+                notices.setdefault(next(iter(sites)), ([], []))[1].append(name)
+            elif not sites:
+                del self.located[name]
+                self.wait_for.remove_node(name)
+        for other, (added, removed) in notices.items():
+            self.sent += 1
+            self.sites[other].put(("boundary", added, removed, dispatched))
+
+    def _on_summary(self, site: int, new_names: List[str], added: list, removed: list,
+                    dispatched: float):
+        names = self.names[site]
+        names.extend(new_names)
+        for x, y in removed:
+            edge = (names[x], names[y])
+            by_site = self.paths.get(edge)
+            if by_site is not None and by_site.pop(site, None) is not None:
+                self.wait_for.remove_edge(*edge)
+                if not by_site:
+                    del self.paths[edge]
+        for x, y, path in added:
+            edge = (names[x], names[y])
+            self.paths.setdefault(edge, {})[site] = path
+            cycle = self.wait_for.add_edge(*edge)
+            if cycle:
+                self._confirm(self._expand(cycle), dispatched)
+
+    def _confirm(self, cycle: List[Step], dispatched: float):
+        """Ask every site owning a resource of the cycle to re-check its edges"""
+        positions: Dict[int, List[int]] = {}
+        for position, (_, resource) in enumerate(cycle):
+            positions.setdefault(shard_of(resource, len(self.sites)), []).append(position)
+        confirmation = next(self.confirmations)
+        self.confirming[confirmation] = (cycle, list(positions.items()), dispatched)
+        self._on_confirmed(confirmation, True)
+
+    def _on_confirmed(self, confirmation: int, confirmed: bool):
+        """Ask the next site, or report once every site confirmed"""
+        cycle, sites, dispatched = self.confirming[confirmation]
+        if not confirmed:
+            del self.confirming[confirmation]
+        elif sites:
+            site, positions = sites.pop()
+            self.sent += 1
+            self.sites[site].put(("confirm", confirmation, cycle, positions))
+        else:
+            del self.confirming[confirmation]
+            self.results.put(("deadlock", "coordinator", cycle,
+                              time.monotonic() - dispatched, True))
+
+    def _expand(self, cycle: List[str]) -> List[Step]:
+        """Full (process, resource) cycle from the boundary processes on it"""
+        steps = []
+        for i, source in enumerate(cycle):
+            by_site = self.paths[(source, cycle[(i + 1) % len(cycle)])]
+            steps.extend(next(iter(by_site.values())))
+        return steps
+
+
+def _site_main(index: int, inbox, coordinator, results):
+    Site(index, inbox, coordinator, results).run()
+
+
+def _coordinator_main(inbox, sites: list, results):
+    Coordinator(inbox, sites, results).run()
+
+
+def run_hierarchical(events: Iterable[Event], sites: int, chunk: int = 64,
+                     rate: Optional[float] = None) -> ShardedResult:
+    """
+    Replay a trace through `sites` site processes and one coordinator
+    process; see gui.distributed.run_sharded for chunk and rate.  The
+    message counts include, per kind, the bytes sites sent upstream
+    ("bytes").
+    """
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(sites)]
+    upstream = context.Queue()
+    results = context.Queue()
+    workers = [context.Process(target=_site_main, args=(i, inboxes[i], upstream, results),
+                               daemon=True) for i in range(sites)]
+    workers.append(context.Process(target=_coordinator_main, args=(upstream, inboxes, results),
+                                   daemon=True))
+    for worker in workers:
+        worker.start()
+
+    reports: list = []
+    stats: Dict[object, tuple] = {}
+    started = time.monotonic()
+    try:
+        buffers: List[list] = [[] for _ in range(sites)]
+
+        def flush():
+            for site, buffer in enumerate(buffers):
+                if buffer:
+                    inboxes[site].put(("events", buffer))
+                    buffers[site] = []
+
+        for sent, event in enumerate(events):
+            if rate and sent and sent % chunk == 0:
+                flush()
+                delay = started + sent / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            site = shard_of(event.resource, sites)
+            buffers[site].append((time.monotonic(), event.op, event.process, event.resource,
+                                  event.count, event.instances))
+            if len(buffers[site]) >= chunk:
+                inboxes[site].put(("events", buffers[site]))
+                buffers[site] = []
+        flush()
+
+        # Quiescent once two consecutive rounds see every message received:
+        # sites send upstream, the coordinator sends boundary notices down
+        previous = None
+        while True:
+            for inbox in inboxes + [upstream]:
+                inbox.put(("count",))
+            counts = _collect(results, reports, stats, sites + 1, "count")
+            downward, upward_received = counts.pop("coordinator")
+            upward = sum(sent for sent, _ in counts.values())
+            downward_received = sum(received for _, received in counts.values())
+            state = (upward, downward)
+            if upward == upward_received and downward == downward_received and previous == state:
+                break
+            previous = state
+        elapsed = time.monotonic() - started
+
+        for inbox in inboxes + [upstream]:
+            inbox.put(("stop",))
+        _collect(results, reports, stats, sites + 1, "stats")
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+    messages: Counter = Counter()
+    for key, (sent, size) in stats.items():
+        messages.update(sent)
+        messages["bytes"] += size
+    deadlocks, seen = [], set()
+    for _, source, cycle, latency, merged in reports:
+        key = frozenset(process for process, _ in cycle)
+        if key not in seen:
+            seen.add(key)
+            deadlocks.append(ShardedReport(-1 if merged else source, cycle, latency, merged))
+    return ShardedResult(deadlocks, len(reports) - len(deadlocks), messages, elapsed)
+
+
+def _collect(results, reports: list, stats: dict, wanted: int, kind: str,
+             timeout: float = 60.0) -> dict:
+    """Read result messages until `wanted` replies of the given kind arrived"""
+    replies = {}
+    while len(replies) < wanted:
+        message = results.get(timeout=timeout)
+        if message[0] == "deadlock":
+            reports.append(message)
+        elif message[0] == kind:
+            replies[message[1]] = message[2:]
+            if kind == "stats":
+                stats[message[1]] = message[2:]
+    return replies
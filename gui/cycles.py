@@ -0,0 +1,173 @@
+"""
+Bounded enumeration of the elementary cycles of an integer graph.
+
+A dense graph has exponentially many elementary cycles, so listing them
+all cannot be the way to show a deadlock.  CycleSearch is a generator:
+cycles are yielded as they are found, and the search stops after
+`max_cycles` cycles or once `time_budget` seconds have passed, even in
+the middle of a fruitless search.  Only the cyclic strongly connected
+components are searched, and they are available as a summary before the
+first cycle.
+
+Without a length bound this is Johnson's algorithm, iterative, so the
+work between two consecutive cycles is O(V + E).  With `max_length` it
+is a depth-limited search from each node of a component over the nodes
+after it (Johnson's blocking does not hold once paths are cut short).
+The graph is in the compressed sparse row form of gui.scc.
+"""
+
+import time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from gui.scc import cyclic_components, strongly_connected_components
+
+CHECK_EVERY = 1024  # Search steps between two looks at the clock
+
+
+class CycleSearch:
+    """Iterable over the elementary cycles of a graph, within the given bounds"""
+
+    def __init__(self, num_nodes: int, indptr: Sequence[int], indices: Sequence[int],
+                 min_length: int = 1, max_length: Optional[int] = None,
+                 max_cycles: Optional[int] = None, time_budget: Optional[float] = None):
+        self.indptr = indptr
+        self.indices = indices
+        self.min_length = max(1, min_length)
+        self.max_length = max_length
+        self.max_cycles = max_cycles
+        self.time_budget = time_budget
+        # Cyclic components, largest first
+        self.components: List[List[int]] = sorted(
+            cyclic_components(num_nodes, indptr, indices), key=len, reverse=True)
+        self.found = 0
+        self.truncated: Optional[str] = None  # "max_cycles" or "time_budget" if cut short
+        self.elapsed = 0.0
+        self._deadline: Optional[float] = None
+        self._steps = 0
+
+    def __iter__(self) -> Iterator[List[int]]:
+        started = time.perf_counter()
+        if self.time_budget is not None:
+            self._deadline = started + self.time_budget
+        search = self._johnson if self.max_length is None else self._bounded
+        try:
+            for component in self.components:
+                for cycle in search(component):
+                    if len(cycle) < self.min_length:
+                        continue
+                    if self.max_cycles is not None and self.found >= self.max_cycles:
+                        self.truncated = "max_cycles"
+                        return
+                    self.found += 1
+                    yield cycle
+                if self.truncated:
+                    return
+        finally:
+            self.elapsed = time.perf_counter() - started
+
+    def _out_of_time(self) -> bool:
+        self._steps += 1
+        if self._deadline is None or self._steps % CHECK_EVERY:
+            return False
+        if time.perf_counter() > self._deadline:
+            self.truncated = "time_budget"
+            return True
+        return False
+
+    def _subgraph(self, nodes: Sequence[int]) -> Dict[int, List[int]]:
+        """Successor lists restricted to nodes, self-loops left out"""
+        members = set(nodes)
+        indptr, indices = self.indptr, self.indices
+        return {node: [t for t in indices[indptr[node]:indptr[node + 1]] if t in members and t != node]
+                for node in nodes}
+
+    def _self_loops(self, component: List[int]) -> Iterator[List[int]]:
+        indptr, indices = self.indptr, self.indices
+        for node in component:
+            if node in indices[indptr[node]:indptr[node + 1]]:
+                yield [node]
+
+    def _johnson(self, component: List[int]) -> Iterator[List[int]]:
+        yield from self._self_loops(component)
+        graph = self._subgraph(component)
+        pending = [component] if len(component) > 1 else []
+        while pending:
+            nodes = pending.pop()
+            start = nodes[0]
+            path = [start]
+            blocked = {start}
+            closed = set()
+            blocking: Dict[int, set] = {}
+            stack = [(start, list(graph[start]))]
+            while stack:
+                if self._out_of_time():
+                    return
+                node, successors = stack[-1]
+                if successors:
+                    successor = successors.pop()
+                    if successor == start:
+                        yield list(path)
+                        closed.update(path)
+                    elif successor not in blocked:
+                        path.append(successor)
+                        stack.append((successor, list(graph[successor])))
+                        closed.discard(successor)
+                        blocked.add(successor)
+                        continue
+                if not successors:
+                    if node in closed:
+                        # Unblock node and everything blocked waiting on it
+                        unblock = [node]
+                        while unblock:
+                            other = unblock.pop()
+                            if other in blocked:
+                                blocked.remove(other)
+                                unblock.extend(blocking.pop(other, ()))
+                    else:
+                        for successor in graph[node]:
+                            blocking.setdefault(successor, set()).add(node)
+                    stack.pop()
+                    path.pop()
+            # Every cycle through start is out; split the rest of the component
+            for successors in graph.values():
+                if start in successors:
+                    successors.remove(start)
+            del graph[start]
+            pending.extend(self._split(nodes[1:], graph))
+
+    @staticmethod
+    def _split(nodes: List[int], graph: Dict[int, List[int]]) -> List[List[int]]:
+        """Strongly connected components of graph[nodes] with more than one node"""
+        local = {node: i for i, node in enumerate(nodes)}
+        indptr, indices = [0], []
+        for node in nodes:
+            indices.extend(local[t] for t in graph[node] if t in local)
+            indptr.append(len(indices))
+        return [sorted((nodes[i] for i in part), key=local.__getitem__)
+                for part in strongly_connected_components(len(nodes), indptr, indices)
+                if len(part) > 1]
+
+    def _bounded(self, component: List[int]) -> Iterator[List[int]]:
+        yield from self._self_loops(component)
+        graph = self._subgraph(component)
+        rank = {node: i for i, node in enumerate(component)}
+        limit = self.max_length
+        for start in component:
+            first = rank[start]
+            path = [start]
+            on_path = {start}
+            iterators = [iter(graph[start])]
+            while iterators:
+                if self._out_of_time():
+                    return
+                for target in iterators[-1]:
+                    if target == start:
+                        yield list(path)
+                    elif rank[target] > first and target not in on_path and len(path) < limit:
+                        path.append(target)
+                        on_path.add(target)
+                        iterators.append(iter(graph[target]))
+                        break
+                else:
+                    iterators.pop()
+                    on_path.discard(path.pop())
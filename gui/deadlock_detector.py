@@ -1,136 +1,479 @@
-from typing import Dict, List, Set, Tuple, Optional
-from gui.process import Process, Resource
+from array import array
+from concurrent.futures import Executor
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from gui.process import Appearance, Process, Resource
+from gui.bankers import check_requests, is_safe_state
+from gui.batch import Batch, Operation, apply_operations
+from gui.components import ComponentIndex
+from gui.graph_store import GraphStore
+from gui.incremental import IncrementalCycleDetector
+from gui.matrix_detection import detect_sparse_deadlock
+from gui.recovery import RecoveryPlan, apply_recovery, plan_recovery
+from gui.scc import cyclic_components, witness_cycle
+
+
+def _put_view(views: list, slot: int, view):
+    """Store a view at its store slot, growing the list for new slots"""
+    if slot == len(views):
+        views.append(view)
+    else:
+        views[slot] = view
+
+
+def _int_array(typecode: str, values: np.ndarray) -> array:
+    """Copy a NumPy integer array into a compact array.array for scalar access"""
+    result = array(typecode)
+    result.frombytes(np.ascontiguousarray(values, dtype=np.dtype(typecode)).tobytes())
+    return result
+
+
+class Deadlock:
+    def __init__(self, processes: Set[Process], cycle: List[Tuple[Process, Resource]]):
+        self.processes = processes  # Every process in the deadlocked component
+        self.cycle = cycle          # Witness cycle: (process, resource it waits for)
+
+    @property
+    def resources(self) -> List[Resource]:
+        """Resources connecting consecutive processes of the witness cycle"""
+        return [resource for _, resource in self.cycle]
+
+    def __repr__(self) -> str:
+        steps = " -> ".join(f"{p.name} -[{r.name}]" for p, r in self.cycle)
+        return f"Deadlock({steps} -> {self.cycle[0][0].name})"
 
 class DeadlockDetector:
-    def __init__(self):
-        self.processes: Dict[str, Process] = {}
-        self.resources: Dict[str, Resource] = {}
+    def __init__(self, incremental: bool = True, contiguous_labels: bool = True):
+        # Live processes and resources keyed by their stable IDs
+        self.processes: Dict[int, Process] = {}
+        self.resources: Dict[int, Resource] = {}
         self.process_counter = 1
         self.resource_counter = 1
+        # Compact integer-indexed graph; Process/Resource objects are views on it
+        self.store = GraphStore()
+        self.process_views: List[Optional[Process]] = []
+        self.resource_views: List[Optional[Resource]] = []
+        # GUI side tables keyed by stable ID; headless nodes have no entry
+        self.process_appearance: Dict[int, Appearance] = {}
+        self.resource_appearance: Dict[int, Appearance] = {}
+        # Process-to-process wait-for graph over process IDs, maintained on
+        # every mutation unless incremental detection is switched off
+        self.incremental = incremental
+        self.wait_for = IncrementalCycleDetector()
+        # Avoidance mode: allocations must keep the system in a safe state
+        self.avoidance = False
+        self.max_claims: Dict[Process, Dict[Resource, int]] = {}
+        # Weakly connected components, only tracked once enabled
+        self.components: Optional[ComponentIndex] = None
+        # Display names: contiguous P1..Pn / R1..Rn labels in creation order,
+        # rebuilt lazily after a removal, or P<uid> / R<uid> when disabled
+        self.contiguous_labels = contiguous_labels
+        self._process_labels: Optional[Dict[int, str]] = {} if contiguous_labels else None
+        self._resource_labels: Optional[Dict[int, str]] = {} if contiguous_labels else None
 
-    def add_process(self, position: Tuple[int, int]) -> Process:
-        """Add a new process to the system"""
-        name = f"P{self.process_counter}"
+    def add_process(self, position: Optional[Tuple[int, int]] = None) -> Process:
+        """Add a new process to the system; headless processes have no position"""
+        uid = self.process_counter
         self.process_counter += 1
-        process = Process(name, position)
-        self.processes[name] = process
+        pid = self.store.add_process()
+        process = Process(self, pid, uid)
+        if position is not None:
+            self.process_appearance[uid] = Appearance(position, Process.default_color)
+        _put_view(self.process_views, pid, process)
+        self.processes[uid] = process
+        if self._process_labels is not None:
+            self._process_labels[uid] = f"P{len(self._process_labels) + 1}"
+        if self.incremental:
+            self.wait_for.add_node(pid)
         return process
 
-    def add_resource(self, position: Tuple[int, int]) -> Resource:
-        """Add a new resource to the system"""
-        name = f"R{self.resource_counter}"
+    def add_resource(self, position: Optional[Tuple[int, int]] = None, instances: int = 1) -> Resource:
+        """Add a new resource with the given number of instances"""
+        rid = self.store.add_resource(instances)
+        uid = self.resource_counter
         self.resource_counter += 1
-        resource = Resource(name, position)
-        self.resources[name] = resource
+        resource = Resource(self, rid, uid)
+        if position is not None:
+            self.resource_appearance[uid] = Appearance(position, Resource.default_color)
+        _put_view(self.resource_views, rid, resource)
+        self.resources[uid] = resource
+        if self._resource_labels is not None:
+            self._resource_labels[uid] = f"R{len(self._resource_labels) + 1}"
         return resource
 
     def remove_process(self, process: Process):
         """Remove a process and all its edges"""
-        if process.name in self.processes:
+        if self.processes.get(process.uid) is process:
             # Remove all allocations and requests
-            for resource in process.allocated:
-                resource.allocated_to = None
-            for resource in process.requesting:
-                resource.requested_by.remove(process)
-            
-            # Get the number of the removed process
-            removed_num = int(process.name[1:])
-            del self.processes[process.name]
-            
-            # Renumber remaining processes
-            processes_to_rename = {}
-            for p in self.processes.values():
-                num = int(p.name[1:])
-                if num > removed_num:
-                    new_name = f"P{num-1}"
-                    processes_to_rename[p.name] = (p, new_name)
-            
-            # Apply renaming
-            for old_name, (proc, new_name) in processes_to_rename.items():
-                proc.name = new_name
-                self.processes[new_name] = proc
-                del self.processes[old_name]
-            
-            # Update counter
-            self.process_counter = max(1, len(self.processes) + 1)
+            self.wait_for.remove_node(process.id)
+            self.store.remove_process(process.id)
+            if self.components is not None:
+                self.components.unlink(process.uid)
+            self.process_views[process.id] = None
+            self.max_claims.pop(process, None)
+            del self.processes[process.uid]
+            self.process_appearance.pop(process.uid, None)
+            self._process_labels = None
 
     def remove_resource(self, resource: Resource):
         """Remove a resource and all its edges"""
-        if resource.name in self.resources:
+        if self.resources.get(resource.uid) is resource:
             # Remove all allocations and requests
-            if resource.allocated_to:
-                resource.allocated_to.allocated.remove(resource)
-            for process in resource.requested_by:
-                process.requesting.remove(resource)
-            
-            # Get the number of the removed resource
-            removed_num = int(resource.name[1:])
-            del self.resources[resource.name]
-            
-            # Renumber remaining resources
-            resources_to_rename = {}
-            for r in self.resources.values():
-                num = int(r.name[1:])
-                if num > removed_num:
-                    new_name = f"R{num-1}"
-                    resources_to_rename[r.name] = (r, new_name)
-            
-            # Apply renaming
-            for old_name, (res, new_name) in resources_to_rename.items():
-                res.name = new_name
-                self.resources[new_name] = res
-                del self.resources[old_name]
-            
-            # Update counter
-            self.resource_counter = max(1, len(self.resources) + 1)
-
-    def detect_deadlock(self):
+            rid = resource.id
+            for pid in self.store.requests.into(rid):
+                self._drop_request(pid, rid)
+            for pid in self.store.holds.into(rid):
+                self._drop_holding(pid, rid)
+            self.store.remove_resource(rid)
+            self.resource_views[rid] = None
+            for claims in self.max_claims.values():
+                claims.pop(resource, None)
+            del self.resources[resource.uid]
+            self.resource_appearance.pop(resource.uid, None)
+            self._resource_labels = None
+
+    def process_label(self, process: Process) -> str:
+        """Display name of a process"""
+        if not self.contiguous_labels:
+            return f"P{process.uid}"
+        if self._process_labels is None:
+            self._process_labels = {uid: f"P{i}" for i, uid in enumerate(self.processes, 1)}
+        return self._process_labels.get(process.uid, f"P{process.uid}")
+
+    def resource_label(self, resource: Resource) -> str:
+        """Display name of a resource"""
+        if not self.contiguous_labels:
+            return f"R{resource.uid}"
+        if self._resource_labels is None:
+            self._resource_labels = {uid: f"R{i}" for i, uid in enumerate(self.resources, 1)}
+        return self._resource_labels.get(resource.uid, f"R{resource.uid}")
+
+    def _is_live(self, process: Process, resource: Resource) -> bool:
+        """Reject stale views whose store slot may have been reused"""
+        return (self.process_views[process.id] is process
+                and self.resource_views[resource.id] is resource)
+
+    def request_resource(self, process: Process, resource: Resource, count: int = 1) -> Optional[List[Process]]:
+        """
+        Record that process is waiting for count instances of resource.
+        Returns the processes of the cycle closed by this request, in wait
+        order, or None if the request does not create a new deadlock.
+        A waiting process waits for every holder of the resource, so with
+        multi-instance resources a cycle is necessary but not sufficient
+        for deadlock; detect_deadlock() then uses the matrix reduction.
+        """
+        if not self._is_live(process, resource):
+            return None
+        store, pid, rid = self.store, process.id, resource.id
+        pending = store.requests.get(pid, rid) + count
+        if count <= 0 or store.holds.get(pid, rid) + pending > store.instances[rid]:
+            return None
+        store.requests.set(pid, rid, pending)
+        if self.components is not None:
+            self.components.link(process.uid, resource.uid)
+        if pending > count or not self.incremental:
+            return None
+        return self._add_wait_edges([pid], store.holds.into(rid))
+
+    def allocate_resource(self, resource: Resource, process: Process, count: int = 1) -> Optional[List[Process]]:
+        """
+        Allocate free instances of a resource to process, satisfying its
+        request if any.  Every other process still requesting the resource
+        now waits for process, so the allocation can close a cycle as well.
+        """
+        if not self._is_live(process, resource):
+            return None
+        store, pid, rid = self.store, process.id, resource.id
+        if count <= 0 or store.available(rid) < count:
+            return None
+        if self.avoidance and not self.is_safe_request(process, resource, count):
+            return None
+        pending = store.requests.get(pid, rid)
+        if pending > count:
+            store.requests.set(pid, rid, pending - count)
+        elif pending:
+            self._drop_request(pid, rid)
+        held = store.holds.get(pid, rid)
+        store.set_holding(pid, rid, held + count)
+        if self.components is not None:
+            self.components.link(process.uid, resource.uid)
+        if held or not self.incremental:
+            return None
+        return self._add_wait_edges(store.requests.into(rid), [pid])
+
+    def release_resource(self, process: Process, resource: Resource, count: Optional[int] = None) -> bool:
+        """Release count instances held by process (all of them by default)"""
+        if not self._is_live(process, resource):
+            return False
+        held = self.store.holds.get(process.id, resource.id)
+        if not held:
+            return False
+        if count is not None and count < held:
+            self.store.set_holding(process.id, resource.id, held - max(count, 0))
+            return True
+        self._drop_holding(process.id, resource.id)
+        return True
+
+    def cancel_request(self, process: Process, resource: Resource) -> bool:
+        """Withdraw a pending request"""
+        if not self._is_live(process, resource):
+            return False
+        if not self.store.requests.get(process.id, resource.id):
+            return False
+        self._drop_request(process.id, resource.id)
+        return True
+
+    def _add_wait_edges(self, waiters, holders) -> Optional[List[Process]]:
+        """Add waiter -> holder edges and return the first cycle they close"""
+        cycle = None
+        for waiter in waiters:
+            for holder in holders:
+                if waiter != holder:
+                    closed = self.wait_for.add_edge(waiter, holder)
+                    if cycle is None and closed is not None:
+                        cycle = [self.process_views[pid] for pid in closed]
+        return cycle
+
+    def _drop_request(self, pid: int, rid: int):
+        """Remove the request edge pid -> rid and its wait edges"""
+        self.store.requests.set(pid, rid, 0)
+        if self.components is not None:
+            self.components.unlink(self.process_views[pid].uid)
+        if self.incremental:
+            for holder in self.store.holds.into(rid):
+                if holder != pid:
+                    self.wait_for.remove_edge(pid, holder)
+
+    def _drop_holding(self, pid: int, rid: int):
+        """Remove the allocation edge rid -> pid and its wait edges"""
+        self.store.set_holding(pid, rid, 0)
+        if self.components is not None:
+            self.components.unlink(self.process_views[pid].uid)
+        if self.incremental:
+            for waiter in self.store.requests.into(rid):
+                if waiter != pid:
+                    self.wait_for.remove_edge(waiter, pid)
+
+    def enable_avoidance(self, enabled: bool = True):
+        """
+        Switch avoidance mode on or off.  In avoidance mode
+        allocate_resource() refuses any grant that would leave the system
+        in an unsafe state with respect to the declared maximum claims.
+        """
+        self.avoidance = enabled
+
+    def declare_max_claim(self, process: Process, resource: Resource, count: int):
+        """Declare the maximum number of instances process may ever hold"""
+        self.max_claims.setdefault(process, {})[resource] = count
+
+    def banker_state(self):
+        """
+        Build (processes, resources, available, allocation, need) for the
+        Banker's algorithm.  Undeclared claims default to current holdings.
+        Rows and columns are store IDs; removed IDs appear as None.
+        """
+        processes, resources, (available, allocation, _) = self.state_matrices()
+        claims = allocation.copy()
+        for process, process_claims in self.max_claims.items():
+            for resource, count in process_claims.items():
+                claims[process.id, resource.id] = max(count, claims[process.id, resource.id])
+        return processes, resources, available, allocation, claims - allocation
+
+    def is_safe_state(self) -> bool:
+        """Return True if all processes can still finish within their claims"""
+        _, _, available, allocation, need = self.banker_state()
+        return is_safe_state(available, allocation, need)
+
+    def is_safe_request(self, process: Process, resource: Resource, count: int = 1) -> bool:
+        """Return True if granting count instances of resource to process is safe"""
+        return self.safe_requests([(process, resource, count)])[0]
+
+    def safe_requests(self, requests: List[Tuple[Process, Resource, int]]) -> List[bool]:
+        """
+        Evaluate a batch of (process, resource, count) requests, each one
+        independently against the current state, in a single vectorized call.
+        """
+        _, resources, available, allocation, need = self.banker_state()
+        rows = np.zeros(len(requests), dtype=np.int64)
+        vectors = np.zeros((len(requests), len(resources)), dtype=np.int64)
+        known = np.ones(len(requests), dtype=bool)
+        for b, (process, resource, count) in enumerate(requests):
+            if process.owner is not self or resource.owner is not self:
+                known[b] = False
+                continue
+            rows[b] = process.id
+            vectors[b, resource.id] = count
+        safe = check_requests(available, allocation, need, rows, vectors)
+        return (safe & known).tolist()
+
+    def grant_request(self, process: Process, resource: Resource, count: int = 1) -> bool:
+        """Allocate the instances only if it is safe; returns whether they were granted"""
+        if not self.is_safe_request(process, resource, count):
+            return False
+        held = self.store.holds.get(process.id, resource.id)
+        self.allocate_resource(resource, process, count)
+        return self.store.holds.get(process.id, resource.id) > held
+
+    def has_deadlock(self) -> bool:
+        """O(1) check against the incrementally maintained wait-for graph"""
+        if not self.incremental:
+            return self.detect_deadlock("graph")[0]
+        return self.wait_for.has_cycle()
+
+    def find_deadlocks(self) -> List[Deadlock]:
+        """
+        Find every deadlocked set of processes in one linear-time pass.
+        Each strongly connected component of the wait-for graph that
+        contains a cycle is reported together with a witness cycle.
+        """
+        # CSR wait-for graph over process IDs; edges come out sorted by waiter
+        waiter, holder, via = self.store.wait_for_edges()
+        num_processes = self.store.num_processes
+        counts = np.bincount(waiter, minlength=num_processes)
+        indptr = _int_array('q', np.concatenate([[0], np.cumsum(counts)]))
+        indices = _int_array('i', holder)
+        return self._collect_deadlocks(range(num_processes), indptr, indices, via)
+
+    def find_deadlocks_from(self, seeds: Iterable[int]) -> List[Deadlock]:
+        """
+        Find the deadlocked sets reachable from the given process IDs.
+        Only the part of the wait-for graph reachable from the seeds is
+        visited, so the cost is proportional to that region alone.
+        """
+        local: Dict[int, int] = {}
+        nodes: List[int] = []
+        for seed in seeds:
+            if seed not in local:
+                local[seed] = len(nodes)
+                nodes.append(seed)
+        indptr = array('q', [0])
+        indices = array('i')
+        via = array('i')
+        # nodes grows while it is scanned: a breadth-first closure
+        for pid in nodes:
+            for holder, rid in self.store.wait_successors(pid):
+                if holder not in local:
+                    local[holder] = len(nodes)
+                    nodes.append(holder)
+                indices.append(local[holder])
+                via.append(rid)
+            indptr.append(len(indices))
+        return self._collect_deadlocks(nodes, indptr, indices, via)
+
+    def find_deadlocks_parallel(self, executor: Optional[Executor] = None,
+                                parallel_size: int = 20_000) -> List[Deadlock]:
+        """
+        Same result as find_deadlocks(), but only weakly connected components
+        that changed since the previous call are searched again, and those
+        with at least parallel_size processes run on the executor
+        (e.g. a ProcessPoolExecutor).  The first call starts tracking
+        components, which then costs a union-find update per new edge.
+        """
+        if self.components is None:
+            self.components = ComponentIndex(self)
+        return self.components.find_deadlocks(executor, parallel_size)
+
+    def _collect_deadlocks(self, nodes: Sequence[int], indptr, indices, via,
+                           found=None) -> List[Deadlock]:
+        """
+        Turn the cyclic components of a CSR wait-for graph into reports;
+        found holds precomputed (component, witness edges) pairs if given.
+        """
+        if found is None:
+            found = [(component, witness_cycle(component, indptr, indices))
+                     for component in cyclic_components(len(nodes), indptr, indices)]
+        views = self.process_views
+        deadlocks = []
+        for component, witness in found:
+            cycle = []
+            for edge in witness:
+                waiting = views[nodes[bisect_right(indptr, edge) - 1]]
+                cycle.append((waiting, self.resource_views[via[edge]]))
+            deadlocks.append(Deadlock({views[nodes[i]] for i in component}, cycle))
+        return deadlocks
+
+    def batch(self) -> Batch:
+        """
+        Start a transaction; operations are buffered and applied together
+        when the with-block exits, after which batch.deadlocks holds the
+        deadlocks the batch created.
+        """
+        return Batch(self)
+
+    def apply_batch(self, operations: Iterable[Operation]) -> List[Deadlock]:
+        """
+        Apply ("request" | "allocate" | "release" | "cancel", process,
+        resource, count) operations atomically: all are validated before
+        any is applied, and a BatchError leaves the detector untouched.
+        Returns the deadlocks closed by the batch.
+        """
+        return apply_operations(self, operations)
+
+    def plan_recovery(self, action: str = "abort", **costs) -> RecoveryPlan:
+        """
+        Pick low-cost processes to abort or preempt so that every deadlock
+        breaks; see gui.recovery for the cost options.
+        """
+        return plan_recovery(self, action, **costs)
+
+    def recover(self, action: str = "abort", **costs) -> RecoveryPlan:
+        """Plan a recovery and carry it out; returns the plan"""
+        plan = plan_recovery(self, action, **costs)
+        apply_recovery(self, plan)
+        return plan
+
+    def detect_deadlock(self, mode: str = "auto"):
         """
         Detect if there is a deadlock in the system.
         Returns a tuple (bool, set) where the bool indicates if there is a deadlock,
         and the set contains the processes involved in the deadlock.
+        mode is "graph" (wait-for cycles, exact for single-instance resources),
+        "matrix" (Available/Allocation/Request reduction, exact for any
+        capacity) or "auto", which picks "matrix" only when some resource
+        has more than one instance.
         """
-        # Build adjacency list representation of the graph
-        graph = {process: [] for process in self.processes.values()}
-        
-        # Add edges from process to process through resources
-        for process in self.processes.values():
-            for resource in process.requesting:
-                if resource.allocated_to:  # Only add edge if resource is allocated
-                    graph[process].append(resource.allocated_to)
-        
-        # Detect cycles using DFS
-        visited = set()
-        rec_stack = set()
+        if mode == "auto":
+            multi = any(n > 1 for n in self.store.instances)
+            mode = "matrix" if multi else "graph"
+        if mode == "matrix":
+            return self._detect_matrix_deadlock()
+        if mode != "graph":
+            raise ValueError(f"Unknown detection mode: {mode}")
+
         deadlocked = set()
-        
-        def dfs(node):
-            visited.add(node)
-            rec_stack.add(node)
-            
-            for neighbor in graph[node]:
-                if neighbor not in visited:
-                    if dfs(neighbor):
-                        deadlocked.add(neighbor)
-                        return True
-                elif neighbor in rec_stack:
-                    deadlocked.add(neighbor)
-                    return True
-                    
-            rec_stack.remove(node)
-            return False
-            
-        # Run DFS from each unvisited node
-        for process in self.processes.values():
-            if process not in visited:
-                if dfs(process):
-                    deadlocked.add(process)
-                    
+        for deadlock in self.find_deadlocks():
+            deadlocked |= deadlock.processes
+        return len(deadlocked) > 0, deadlocked
+
+    def state_matrices(self):
+        """
+        Build the classical Available vector and Allocation/Request matrices.
+        Rows follow self.process_views and columns self.resource_views.
+        """
+        matrices = self.store.state_matrices()
+        return self.process_views, self.resource_views, matrices
+
+    def _detect_matrix_deadlock(self):
+        available, allocation, request = self.store.state_coordinates()
+        mask = detect_sparse_deadlock(available, self.store.num_processes, allocation, request)
+        deadlocked = {self.process_views[pid] for pid in np.flatnonzero(mask)}
         return len(deadlocked) > 0, deadlocked
         
     def clear_graph(self):
         """Clear all processes and resources from the system"""
         self.processes.clear()
         self.resources.clear()
+        self.store.clear()
+        self.process_views.clear()
+        self.resource_views.clear()
+        self.process_appearance.clear()
+        self.resource_appearance.clear()
+        self.wait_for.clear()
+        self.max_claims.clear()
+        if self.components is not None:
+            self.components.clear()
+        self._process_labels = {} if self.contiguous_labels else None
+        self._resource_labels = {} if self.contiguous_labels else None
         self.process_counter = 1
         self.resource_counter = 1 
\ No newline at end of file
@@ -0,0 +1,379 @@
+"""
+Sharded deadlock detection with Chandy-Misra-Haas edge chasing.
+
+Resources are partitioned across shards by a hash of their name.  Each
+shard runs in its own OS process with a DeadlockDetector for its own
+resources and the processes that touch them, and no shard ever sees the
+whole graph.  A process also has a home shard, chosen by the same hash,
+that keeps a small directory of the shards where it is currently waiting.
+
+A cycle made only of one shard's resources is found by that shard's
+incremental detector.  A cycle that crosses shards is found by probes.
+When an event gives process W a new wait-for edge to a holder H, the
+resource shard starts a probe (initiator W) and routes it through H's home
+shard to every shard where H waits.  Each of those shards forwards it to
+the holders H waits for, and so on.  A shard forwards a probe at most once
+per target, and a probe that arrives back at its initiator reports the
+cycle it has travelled.  A probe reaching a home shard before the process's
+waiting notice is parked there and released when the notice arrives.  It
+is dropped if the edge it arrived over goes away first: the resource's
+shard sends an unpark notice when the holder releases the resource or
+the waiter stops requesting it, so every parked probe is tied to a live
+edge.
+
+Before a returned probe is reported, each edge of its cycle is re-checked
+at the shard owning the edge's resource.  This filters out stale probes,
+e.g. one parked while its initiator stopped waiting or a cycle broken
+while the probe was in flight.
+
+Shards exchange messages over multiprocessing queues, batching everything
+bound for the same shard while handling one inbound message.
+run_sharded() feeds a trace into N shards and waits for quiescence.  It
+returns the deadlocks with their detection latency and the number of
+messages of each kind.
+"""
+
+import multiprocessing
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from gui.stream import Event, StreamingDetector
+
+Step = Tuple[str, str]  # (process, resource it waits for)
+
+
+def shard_of(name: str, shards: int) -> int:
+    """Stable shard of a process or resource name"""
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+class ShardedReport(NamedTuple):
+    shard: int              # Shard that detected the cycle
+    cycle: List[Step]       # Wait order, starting at the initiator
+    latency: float          # Seconds from dispatching the closing event to detection
+    probe: bool             # False if found locally by the shard's own detector
+
+
+class ShardedResult(NamedTuple):
+    deadlocks: List[ShardedReport]  # One report per distinct set of processes
+    duplicates: int                 # Extra reports of already reported cycles
+    messages: Counter               # Inter-shard messages by kind
+    elapsed: float                  # Wall time from the first event to quiescence
+
+
+class Shard:
+    """One detector shard; run() is the body of its OS process"""
+
+    def __init__(self, index: int, inboxes: list, results, visited_limit: int = 65536):
+        self.index = index
+        self.inboxes = inboxes
+        self.results = results
+        self.shards = len(inboxes)
+        self.streaming = StreamingDetector()
+        # Home directory: shards where each of our processes waits
+        self.waiting_at: Dict[str, Set[int]] = {}
+        self.parked: Dict[str, deque] = {}
+        # (initiator, probe) -> targets already forwarded from here
+        self.visited: "OrderedDict[Tuple[str, int], Set[str]]" = OrderedDict()
+        self.visited_limit = visited_limit
+        self.local: deque = deque()
+        self.outgoing: Dict[int, list] = {}  # Per target shard, sent as one batch
+        self.probes = 0
+        self.sent: Counter = Counter()
+        self.received = 0
+
+    def run(self):
+        inbox = self.inboxes[self.index]
+        handlers = {
+            "events": self._on_events, "probe": self._on_probe, "route": self._on_route,
+            "wait": self._on_wait, "unwait": self._on_unwait, "confirm": self._on_confirm,
+            "unpark": self._on_unpark,
+        }
+        while True:
+            message = inbox.get()
+            kind = message[0]
+            if kind == "stop":
+                self.results.put(("stats", self.index, dict(self.sent)))
+                return
+            if kind == "count":
+                self.results.put(("count", self.index, sum(self.sent.values()), self.received))
+                continue
+            if kind == "batch":
+                self.received += len(message[1])
+                self.local.extend(message[1])
+            else:
+                handlers[kind](*message[1:])
+            while self.local:
+                message = self.local.popleft()
+                handlers[message[0]](*message[1:])
+            for shard, batch in self.outgoing.items():
+                self.inboxes[shard].put(("batch", batch))
+            self.outgoing.clear()
+
+    def _send(self, shard: int, message: tuple):
+        if shard == self.index:
+            self.local.append(message)
+        else:
+            self.sent[message[0]] += 1
+            self.outgoing.setdefault(shard, []).append(message)
+
+    def _waiting(self, process: str) -> bool:
+        """Whether process has a pending request on one of our resources"""
+        view = self.streaming.processes.get(process)
+        return view is not None and bool(self.streaming.detector.store.requests.out(view.id))
+
+    def _on_events(self, events: List[tuple]):
+        streaming = self.streaming
+        store = streaming.detector.store
+        for dispatched, op, process, resource, count, instances in events:
+            view = streaming.processes.get(process)
+            lock = streaming.resources.get(resource)
+            was_waiting = self._waiting(process)
+            pending = store.requests.get(view.id, lock.id) if view and lock else 0
+            held = store.holds.get(view.id, lock.id) if view and lock else 0
+
+            cycle = streaming.apply(op, process, resource, count, instances)
+            if cycle:
+                self.results.put(("deadlock", self.index, streaming.describe(cycle),
+                                  time.monotonic() - dispatched, False))
+
+            waiting = self._waiting(process)
+            if waiting != was_waiting:
+                self._send(shard_of(process, self.shards),
+                           ("wait" if waiting else "unwait", process, self.index))
+            if cycle or self.shards == 1:
+                continue  # A single shard sees every cycle locally
+            view = streaming.processes.get(process)
+            lock = streaming.resources.get(resource)
+            if lock is not None and (held or pending):
+                self._unpark(process, view, lock, held, pending)
+            if view is None or lock is None:
+                continue
+            if op == "request" and not pending and store.requests.get(view.id, lock.id):
+                self._start_probes([view.id], store.holds.into(lock.id), lock.id, dispatched)
+            elif op == "acquire" and not held and store.holds.get(view.id, lock.id):
+                # Every process still requesting the resource now waits for this one
+                self._start_probes(store.requests.into(lock.id), [view.id], lock.id, dispatched)
+
+    def _unpark(self, process: str, view, lock, held: int, pending: int):
+        """Tell home shards about the wait-for edges through lock the last event removed"""
+        detector = self.streaming.detector
+        store = detector.store
+        names = self.streaming.names
+        resource = names[("R", lock.uid)]
+        if held and (view is None or not store.holds.get(view.id, lock.id)) \
+                and store.requests.into(lock.id):
+            # Probes parked at process over its hold on the resource are stale
+            self._send(shard_of(process, self.shards), ("unpark", process, resource, None))
+        if pending and (view is None or not store.requests.get(view.id, lock.id)):
+            # So are probes from process parked at the resource's holders
+            for holder in store.holds.into(lock.id):
+                name = names[("P", detector.process_views[holder].uid)]
+                self._send(shard_of(name, self.shards), ("unpark", name, resource, process))
+
+    def _start_probes(self, waiters: Iterable[int], holders: Iterable[int], rid: int,
+                      dispatched: float):
+        """Chase the new wait-for edges from waiters to holders through resource rid"""
+        names = self.streaming.names
+        detector = self.streaming.detector
+        resource = names[("R", detector.resource_views[rid].uid)]
+        holders = list(holders)
+        for waiter in list(waiters):
+            initiator = names[("P", detector.process_views[waiter].uid)]
+            self.probes += 1
+            probe = self.index + self.shards * self.probes  # Unique across shards
+            for holder in holders:
+                if holder != waiter:
+                    target = names[("P", detector.process_views[holder].uid)]
+                    self._send(shard_of(target, self.shards),
+                               ("route", initiator, probe, target, [(initiator, resource)], dispatched))
+
+    def _on_route(self, initiator: str, probe: int, target: str, path: List[Step], dispatched: float):
+        """Home shard of target: pass the probe to every shard where it waits"""
+        sites = self.waiting_at.get(target)
+        if not sites:
+            parked = self.parked.setdefault(target, deque())
+            parked.append((initiator, probe, target, path, dispatched))
+            return
+        for site in sites:
+            self._send(site, ("probe", initiator, probe, target, path, dispatched))
+
+    def _on_wait(self, process: str, site: int):
+        self.waiting_at.setdefault(process, set()).add(site)
+        for parked in self.parked.pop(process, ()):
+            self._send(site, ("probe",) + parked)
+
+    def _on_unpark(self, target: str, resource: str, waiter: Optional[str]):
+        """Drop probes parked at target that came over its hold on resource (from waiter)"""
+        parked = self.parked.get(target)
+        if not parked:
+            return
+        kept = [entry for entry in parked
+                if entry[3][-1][1] != resource or (waiter is not None and entry[3][-1][0] != waiter)]
+        if kept:
+            self.parked[target] = deque(kept)
+        else:
+            del self.parked[target]
+
+    def _on_unwait(self, process: str, site: int):
+        sites = self.waiting_at.get(process)
+        if sites is not None:
+            sites.discard(site)
+            if not sites:
+                del self.waiting_at[process]
+
+    def _on_probe(self, initiator: str, probe: int, target: str, path: List[Step], dispatched: float):
+        """Forward the probe along target's wait-for edges through our resources"""
+        streaming = self.streaming
+        view = streaming.processes.get(target)
+        if view is None:
+            return
+        key = (initiator, probe)
+        seen = self.visited.get(key)
+        if seen is None:
+            seen = self.visited[key] = set()
+            if len(self.visited) > self.visited_limit:
+                self.visited.popitem(last=False)
+        if target in seen:
+            return
+        seen.add(target)
+
+        detector = streaming.detector
+        store = detector.store
+        names = streaming.names
+        for rid in store.requests.out(view.id):
+            step = path + [(target, names[("R", detector.resource_views[rid].uid)])]
+            for holder in store.holds.into(rid):
+                if holder == view.id:
+                    continue
+                name = names[("P", detector.process_views[holder].uid)]
+                if name == initiator:
+                    self._confirm(step, 0, dispatched)
+                else:
+                    self._send(shard_of(name, self.shards),
+                               ("route", initiator, probe, name, step, dispatched))
+
+    def _confirm(self, cycle: List[Step], position: int, dispatched: float):
+        """
+        Re-check the edges of a returned probe's cycle, each at the shard
+        owning its resource, so stale probes (e.g. ones that were parked
+        while the initiator's wait ended) cannot report phantom cycles.
+        """
+        if position == len(cycle):
+            self.results.put(("deadlock", self.index, cycle, time.monotonic() - dispatched, True))
+            return
+        resource = cycle[position][1]
+        shard = shard_of(resource, self.shards)
+        if shard != self.index:
+            self._send(shard, ("confirm", cycle, position, dispatched))
+            return
+        streaming = self.streaming
+        waiter = streaming.processes.get(cycle[position][0])
+        holder = streaming.processes.get(cycle[(position + 1) % len(cycle)][0])
+        lock = streaming.resources.get(resource)
+        store = streaming.detector.store
+        if (waiter is not None and holder is not None and lock is not None
+                and store.requests.get(waiter.id, lock.id) and store.holds.get(holder.id, lock.id)):
+            self._confirm(cycle, position + 1, dispatched)
+
+    def _on_confirm(self, cycle: List[Step], position: int, dispatched: float):
+        self._confirm(cycle, position, dispatched)
+
+
+def _shard_main(index: int, inboxes: list, results):
+    Shard(index, inboxes, results).run()
+
+
+def _drain(results, reports: list, stats: dict, counts: Optional[dict] = None, wanted: int = 0,
+           timeout: float = 60.0):
+    """Read result messages until `wanted` count or stats replies have arrived"""
+    got = 0
+    while got < wanted:
+        message = results.get(timeout=timeout)
+        if message[0] == "deadlock":
+            reports.append(message)
+        elif message[0] == "count":
+            counts[message[1]] = message[2:]
+            got += 1
+        elif message[0] == "stats":
+            stats[message[1]] = message[2]
+            got += 1
+
+
+def run_sharded(events: Iterable[Event], shards: int, chunk: int = 64,
+                rate: Optional[float] = None) -> ShardedResult:
+    """
+    Replay a trace through `shards` shard processes and collect the
+    deadlocks they find.  Events are sent to the shard owning their
+    resource in chunks of up to `chunk` events, paced to `rate` events
+    per second if given so that latency is not dominated by queueing.
+    """
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(shards)]
+    results = context.Queue()
+    workers = [context.Process(target=_shard_main, args=(i, inboxes, results), daemon=True)
+               for i in range(shards)]
+    for worker in workers:
+        worker.start()
+
+    reports: list = []
+    stats: dict = {}
+    started = time.monotonic()
+    try:
+        buffers: List[list] = [[] for _ in range(shards)]
+
+        def flush():
+            for shard, buffer in enumerate(buffers):
+                if buffer:
+                    inboxes[shard].put(("events", buffer))
+                    buffers[shard] = []
+
+        for sent, event in enumerate(events):
+            if rate and sent and sent % chunk == 0:
+                flush()  # Nothing waits in a buffer while the dispatcher sleeps
+                delay = started + sent / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            shard = shard_of(event.resource, shards)
+            buffers[shard].append((time.monotonic(), event.op, event.process, event.resource,
+                                   event.count, event.instances))
+            if len(buffers[shard]) >= chunk:
+                inboxes[shard].put(("events", buffers[shard]))
+                buffers[shard] = []
+        flush()
+
+        # Quiescent once two consecutive rounds see every sent message received
+        previous = None
+        while True:
+            counts: dict = {}
+            for inbox in inboxes:
+                inbox.put(("count",))
+            _drain(results, reports, stats, counts, shards)
+            sent = sum(c[0] for c in counts.values())
+            received = sum(c[1] for c in counts.values())
+            if sent == received and previous == (sent, received):
+                break
+            previous = (sent, received)
+        elapsed = time.monotonic() - started
+
+        for inbox in inboxes:
+            inbox.put(("stop",))
+        _drain(results, reports, stats, wanted=shards)
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+    messages: Counter = Counter()
+    for sent in stats.values():
+        messages.update(sent)
+    deadlocks, seen = [], set()
+    for _, shard, cycle, latency, probe in reports:
+        key = frozenset(process for process, _ in cycle)
+        if key not in seen:
+            seen.add(key)
+            deadlocks.append(ShardedReport(shard, cycle, latency, probe))
+    return ShardedResult(deadlocks, len(reports) - len(deadlocks), messages, elapsed)
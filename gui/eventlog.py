@@ -0,0 +1,334 @@
+"""
+Compact binary lock-event log.
+
+Layout (little endian):
+
+    header   magic b"DLEV", version u16, reserved u16,
+             record count u64, records offset u64, string table offset u64
+    records  fixed-width 24-byte records:
+             op u8, reserved u8, instances u16, count u32,
+             process u32, resource u32, timestamp f64
+    strings  count u32, then per string: length u32 + UTF-8 bytes
+
+Process and resource names are stored once in the string table and
+referenced by index.  A count of 0 means "unspecified" and a NaN
+timestamp means "no timestamp".  The reader maps the file with mmap and
+views the record area as a NumPy structured array without copying it.
+
+Replay works on blocks of BATCH records.  Most locks in a trace are
+taken by one thread at a time, and within a short block most are used by
+a single process.  NumPy finds those resources per block; if no other
+process holds or waits for one at the start of the block, nobody can
+wait on it, so its records only update two counters and the net request
+and allocation reach the detector once, at the end of the block.  The
+remaining records go through the detector one by one, so the same
+records are reported closing the same cycles, with the same event and
+rejection counts, as in a record-by-record replay.
+
+    python -m gui.eventlog convert trace.jsonl trace.dlev
+    python -m gui.eventlog replay trace.dlev
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# Allow running as a script as well as with python -m
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.stream import (OPS, READERS, THREAD_OPS, DeadlockReport, Event, StreamingDetector,
+                        guess_format, read_events)
+
+MAGIC = b"DLEV"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQQQ")
+RECORD = struct.Struct("<BBHIIId")
+RECORD_DTYPE = np.dtype([
+    ("op", "u1"), ("reserved", "u1"), ("instances", "<u2"), ("count", "<u4"),
+    ("process", "<u4"), ("resource", "<u4"), ("timestamp", "<f8"),
+])
+LENGTH = struct.Struct("<I")
+OP_CODES = {op: code for code, op in enumerate(OPS)}
+REQUEST, ACQUIRE, RELEASE, CANCEL = (OP_CODES[op] for op in ("request", "acquire", "release", "cancel"))
+THREAD_CODES = [OP_CODES[op] for op in THREAD_OPS]
+BATCH = 1024  # Records examined together for resources used by a single process
+
+
+class EventLogWriter:
+    """Writes events to a binary log; use as a context manager"""
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.strings: Dict[str, int] = {}
+        self.count = 0
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0, HEADER.size, 0))
+
+    def _intern(self, name: str) -> int:
+        index = self.strings.get(name)
+        if index is None:
+            index = self.strings[name] = len(self.strings)
+        return index
+
+    def write(self, event: Event):
+        if not 1 <= event.instances <= 0xFFFF:
+            raise ValueError(f"instances out of range for the binary format: {event.instances}")
+        self.file.write(RECORD.pack(
+            OP_CODES[event.op], 0, event.instances, event.count or 0,
+            self._intern(event.process), self._intern(event.resource),
+            math.nan if event.timestamp is None else event.timestamp))
+        self.count += 1
+
+    def write_all(self, events: Iterable[Event]) -> int:
+        for event in events:
+            self.write(event)
+        return self.count
+
+    def close(self):
+        """Append the string table and fill in the header"""
+        if self.file.closed:
+            return
+        strings_offset = self.file.tell()
+        table = [LENGTH.pack(len(self.strings))]
+        for name in self.strings:  # dicts keep insertion order, i.e. by index
+            data = name.encode("utf-8")
+            table.append(LENGTH.pack(len(data)))
+            table.append(data)
+        self.file.write(b"".join(table))
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, self.count, HEADER.size, strings_offset))
+        self.file.close()
+
+    def __enter__(self) -> 'EventLogWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+class EventLog:
+    """Memory-mapped, read-only view of a binary event log"""
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.map = None
+        self.records = None
+        try:
+            if os.fstat(self.file.fileno()).st_size < HEADER.size:
+                raise ValueError(f"{path} is not a version {VERSION} event log")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._load(path)
+        except struct.error as error:
+            self.close()
+            raise ValueError(f"{path} is truncated or corrupt: {error}") from None
+        except ValueError:
+            self.close()
+            raise
+
+    def _load(self, path: str):
+        magic, version, _, count, records_offset, strings_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} event log")
+        if records_offset + count * RECORD_DTYPE.itemsize > len(self.map):
+            raise ValueError(f"{path} is truncated: {count} records do not fit")
+        # Zero-copy structured view of the record area
+        self.records = np.frombuffer(self.map, dtype=RECORD_DTYPE, count=count,
+                                     offset=records_offset)
+        self.strings = self._read_strings(path, strings_offset)
+        if count and (int(self.records["op"].max()) >= len(OPS)
+                      or int(self.records["process"].max()) >= len(self.strings)
+                      or int(self.records["resource"].max()) >= len(self.strings)):
+            raise ValueError(f"{path} is corrupt: records refer to unknown ops or names")
+
+    def _read_strings(self, path: str, offset: int) -> List[str]:
+        view = memoryview(self.map)
+        try:
+            (count,) = LENGTH.unpack_from(view, offset)
+            offset += LENGTH.size
+            strings = []
+            for _ in range(count):
+                (length,) = LENGTH.unpack_from(view, offset)
+                offset += LENGTH.size
+                if offset + length > len(view):
+                    raise ValueError(f"{path} is truncated: the string table runs past its end")
+                strings.append(str(view[offset:offset + length], "utf-8"))
+                offset += length
+            return strings
+        except UnicodeDecodeError as error:
+            raise ValueError(f"{path} is corrupt: {error}") from None
+        finally:
+            view.release()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[Event]:
+        strings = self.strings
+        for op, _, instances, count, process, resource, timestamp in self.records.tolist():
+            yield Event(OPS[op], strings[process], strings[resource], count or None,
+                        None if timestamp != timestamp else timestamp, instances or 1)
+
+    def replay(self, streaming: Optional[StreamingDetector] = None,
+               chunk: int = BATCH) -> Iterator[DeadlockReport]:
+        """
+        Drive a StreamingDetector with every record and yield deadlock
+        reports.  Records are decoded a block at a time straight from the
+        mapping; an Event object is only built for cycle-closing records.
+        """
+        streaming = streaming or StreamingDetector()
+        strings = self.strings
+        apply = streaming.apply
+        # Avoidance checks depend on the whole graph, so every record must go through
+        batched = not streaming.detector.avoidance
+        for start in range(0, len(self.records), chunk):
+            block = self.records[start:start + chunk]
+            private = self._private_resources(block, streaming) if batched else {}
+            columns = zip(block["op"].tolist(), block["process"].tolist(),
+                          block["resource"].tolist(), block["count"].tolist(),
+                          block["instances"].tolist())
+            for offset, (op, process, resource, count, instances) in enumerate(columns):
+                state = private.get(resource) if op not in THREAD_CODES else None
+                if state is not None:
+                    _simulate(streaming, state, op, count, instances)
+                    continue
+                cycle = apply(OPS[op], strings[process], strings[resource],
+                              count or None, instances or 1)
+                if cycle:
+                    record = block[offset]
+                    timestamp = float(record["timestamp"])
+                    event = Event(OPS[op], strings[process], strings[resource], count or None,
+                                  None if math.isnan(timestamp) else timestamp, instances or 1)
+                    yield DeadlockReport(start + offset, event, streaming.describe(cycle))
+            for resource, state in private.items():
+                if state[1:4] != state[4:]:
+                    process, requested, held, capacity = state[:4]
+                    streaming.settle(strings[process], strings[resource], requested, held, capacity)
+
+    def _private_resources(self, block: np.ndarray, streaming: StreamingDetector) -> Dict[int, list]:
+        """
+        [process, requested, held, capacity] for every resource that one
+        process uses in the block and nobody else holds or waits for,
+        followed by the same three values as they are at the start
+        """
+        mask = ~np.isin(block["op"], THREAD_CODES)
+        resources, processes = block["resource"][mask], block["process"][mask]
+        if not len(resources):
+            return {}
+        order = np.argsort(resources, kind="stable")
+        resources, processes = resources[order], processes[order]
+        starts = np.flatnonzero(np.r_[True, resources[1:] != resources[:-1]])
+        single = np.minimum.reduceat(processes, starts) == np.maximum.reduceat(processes, starts)
+        store = streaming.detector.store
+        private = {}
+        for resource, process in zip(resources[starts][single].tolist(),
+                                     processes[starts][single].tolist()):
+            view = streaming.resources.get(self.strings[resource])
+            if view is None:
+                private[resource] = [process, 0, 0, None, 0, 0, None]
+                continue
+            holders, waiters = store.holds.into(view.id), store.requests.into(view.id)
+            owner = streaming.processes.get(self.strings[process])
+            others = set(holders).union(waiters).difference([owner.id] if owner else [])
+            if not others:
+                pid = owner.id if owner else -1
+                start = [waiters.get(pid, 0), holders.get(pid, 0), view.instances]
+                private[resource] = [process] + start + start
+        return private
+
+    def close(self):
+        # The NumPy view must go before the mapping can be closed
+        self.records = None
+        if self.map is not None and not self.map.closed:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self) -> 'EventLog':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+
+def _simulate(streaming: StreamingDetector, state: list, op: int, count: int, instances: int):
+    """
+    Apply one record to [process, requested, held, capacity] of a resource
+    nobody else uses, as DeadlockDetector would; capacity None means the
+    resource has no node (yet, or again after eviction)
+    """
+    streaming.events += 1
+    _, requested, held, capacity = state[:4]
+    if capacity is None:
+        capacity = instances or 1
+    amount = count or 1
+    if op == REQUEST:
+        accepted = held + requested + amount <= capacity
+        if accepted:
+            requested += amount
+    elif op == ACQUIRE:
+        accepted = capacity - held >= amount
+        if accepted:
+            requested = requested - amount if requested > amount else 0
+            held += amount
+    elif op == RELEASE:
+        accepted = held > 0
+        held = held - count if 0 < count < held else 0
+    else:
+        accepted = requested > 0
+        requested = 0
+    if not accepted:
+        streaming.rejected += 1
+    if op in (RELEASE, CANCEL) and streaming.evict_idle and not requested and not held:
+        capacity = None
+    state[1:4] = requested, held, capacity
+
+
+def convert(source, fmt: str, path: str) -> int:
+    """Convert a JSONL/CSV text trace into a binary log; returns the event count"""
+    with EventLogWriter(path) as writer:
+        return writer.write_all(read_events(source, fmt))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Binary lock-event logs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_binary = commands.add_parser("convert", help="convert a JSONL/CSV trace")
+    to_binary.add_argument("source", help="text trace, '-' for stdin")
+    to_binary.add_argument("output", help="binary log to write")
+    to_binary.add_argument("--format", choices=sorted(READERS),
+                           help="trace format (default: from extension, jsonl for stdin)")
+    replay = commands.add_parser("replay", help="detect deadlocks in a binary log")
+    replay.add_argument("log", help="binary log to replay")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        fmt = args.format or ("jsonl" if args.source == "-" else guess_format(args.source))
+        if args.source == "-":
+            count = convert(sys.stdin, fmt, args.output)
+        else:
+            with open(args.source, newline="") as source:
+                count = convert(source, fmt, args.output)
+        print(f"wrote {count} events to {args.output}", file=sys.stderr)
+        return 0
+
+    streaming = StreamingDetector()
+    found = 0
+    with EventLog(args.log) as log:
+        for report in log.replay(streaming):
+            found += 1
+            print(json.dumps(report.to_dict()), flush=True)
+    print(f"{streaming.events} events, {found} deadlocks, {streaming.rejected} rejected events",
+          file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
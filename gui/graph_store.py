@@ -0,0 +1,311 @@
+"""
+Compact, integer-indexed storage for the resource allocation graph.
+
+Processes and resources are identified by dense integer IDs.  Request and
+allocation edges are kept as counted process -> resource relations, each
+stored as a pair of CSR arrays (process-major and resource-major) plus a
+small delta buffer that absorbs recent mutations.  When the buffer grows
+past a fraction of the stored edges it is merged back into the CSR arrays
+with a handful of vectorized NumPy operations.
+
+Each stored edge costs 16 bytes (an int32 index and an int32 count in
+both directions), so 10M edges fit in well under 1 GB.
+"""
+
+from array import array
+from typing import Dict, List, Tuple
+import numpy as np
+
+INDEX_DTYPE = np.int32
+COUNT_DTYPE = np.int32
+COUNT_MAX = int(np.iinfo(COUNT_DTYPE).max)  # Largest capacity or edge count
+
+
+class Relation:
+    """Counted edges src -> dst between two integer ID spaces"""
+
+    def __init__(self, min_delta: int = 1024):
+        # Forward (src-major) and reverse (dst-major) CSR arrays
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=INDEX_DTYPE)
+        self.counts = np.zeros(0, dtype=COUNT_DTYPE)
+        self.rev_indptr = np.zeros(1, dtype=np.int64)
+        self.rev_indices = np.zeros(0, dtype=INDEX_DTYPE)
+        self.rev_counts = np.zeros(0, dtype=COUNT_DTYPE)
+        # Delta buffer: overriding counts, 0 marks a deleted edge
+        self.delta_out: Dict[int, Dict[int, int]] = {}
+        self.delta_in: Dict[int, Dict[int, int]] = {}
+        self.delta_size = 0
+        self.min_delta = min_delta
+        self.size = 0  # Number of live edges
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, src: int, dst: int) -> int:
+        """Count on the edge src -> dst, 0 if absent"""
+        delta = self.delta_out.get(src)
+        if delta is not None and dst in delta:
+            return delta[dst]
+        return self._base_count(src, dst)
+
+    def set(self, src: int, dst: int, count: int):
+        """Set the count on src -> dst; a count of 0 removes the edge"""
+        old = self.get(src, dst)
+        if old == count:
+            return
+        self.size += (count > 0) - (old > 0)
+        delta = self.delta_out.setdefault(src, {})
+        if dst not in delta:
+            self.delta_size += 1
+        delta[dst] = count
+        self.delta_in.setdefault(dst, {})[src] = count
+        if self.delta_size > max(self.min_delta, len(self.indices) >> 3):
+            self.compact()
+
+    def add(self, src: int, dst: int, count: int) -> int:
+        """Add count to src -> dst and return the new count"""
+        new = max(0, self.get(src, dst) + count)
+        self.set(src, dst, new)
+        return new
+
+    def out(self, src: int) -> Dict[int, int]:
+        """Map dst -> count for every edge leaving src"""
+        return self._merge(src, self.indptr, self.indices, self.counts, self.delta_out)
+
+    def into(self, dst: int) -> Dict[int, int]:
+        """Map src -> count for every edge entering dst"""
+        return self._merge(dst, self.rev_indptr, self.rev_indices, self.rev_counts, self.delta_in)
+
+    def remove_src(self, src: int):
+        """Remove every edge leaving src"""
+        for dst in self.out(src):
+            self.set(src, dst, 0)
+
+    def remove_dst(self, dst: int):
+        """Remove every edge entering dst"""
+        for src in self.into(dst):
+            self.set(src, dst, 0)
+
+    def coo(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """All live edges as (src, dst, count) arrays, sorted by src then dst"""
+        self.compact()
+        src = np.repeat(np.arange(len(self.indptr) - 1, dtype=INDEX_DTYPE), np.diff(self.indptr))
+        return src, self.indices, self.counts
+
+    def compact(self):
+        """Merge the delta buffer into the CSR arrays"""
+        if not self.delta_size:
+            return
+        src = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int64), np.diff(self.indptr))
+        dst = self.indices.astype(np.int64)
+        counts = self.counts
+
+        changed_src = np.fromiter((s for s, row in self.delta_out.items() for _ in row),
+                                  dtype=np.int64, count=self.delta_size)
+        changed_dst = np.fromiter((d for row in self.delta_out.values() for d in row),
+                                  dtype=np.int64, count=self.delta_size)
+        changed_counts = np.fromiter((c for row in self.delta_out.values() for c in row.values()),
+                                     dtype=np.int64, count=self.delta_size)
+
+        # Drop base edges overridden by the delta, then append live delta edges
+        width = int(max(dst.max(initial=0), changed_dst.max(initial=0))) + 1
+        keep = ~np.isin(src * width + dst, changed_src * width + changed_dst)
+        live = changed_counts > 0
+        src = np.concatenate([src[keep], changed_src[live]])
+        dst = np.concatenate([dst[keep], changed_dst[live]])
+        counts = np.concatenate([counts[keep], changed_counts[live]]).astype(COUNT_DTYPE)
+
+        num_src = int(max(len(self.indptr) - 1, src.max(initial=-1) + 1))
+        num_dst = int(max(len(self.rev_indptr) - 1, dst.max(initial=-1) + 1))
+        self.indptr, self.indices, self.counts = _build_csr(src, dst, counts, num_src)
+        self.rev_indptr, self.rev_indices, self.rev_counts = _build_csr(dst, src, counts, num_dst)
+        self.delta_out.clear()
+        self.delta_in.clear()
+        self.delta_size = 0
+
+    def nbytes(self) -> int:
+        """Bytes held by the CSR arrays"""
+        arrays = (self.indptr, self.indices, self.counts,
+                  self.rev_indptr, self.rev_indices, self.rev_counts)
+        return sum(a.nbytes for a in arrays)
+
+    def _base_count(self, src: int, dst: int) -> int:
+        if src + 1 >= len(self.indptr):
+            return 0
+        lo, hi = self.indptr[src], self.indptr[src + 1]
+        if lo == hi:
+            return 0
+        pos = lo + self.indices[lo:hi].searchsorted(dst)
+        if pos < hi and self.indices[pos] == dst:
+            return int(self.counts[pos])
+        return 0
+
+    @staticmethod
+    def _merge(node: int, indptr: np.ndarray, indices: np.ndarray, counts: np.ndarray,
+               delta: Dict[int, Dict[int, int]]) -> Dict[int, int]:
+        result: Dict[int, int] = {}
+        if node + 1 < len(indptr):
+            lo, hi = indptr[node], indptr[node + 1]
+            if lo != hi:
+                result = dict(zip(indices[lo:hi].tolist(), counts[lo:hi].tolist()))
+        overrides = delta.get(node)
+        if overrides:
+            for other, count in overrides.items():
+                if count:
+                    result[other] = count
+                else:
+                    result.pop(other, None)
+        return result
+
+
+def _build_csr(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, num_rows: int):
+    """CSR arrays for the given coordinates, columns sorted within each row"""
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(num_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=indptr[1:])
+    return indptr, cols[order].astype(INDEX_DTYPE), values[order]
+
+
+class GraphStore:
+    """Processes, resources and their request/allocation edges"""
+
+    def __init__(self):
+        self.requests = Relation()  # process -> resource: instances requested
+        self.holds = Relation()     # process -> resource: instances held
+        self.process_alive = bytearray()
+        self.resource_alive = bytearray()
+        self.instances = array('i')  # Capacity of each resource
+        self.held = array('i')       # Instances currently allocated per resource
+        # Slots of removed nodes, reused before the arrays grow
+        self.free_processes = array('i')
+        self.free_resources = array('i')
+
+    @property
+    def num_processes(self) -> int:
+        return len(self.process_alive)
+
+    @property
+    def num_resources(self) -> int:
+        return len(self.resource_alive)
+
+    def add_process(self) -> int:
+        """Allocate a process ID, reusing the slot of a removed process if any"""
+        if self.free_processes:
+            pid = self.free_processes.pop()
+            self.process_alive[pid] = 1
+            return pid
+        self.process_alive.append(1)
+        return len(self.process_alive) - 1
+
+    def add_resource(self, instances: int = 1) -> int:
+        """Allocate a resource ID with the given capacity, reusing free slots"""
+        if not 0 < instances <= COUNT_MAX:
+            raise ValueError(f"instances must be between 1 and {COUNT_MAX}, got {instances}")
+        if self.free_resources:
+            rid = self.free_resources.pop()
+            self.resource_alive[rid] = 1
+            self.instances[rid] = instances
+            self.held[rid] = 0
+            return rid
+        self.instances.append(instances)
+        self.held.append(0)
+        self.resource_alive.append(1)
+        return len(self.resource_alive) - 1
+
+    def remove_process(self, pid: int):
+        """Drop a process and all of its edges; the slot becomes reusable"""
+        for rid, count in self.holds.out(pid).items():
+            self.held[rid] -= count
+        self.holds.remove_src(pid)
+        self.requests.remove_src(pid)
+        self.process_alive[pid] = 0
+        self.free_processes.append(pid)
+
+    def remove_resource(self, rid: int):
+        """Drop a resource and all of its edges; the slot becomes reusable"""
+        self.holds.remove_dst(rid)
+        self.requests.remove_dst(rid)
+        self.held[rid] = 0
+        self.instances[rid] = 0
+        self.resource_alive[rid] = 0
+        self.free_resources.append(rid)
+
+    def available(self, rid: int) -> int:
+        return self.instances[rid] - self.held[rid]
+
+    def set_holding(self, pid: int, rid: int, count: int):
+        """Set the number of instances of rid held by pid"""
+        self.held[rid] += count - self.holds.get(pid, rid)
+        self.holds.set(pid, rid, count)
+
+    def compact(self):
+        self.requests.compact()
+        self.holds.compact()
+
+    def wait_successors(self, pid: int) -> List[Tuple[int, int]]:
+        """(holder, resource) pairs for every process pid is waiting for"""
+        result = []
+        for rid in self.requests.out(pid):
+            for holder in self.holds.into(rid):
+                if holder != pid:
+                    result.append((holder, rid))
+        return result
+
+    def wait_for_edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Process-to-process wait-for edges as (waiter, holder, resource)
+        arrays: waiter requests resource and holder holds an instance of it.
+        """
+        req_p, req_r, _ = self.requests.coo()
+        holds = self.holds
+        holds.compact()
+        num_resources = len(holds.rev_indptr) - 1
+        in_range = req_r < num_resources
+        req_p, req_r = req_p[in_range], req_r[in_range]
+
+        # Join each request with every holder of the requested resource
+        starts = holds.rev_indptr[req_r]
+        degree = holds.rev_indptr[req_r + 1] - starts
+        waiter = np.repeat(req_p, degree)
+        resource = np.repeat(req_r, degree)
+        offsets = np.arange(int(degree.sum()), dtype=np.int64) - np.repeat(np.cumsum(degree) - degree, degree)
+        holder = holds.rev_indices[np.repeat(starts, degree) + offsets]
+
+        distinct = waiter != holder
+        return waiter[distinct], holder[distinct], resource[distinct]
+
+    def state_coordinates(self):
+        """
+        The Available vector and the non-zero (rows, cols, counts) of the
+        Allocation and Request matrices, indexed by process and resource ID.
+        """
+        available = np.array(self.instances, dtype=np.int64) - np.array(self.held, dtype=np.int64)
+        allocation = self._padded_coo(self.holds)
+        request = self._padded_coo(self.requests)
+        return available, allocation, request
+
+    def state_matrices(self):
+        """Dense (available, allocation, request), one row per process ID"""
+        available, allocation, request = self.state_coordinates()
+        shape = (self.num_processes, self.num_resources)
+        dense = []
+        for rows, cols, counts in (allocation, request):
+            matrix = np.zeros(shape, dtype=np.int64)
+            matrix[rows, cols] = counts
+            dense.append(matrix)
+        return available, dense[0], dense[1]
+
+    @staticmethod
+    def _padded_coo(relation: Relation):
+        rows, cols, counts = relation.coo()
+        return rows.astype(np.int64), cols.astype(np.int64), counts.astype(np.int64)
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by the store, excluding the delta buffers"""
+        per_node = (len(self.process_alive) + len(self.resource_alive)
+                    + self.instances.itemsize * (len(self.instances) + len(self.held)))
+        return self.requests.nbytes() + self.holds.nbytes() + per_node
+
+    def clear(self):
+        self.__init__()
@@ -0,0 +1,255 @@
+"""
+Incremental (online) cycle detection for the wait-for graph.
+
+The detector keeps a dynamic topological order of the graph's strongly
+connected components using the Pearce-Kelly algorithm; every node of a
+component shares the component's rank.  Inserting an edge that already
+agrees with the order is O(1); otherwise only the nodes ranked between
+the two endpoints are searched and reordered, and if the edge closes a
+cycle the components on it are merged in the same pass.  Removing an edge
+inside a component runs Tarjan's algorithm on that component alone and
+ranks the pieces between its rank and the next one.  A cycle elsewhere
+in the graph therefore adds nothing to the cost of an edit.
+"""
+
+import bisect
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from gui.scc import strongly_connected_components
+
+Node = Hashable
+Adjacency = Dict[Node, Dict[Node, int]]
+
+MIN_GAP = 1e-12  # Relative spacing of ranks below which they are renumbered
+
+
+class IncrementalCycleDetector:
+    def __init__(self):
+        self.order: Dict[Node, float] = {}  # Rank of the node's component
+        self.successors: Adjacency = {}     # Edge multiplicities
+        self.predecessors: Adjacency = {}
+        # Members of each component of several nodes, one set shared by them
+        self.components: Dict[Node, Set[Node]] = {}
+        self.cyclic = 0  # Components of several nodes, plus self-loops
+        # Every rank in use, sorted; ranks of removed nodes linger until compacted
+        self._ranks: List[float] = []
+        self._stale = 0
+
+    def __contains__(self, node: Node) -> bool:
+        return node in self.order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def add_node(self, node: Node):
+        """Add a node at the end of the current topological order"""
+        if node not in self.order:
+            rank = self._ranks[-1] + 1.0 if self._ranks else 0.0
+            self._ranks.append(rank)
+            self.order[node] = rank
+            self.successors[node] = {}
+            self.predecessors[node] = {}
+
+    def remove_node(self, node: Node):
+        """Remove a node together with every edge touching it"""
+        if node not in self.order:
+            return
+        if node in self.successors[node]:
+            self.cyclic -= 1
+        for target in self.successors.pop(node):
+            if target != node:
+                del self.predecessors[target][node]
+        for source in self.predecessors.pop(node):
+            if source != node:
+                del self.successors[source][node]
+        rank = self.order.pop(node)
+        members = self.components.pop(node, None)
+        if members is None:
+            self._stale += 1
+            if self._stale > len(self._ranks) // 2 + 64:
+                self._ranks = sorted(set(self.order.values()))
+                self._stale = 0
+        else:
+            members.discard(node)
+            self._split(members, rank)
+
+    def has_cycle(self) -> bool:
+        return self.cyclic > 0
+
+    def add_edge(self, source: Node, target: Node) -> Optional[List[Node]]:
+        """
+        Insert the edge source -> target.
+        Returns the nodes of the cycle closed by this edge, starting at
+        source, or None if the edge does not close a new cycle.
+        """
+        self.add_node(source)
+        self.add_node(target)
+
+        # Parallel edges only bump the multiplicity
+        targets = self.successors[source]
+        if target in targets:
+            targets[target] += 1
+            return None
+        targets[target] = 1
+        self.predecessors[target][source] = 1
+        if source == target:
+            self.cyclic += 1
+            return [source]
+
+        lower, upper = self.order[target], self.order[source]
+        if upper < lower:
+            return None
+        if upper == lower:
+            # Both ends already share a component
+            path = self._path(target, source, self.components[source])
+            return [source] + path[:-1]
+
+        # Affected region: nodes ranked between target and source
+        forward = self._reachable(target, self.successors, lambda rank: rank <= upper)
+        backward = self._reachable(source, self.predecessors, lambda rank: rank >= lower)
+        if source not in forward:
+            self._reorder(backward, set(), forward)
+            return None
+        # Everything on a path target -> source now forms one component
+        merged = forward & backward
+        self._reorder(backward - merged, merged, forward - merged)
+        path = self._path(target, source, merged)
+        return [source] + path[:-1]
+
+    def remove_edge(self, source: Node, target: Node):
+        """Remove one instance of the edge source -> target"""
+        targets = self.successors.get(source)
+        if not targets or target not in targets:
+            return
+        targets[target] -= 1
+        if targets[target]:
+            return
+        del targets[target]
+        del self.predecessors[target][source]
+        if source == target:
+            self.cyclic -= 1
+        elif self.order[source] == self.order[target]:
+            self._split(self.components[source], self.order[source])
+
+    def _path(self, start: Node, goal: Node, allowed: Set[Node]) -> List[Node]:
+        """Iterative DFS for a path start -> goal through allowed nodes"""
+        parent: Dict[Node, Optional[Node]] = {start: None}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            if node == goal:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = parent[node]
+                path.reverse()
+                return path
+            for neighbour in self.successors[node]:
+                if neighbour not in parent and neighbour in allowed:
+                    parent[neighbour] = node
+                    stack.append(neighbour)
+        raise AssertionError("no path inside a strongly connected component")
+
+    def _reachable(self, start: Node, adjacency: Adjacency, in_region) -> Set[Node]:
+        """Nodes reachable from start whose rank satisfies in_region"""
+        seen: Set[Node] = {start}
+        stack = [start]
+        order = self.order
+        while stack:
+            node = stack.pop()
+            for neighbour in adjacency[node]:
+                if neighbour not in seen and in_region(order[neighbour]):
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        return seen
+
+    def _reorder(self, before: Set[Node], merged: Set[Node], after: Set[Node]):
+        """
+        Rank the components of before, then merged as one component, then
+        after, reusing their ranks and keeping the order within each group
+        """
+        order = self.order
+        groups = [sorted({order[node] for node in nodes}) for nodes in (before, merged, after)]
+        pool = sorted(groups[0] + groups[1] + groups[2])
+        mapping = dict(zip(groups[0], pool))
+        mapping.update(zip(groups[2], pool[len(pool) - len(groups[2]):]))
+        for nodes in (before, after):
+            for node in nodes:
+                order[node] = mapping[order[node]]
+        if not merged:
+            return
+        absorbed = {id(self.components[node]) for node in merged if node in self.components}
+        self.cyclic += 1 - len(absorbed)
+        rank = pool[len(groups[0])]
+        for node in merged:
+            order[node] = rank
+            self.components[node] = merged
+        unused = pool[len(groups[0]) + 1:len(groups[0]) + len(groups[1])]
+        if len(unused) < 64:
+            for value in unused:
+                del self._ranks[bisect.bisect_left(self._ranks, value)]
+        else:
+            dropped = set(unused)
+            self._ranks = [value for value in self._ranks if value not in dropped]
+
+    def _split(self, members: Set[Node], rank: float):
+        """Recompute the components of a former component's members"""
+        self.cyclic -= 1
+        nodes = list(members)
+        index = {node: i for i, node in enumerate(nodes)}
+        indptr, indices = [0], []
+        for node in nodes:
+            indices.extend(index[target] for target in self.successors[node]
+                           if target in index and target != node)
+            indptr.append(len(indices))
+        # Tarjan yields reverse topological order
+        parts = strongly_connected_components(len(nodes), indptr, indices)[::-1]
+        for part, part_rank in zip(parts, self._spread(rank, len(parts), nodes)):
+            group = {nodes[i] for i in part}
+            if len(group) > 1:
+                self.cyclic += 1
+            for node in group:
+                self.order[node] = part_rank
+                if len(group) > 1:
+                    self.components[node] = group
+                else:
+                    self.components.pop(node, None)
+
+    def _spread(self, rank: float, count: int, nodes: Iterable[Node]) -> List[float]:
+        """count ranks from rank up to, not including, the next rank in use"""
+        if count == 1:
+            return [rank]
+        i = bisect.bisect_right(self._ranks, rank)
+        upper = self._ranks[i] if i < len(self._ranks) else rank + 1.0
+        step = (upper - rank) / count
+        if step <= MIN_GAP * max(1.0, abs(rank)):
+            self._renumber()
+            rank = self.order[next(iter(nodes))]
+            i = bisect.bisect_right(self._ranks, rank)
+            step = 1.0 / count
+        ranks = [rank + step * j for j in range(count)]
+        self._ranks[i:i] = ranks[1:]
+        return ranks
+
+    def _renumber(self):
+        """Spread every rank in use one apart again"""
+        live = sorted(set(self.order.values()))
+        mapping = {rank: float(i) for i, rank in enumerate(live)}
+        for node, rank in self.order.items():
+            self.order[node] = mapping[rank]
+        self._ranks = [float(i) for i in range(len(live))]
+        self._stale = 0
+
+    def edges(self) -> List[Tuple[Node, Node]]:
+        """All distinct edges"""
+        return [(s, t) for s, targets in self.successors.items() for t in targets]
+
+    def clear(self):
+        """Remove every node and edge"""
+        self.order.clear()
+        self.successors.clear()
+        self.predecessors.clear()
+        self.components.clear()
+        self.cyclic = 0
+        self._ranks = []
+        self._stale = 0
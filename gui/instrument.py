@@ -0,0 +1,585 @@
+"""
+Deadlock detection for live Python threads.
+
+Lock, RLock, Condition, Semaphore and BoundedSemaphore here are drop-in
+replacements for their threading counterparts that record every
+acquisition, wait and release.  install() swaps them into the threading
+module so that code creating locks through threading.Lock() and friends
+(queue, concurrent.futures, ...) is instrumented without changes.
+
+Recording is one append to a bounded collections.deque, a ring buffer
+whose append and popleft are atomic, so threads never take a lock to
+record.  The fast path of an uncontended acquire is a non-blocking try of
+the underlying lock followed by that append.  Only when the try fails is a "request"
+recorded before blocking.  Releases are recorded before the underlying
+release, so the next owner's acquisition is always recorded after it.
+
+Each acquire and release is still a Python-level call plus a tuple and an
+append: an uncontended Lock pair costs about 0.6 us more than a native one
+and an RLock pair about 0.9 us more, three to four times the native cost
+(benchmarks/lock_overhead.py).  That suits code whose locks are not taken
+in tight loops.
+
+A LockWatcher thread drains the ring into a StreamingDetector.  It first
+drops acquire/release pairs that no thread contended for in between, which
+is nearly all of them, so the detector only sees holds that someone waited
+for.  When a request closes a wait-for cycle the watcher reports the cycle
+with the current stack of every thread on it.  A ring found full at drain
+time may have lost its oldest records, so this counts as an overrun and
+the detector starts over from an empty graph.  Holds taken before that
+point are then unknown, which can hide a deadlock but never invents one.
+
+With lock_order=True the watcher also feeds every acquisition of a Lock or
+RLock to a gui.lockorder.LockOrderGraph, with locks classed by name or
+creation site, and reports lock order inversions before they ever deadlock.
+
+    watcher = instrument.install()       # patch threading, start watching
+    ...
+    python -m gui.instrument script.py   # run a script with both
+    python -m gui.instrument --lock-order script.py
+"""
+
+import _thread
+import argparse
+import itertools
+from collections import deque
+import os
+import runpy
+import sys
+import threading
+import traceback
+import weakref
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# Allow running as a script as well as with python -m
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.graph_store import COUNT_MAX
+from gui.lockorder import LockInversion, LockOrderGraph
+from gui.stream import OPS, StreamingDetector
+
+REQUEST, ACQUIRE, RELEASE, CANCEL = range(4)  # Indices into OPS
+
+get_ident = _thread.get_ident
+allocate_lock = _thread.allocate_lock
+_Condition = threading.Condition  # The originals, kept across install()
+_ORIGINALS = {name: getattr(threading, name)
+              for name in ("Lock", "RLock", "Condition", "Semaphore", "BoundedSemaphore")}
+
+# Ring buffer of (op, thread ident, lock key) records
+_ring: deque = deque(maxlen=1 << 20)
+_record = _ring.append
+_keys = itertools.count(1)
+_instances: Dict[str, int] = {}  # Capacity of semaphores by key
+# Keys of collected semaphores, forgotten once their records are drained
+_retired: deque = deque()
+RETIRED_LIMIT = 1 << 16  # Beyond this nobody is draining: forget at once
+
+
+def set_capacity(records: int):
+    """Resize the ring buffer; call before any locking"""
+    global _ring, _record
+    _ring = deque(maxlen=max(16, records))
+    _record = _ring.append
+
+
+def _key(name: Optional[str], kind: str) -> str:
+    """Unique lock key; its class, before the '#', is the name or creation site"""
+    if name is None:
+        frame = sys._getframe(1)
+        while frame.f_globals is globals():
+            frame = frame.f_back
+        name = f"{kind}@{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno}"
+    return f"{name}#{next(_keys)}"
+
+
+def _retire(key: str):
+    _retired.append(key)
+    if len(_retired) > RETIRED_LIMIT:
+        _instances.pop(_retired.popleft(), None)
+
+
+def lock_class(key: str) -> str:
+    return key.rpartition("#")[0]
+
+
+class Lock:
+    """threading.Lock that records its use"""
+
+    __slots__ = ("_lock", "_owner", "_key", "__weakref__")
+
+    def __init__(self, name: Optional[str] = None):
+        self._lock = allocate_lock()
+        self._owner = None
+        self._key = _key(name, "Lock")
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self._owner = me = get_ident()
+            _record((ACQUIRE, me, self._key))
+            return True
+        if not blocking:
+            return False
+        me = get_ident()
+        _record((REQUEST, me, self._key))
+        if self._lock.acquire(True, timeout):
+            self._owner = me
+            _record((ACQUIRE, me, self._key))
+            return True
+        _record((CANCEL, me, self._key))
+        return False
+
+    def release(self):
+        owner = self._owner
+        if owner is not None:
+            self._owner = None
+            _record((RELEASE, owner, self._key))
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, exc_type, exc, traceback):
+        # release() inlined: a with block is the common case
+        owner = self._owner
+        if owner is not None:
+            self._owner = None
+            _record((RELEASE, owner, self._key))
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def _is_owned(self) -> bool:
+        return self._lock.locked()
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._owner = None
+
+    def __repr__(self):
+        return f"<instrumented {'locked' if self.locked() else 'unlocked'} Lock {self._key}>"
+
+
+class RLock:
+    """threading.RLock that records its outermost acquire and release"""
+
+    __slots__ = ("_lock", "_owner", "_count", "_key", "__weakref__")
+
+    def __init__(self, name: Optional[str] = None):
+        self._lock = allocate_lock()
+        self._owner = None
+        self._count = 0
+        self._key = _key(name, "RLock")
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        me = get_ident()
+        if self._owner == me:
+            self._count += 1
+            return True
+        if self._lock.acquire(False):
+            _record((ACQUIRE, me, self._key))
+        elif not blocking:
+            return False
+        else:
+            _record((REQUEST, me, self._key))
+            if not self._lock.acquire(True, timeout):
+                _record((CANCEL, me, self._key))
+                return False
+            _record((ACQUIRE, me, self._key))
+        self._owner = me
+        self._count = 1
+        return True
+
+    def release(self):
+        me = get_ident()
+        if self._owner != me:
+            raise RuntimeError("cannot release un-acquired lock")
+        count = self._count = self._count - 1
+        if not count:
+            _record((RELEASE, me, self._key))
+            self._owner = None
+            self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, exc_type, exc, traceback):
+        # release() inlined, as in Lock
+        me = get_ident()
+        if self._owner != me:
+            raise RuntimeError("cannot release un-acquired lock")
+        count = self._count = self._count - 1
+        if not count:
+            _record((RELEASE, me, self._key))
+            self._owner = None
+            self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    # Used by Condition to release and restore a recursive hold around wait()
+    def _is_owned(self) -> bool:
+        return self._owner == get_ident()
+
+    def _release_save(self) -> Tuple[int, Optional[int]]:
+        if self._owner != get_ident():
+            raise RuntimeError("cannot release un-acquired lock")
+        state = (self._count, self._owner)
+        _record((RELEASE, self._owner, self._key))
+        self._count = 0
+        self._owner = None
+        self._lock.release()
+        return state
+
+    def _acquire_restore(self, state: Tuple[int, Optional[int]]):
+        count, owner = state
+        if self._lock.acquire(False):
+            _record((ACQUIRE, owner, self._key))
+        else:
+            _record((REQUEST, owner, self._key))
+            self._lock.acquire()
+            _record((ACQUIRE, owner, self._key))
+        self._count = count
+        self._owner = owner
+
+    def _at_fork_reinit(self):
+        self._lock._at_fork_reinit()
+        self._owner = None
+        self._count = 0
+
+    def __repr__(self):
+        return f"<instrumented RLock {self._key} owner={self._owner} count={self._count}>"
+
+
+class Condition(_Condition):
+    """threading.Condition over an instrumented RLock by default"""
+
+    def __init__(self, lock=None):
+        super().__init__(RLock() if lock is None else lock)
+
+
+class Semaphore:
+    """
+    threading.Semaphore that records which thread holds each unit.  A
+    release by a thread that holds no unit (a producer signalling a
+    consumer, say) is booked against the longest-standing holder.
+    Releases may raise the value past its initial one, so the detector
+    is given an unbounded capacity and never rejects an acquisition.
+    """
+
+    def __init__(self, value: int = 1, name: Optional[str] = None):
+        if value < 0:
+            raise ValueError("semaphore initial value must be >= 0")
+        self._cond = _Condition(allocate_lock())
+        self._value = value
+        self._holders: Dict[int, int] = {}  # Thread ident -> units held, in acquisition order
+        self._key = _key(name, type(self).__name__)
+        _instances[self._key] = COUNT_MAX
+        weakref.finalize(self, _retire, self._key)
+
+    def acquire(self, blocking: bool = True, timeout: Optional[float] = None) -> bool:
+        if not blocking and timeout is not None:
+            raise ValueError("can't specify timeout for non-blocking acquire")
+        me = get_ident()
+        with self._cond:
+            if self._value <= 0:
+                if not blocking:
+                    return False
+                _record((REQUEST, me, self._key))
+                if not self._cond.wait_for(self._available, timeout):
+                    _record((CANCEL, me, self._key))
+                    return False
+            self._value -= 1
+            self._holders[me] = self._holders.get(me, 0) + 1
+            _record((ACQUIRE, me, self._key))
+            return True
+
+    def _available(self) -> bool:
+        return self._value > 0
+
+    def release(self, n: int = 1):
+        if n < 1:
+            raise ValueError("n must be one or more")
+        me = get_ident()
+        with self._cond:
+            self._check_release(n)
+            holders = self._holders
+            for _ in range(n):
+                owner = me if me in holders else next(iter(holders), None)
+                if owner is None:
+                    break
+                _record((RELEASE, owner, self._key))
+                if holders[owner] == 1:
+                    del holders[owner]
+                else:
+                    holders[owner] -= 1
+            self._value += n
+            self._cond.notify(n)
+
+    def _check_release(self, n: int):
+        pass
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def __repr__(self):
+        return f"<instrumented {type(self).__name__} {self._key} value={self._value}>"
+
+
+class BoundedSemaphore(Semaphore):
+    """threading.BoundedSemaphore that records which thread holds each unit"""
+
+    def __init__(self, value: int = 1, name: Optional[str] = None):
+        super().__init__(value, name)
+        self._initial_value = value
+        _instances[self._key] = max(1, value)  # Never exceeded
+
+    def _check_release(self, n: int):
+        if self._value + n > self._initial_value:
+            raise ValueError("Semaphore released too many times")
+
+
+class LockDeadlock(NamedTuple):
+    cycle: List[Tuple[str, str]]  # (thread, lock it waits for) in wait order
+    stacks: Dict[str, str]        # Formatted stack of each thread on the cycle
+
+    def format(self) -> str:
+        lines = ["Deadlock: " + " -> ".join(f"{thread} waits for {lock}"
+                                            for thread, lock in self.cycle)]
+        for thread, stack in self.stacks.items():
+            lines.append(f"\nThread {thread}:\n{stack}")
+        return "\n".join(lines)
+
+
+def _print_deadlock(report: LockDeadlock):
+    print(report.format(), file=sys.stderr, flush=True)
+
+
+class LockWatcher:
+    """Background thread that drains the ring buffer into a detector"""
+
+    def __init__(self, interval: float = 0.02,
+                 on_deadlock: Optional[Callable[[LockDeadlock], None]] = None,
+                 lock_order: bool = False,
+                 on_inversion: Optional[Callable[[LockInversion], None]] = None):
+        self.interval = interval
+        self.on_deadlock = on_deadlock or _print_deadlock
+        self.on_inversion = on_inversion or self._print_inversion
+        self.streaming = StreamingDetector()
+        # Lock order by creation site (or name), checked on every acquisition
+        self.lock_order = LockOrderGraph(lock_class) if lock_order else None
+        self.thread_names: Dict[int, str] = {}  # Threads seen alive at a drain
+        self.requested = set()  # (thread, lock key) validated at a request, not yet granted
+        self.events = 0
+        self.applied = 0
+        self.overruns = 0
+        self.deadlocks = 0
+        self.waiting = set()  # (thread, lock key) of requests not yet granted or cancelled
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'LockWatcher':
+        self._thread = threading.Thread(target=self._run, name="LockWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.drain()
+        self.drain()
+
+    def drain(self) -> List[LockDeadlock]:
+        """Apply every complete record written since the last drain"""
+        ring = _ring
+        if len(ring) == ring.maxlen:
+            # The writers may have overwritten records: start over from here
+            self.overruns += 1
+            self.streaming = StreamingDetector()
+            self.waiting.clear()
+            if self.lock_order is not None:
+                self.lock_order.held.clear()
+                self.requested.clear()
+        # Semaphores collected before the batch was taken have no records after it
+        retired = [_retired.popleft() for _ in range(len(_retired))]
+        popleft = ring.popleft
+        batch = [popleft() for _ in range(len(ring))]
+        self.events += len(batch)
+        if self.lock_order is not None:
+            self._check_order(batch)
+
+        reports = []
+        streaming = self.streaming
+        apply = streaming.apply
+        for op, ident, key in self._coalesce(batch):
+            self.applied += 1
+            cycle = apply(OPS[op], ident, key, None, _instances.get(key, 1))
+            if cycle:
+                reports.append(self._report(streaming.describe(cycle)))
+        for key in retired:
+            _instances.pop(key, None)
+        for report in reports:
+            self.deadlocks += 1
+            self.on_deadlock(report)
+        return reports
+
+    def _check_order(self, batch: list):
+        """
+        Feed every acquisition attempt and release of a lock to the lock
+        order graph.  Semaphores are left out, as in lockdep: any thread
+        may release them, so the order they are taken in says nothing
+        about deadlocks (a worker blocking on Semaphore(0) while holding a
+        lock is normal).
+        """
+        graph = self.lock_order
+        if len(self.thread_names) > 10_000:
+            self.thread_names.clear()
+        self.thread_names.update((thread.ident, thread.name) for thread in threading.enumerate())
+        requested = self.requested
+        semaphores = _instances
+        for op, ident, key in batch:
+            if key in semaphores:
+                continue
+            if op == ACQUIRE:
+                if (ident, key) in requested:
+                    requested.discard((ident, key))  # Validated at the request
+                    continue
+            elif op == REQUEST:
+                requested.add((ident, key))
+            else:
+                requested.discard((ident, key))
+                graph.release(ident, key)
+                continue
+            inversion = graph.acquire(ident, key)
+            if inversion is not None:
+                self.on_inversion(inversion)
+
+    def thread_name(self, ident: int) -> str:
+        return f"{self.thread_names.get(ident, 'thread')} ({ident})"
+
+    def _print_inversion(self, inversion: LockInversion):
+        print(inversion.format(self.thread_name), file=sys.stderr, flush=True)
+
+    def _coalesce(self, batch: list) -> list:
+        """
+        Drop acquire/release pairs of a lock that nobody requested in
+        between.  An acquire that grants a pending request is kept, or the
+        request would be left waiting in the graph.
+        """
+        waiting = self.waiting
+        held: Dict[str, Dict[int, int]] = {}  # Lock key -> thread -> index of its acquire
+        dropped = set()
+        for index, (op, ident, key) in enumerate(batch):
+            if op == ACQUIRE:
+                if (ident, key) in waiting:
+                    waiting.discard((ident, key))
+                else:
+                    held.setdefault(key, {})[ident] = index
+            elif op == RELEASE:
+                start = held.get(key, {}).pop(ident, None)
+                if start is not None:
+                    dropped.add(start)
+                    dropped.add(index)
+            elif op == REQUEST:
+                waiting.add((ident, key))
+                held.pop(key, None)  # Contended: these holds matter
+            else:
+                waiting.discard((ident, key))
+        if not dropped:
+            return batch
+        return [record for index, record in enumerate(batch) if index not in dropped]
+
+    @staticmethod
+    def _report(steps: List[Tuple[int, str]]) -> LockDeadlock:
+        frames = sys._current_frames()
+        threads = {thread.ident: thread.name for thread in threading.enumerate()}
+        cycle, stacks = [], {}
+        for ident, key in steps:
+            name = f"{threads.get(ident, 'exited')} ({ident})"
+            cycle.append((name, key))
+            frame = frames.get(ident)
+            stacks[name] = "".join(traceback.format_stack(frame)) if frame else "  (no stack)\n"
+        return LockDeadlock(cycle, stacks)
+
+    def stats(self) -> dict:
+        return {
+            "events": self.events,
+            "applied": self.applied,
+            "overruns": self.overruns,
+            "deadlocks": self.deadlocks,
+            "inversions": len(self.lock_order.inversions) if self.lock_order else 0,
+            "capacity": _ring.maxlen,
+        }
+
+
+_watcher: Optional[LockWatcher] = None
+
+
+def install(watch: bool = True, **watcher_options) -> Optional[LockWatcher]:
+    """
+    Replace the threading lock types with the instrumented ones and, with
+    watch=True, start a LockWatcher.  Only locks created afterwards are
+    instrumented, and modules that imported the names directly
+    (from threading import Lock) keep the originals.
+    """
+    global _watcher
+    if watch and _watcher is None:
+        _watcher = LockWatcher(**watcher_options).start()
+    threading.Lock = Lock
+    threading.RLock = RLock
+    threading.Condition = Condition
+    threading.Semaphore = Semaphore
+    threading.BoundedSemaphore = BoundedSemaphore
+    return _watcher
+
+
+def uninstall():
+    """Restore the threading lock types and stop the watcher"""
+    global _watcher
+    for name, original in _ORIGINALS.items():
+        setattr(threading, name, original)
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a Python script with lock deadlock detection")
+    parser.add_argument("script", help="script to run")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments for the script")
+    parser.add_argument("--interval", type=float, default=0.02,
+                        help="seconds between ring buffer drains (default 0.02)")
+    parser.add_argument("--capacity", type=int, default=1 << 20,
+                        help="ring buffer records (default 1048576)")
+    parser.add_argument("--lock-order", action="store_true",
+                        help="also report lock order inversions that could deadlock")
+    args = parser.parse_args(argv)
+
+    set_capacity(args.capacity)
+    watcher = install(interval=args.interval, lock_order=args.lock_order)
+    sys.argv = [args.script] + args.args
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        uninstall()  # Stops the watcher after a last drain
+        stats = watcher.stats()
+        print(f"lock events: {stats['events']} applied: {stats['applied']} "
+              f"overruns: {stats['overruns']} deadlocks: {stats['deadlocks']} "
+              f"inversions: {stats['inversions']}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    # Patch with the gui.instrument module, not this __main__ copy of it,
+    # so the script shares its ring buffer and types
+    from gui import instrument
+    sys.exit(instrument.main())
@@ -0,0 +1,265 @@
+"""
+Force-directed graph layout that persists across edits.
+
+force_layout() is a Fruchterman-Reingold layout in NumPy: edges attract,
+every pair of nodes repels, and each step moves nodes by at most a
+cooling temperature.  Up to EXACT_LIMIT nodes the repulsion is computed
+for all pairs at once; beyond that it uses a Barnes-Hut quadtree, so a
+step costs O(n log n).  The quadtree is built from the nodes' Morton cells
+at every level, with a table of each cell's children.  Its traversal is
+vectorized too: all (node, cell) pairs of one level are tested together,
+and a pair is either accepted (far enough to use the cell's centre of
+mass) or expanded into the cell's children.
+
+IncrementalLayout keeps positions between calls.  New nodes start next
+to their placed neighbours and only they are relaxed, for a few steps
+against the fixed rest of the graph.  The quadtree of the fixed nodes is
+built once for all those steps, so adding a node to a large graph moves
+nothing else and costs a few tree walks for that node.
+A full layout is capped at `node_steps` node moves in total, so a bulk
+import of a huge graph gets a few steps rather than minutes of them.
+"""
+
+from typing import Dict, Hashable, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+EXACT_LIMIT = 400   # Largest graph whose repulsion is computed pair by pair
+THETA = 0.8         # Barnes-Hut opening angle: cell width / distance
+MIN_DISTANCE = 1e-3
+
+
+def _exact_repulsion(pos: np.ndarray, query: np.ndarray, k2: float) -> np.ndarray:
+    delta = pos[query, None, :] - pos[None, :, :]
+    dist2 = np.maximum((delta ** 2).sum(axis=2), MIN_DISTANCE ** 2)
+    dist2[np.arange(len(query)), query] = np.inf
+    return k2 * (delta / dist2[:, :, None]).sum(axis=1)
+
+
+def _quadtree(pos: np.ndarray, depth: int):
+    """
+    Per level: sorted cell keys, each point's cell, the cells' point counts,
+    centres of mass and width, and their four children's cell indices at
+    the next level (-1 where empty)
+    """
+    low = pos.min(axis=0)
+    width = max(float((pos.max(axis=0) - low).max()), MIN_DISTANCE) * (1 + 1e-9)
+    side = 1 << depth
+    cells = np.minimum(((pos - low) / width * side).astype(np.int64), side - 1)
+    levels = []
+    for level in range(depth + 1):
+        shift = depth - level
+        keys = ((cells[:, 0] >> shift) << level) | (cells[:, 1] >> shift)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        mass = np.bincount(inverse).astype(float)
+        center = np.stack([np.bincount(inverse, pos[:, 0]), np.bincount(inverse, pos[:, 1])], axis=1)
+        levels.append([unique, inverse, mass, center / mass[:, None], width / (1 << level), None])
+    for level in range(depth):
+        parent, child_keys = levels[level][0], levels[level + 1][0]
+        px, py = parent >> level, parent & ((1 << level) - 1)
+        children = np.empty((len(parent), 4), dtype=np.int64)
+        for quadrant, (dx, dy) in enumerate(((0, 0), (0, 1), (1, 0), (1, 1))):
+            key = ((2 * px + dx) << (level + 1)) | (2 * py + dy)
+            index = np.minimum(np.searchsorted(child_keys, key), len(child_keys) - 1)
+            children[:, quadrant] = np.where(child_keys[index] == key, index, -1)
+        levels[level][5] = children
+    return levels
+
+
+def _depth(n: int) -> int:
+    return int(min(16, max(2, np.ceil(np.log2(max(n, 2)) / 2) + 2)))
+
+
+def _tree_repulsion(levels: list, points: np.ndarray, members: Optional[np.ndarray], k2: float,
+                    theta: float = THETA) -> np.ndarray:
+    """
+    Repulsion on points from the nodes of a quadtree; members holds each
+    point's node index in the tree, or is None if none of them is in it
+    """
+    depth = len(levels) - 1
+    x, y = np.ascontiguousarray(points[:, 0]), np.ascontiguousarray(points[:, 1])
+    force = np.zeros((len(points), 2))
+    # Frontier of (point row, cell index at the current level)
+    rows = np.arange(len(points))
+    cells = np.zeros(len(points), dtype=np.int64)
+    for level, (keys, inverse, mass, center, width, children) in enumerate(levels):
+        dx = x[rows] - center[cells, 0]
+        dy = y[rows] - center[cells, 1]
+        dist2 = np.maximum(dx * dx + dy * dy, MIN_DISTANCE ** 2)
+        # A point's own cell is always opened; at the leaves that leaves out
+        # the other points sharing its leaf
+        if members is None:
+            accept = np.ones(len(rows), dtype=bool)
+        else:
+            accept = inverse[members[rows]] != cells
+        if level < depth:
+            accept &= width * width < theta * theta * dist2
+        taken = np.flatnonzero(accept)
+        weight = k2 * mass[cells[taken]] / dist2[taken]
+        targets = rows[taken]
+        force[:, 0] += np.bincount(targets, weight * dx[taken], minlength=len(points))
+        force[:, 1] += np.bincount(targets, weight * dy[taken], minlength=len(points))
+        if level == depth:
+            break
+        opened = np.flatnonzero(~accept)
+        # Expand the opened cells into their existing children
+        table = children[cells[opened]]
+        exists = table >= 0
+        rows = np.broadcast_to(rows[opened, None], table.shape)[exists]
+        cells = table[exists]
+    return force
+
+
+def _barnes_hut_repulsion(pos: np.ndarray, query: np.ndarray, k2: float,
+                          theta: float = THETA) -> np.ndarray:
+    levels = _quadtree(pos, _depth(len(pos)))
+    return _tree_repulsion(levels, pos[query], query, k2, theta)
+
+
+def _repulsion(pos: np.ndarray, query: np.ndarray, k2: float) -> np.ndarray:
+    if len(pos) <= EXACT_LIMIT:
+        return _exact_repulsion(pos, query, k2)
+    return _barnes_hut_repulsion(pos, query, k2)
+
+
+def _step(pos: np.ndarray, edges: np.ndarray, movable: Optional[np.ndarray], k: float,
+          temperature: float, fixed: Optional[list] = None):
+    query = np.arange(len(pos)) if movable is None else movable
+    force = np.zeros_like(pos)
+    if fixed is None:
+        force[query] = _repulsion(pos, query, k * k)
+    else:
+        # The fixed nodes' quadtree is built once; the movable ones repel each other
+        moving = pos[query]
+        force[query] = (_tree_repulsion(fixed, moving, None, k * k)
+                        + _repulsion(moving, np.arange(len(query)), k * k))
+    if len(edges):
+        delta = pos[edges[:, 0]] - pos[edges[:, 1]]
+        dist = np.maximum(np.sqrt((delta ** 2).sum(axis=1)), MIN_DISTANCE)
+        pull = delta * (dist / k)[:, None]
+        np.add.at(force, edges[:, 0], -pull)
+        np.add.at(force, edges[:, 1], pull)
+    step = force[query]
+    length = np.maximum(np.sqrt((step ** 2).sum(axis=1)), MIN_DISTANCE)
+    pos[query] += step * (np.minimum(length, temperature) / length)[:, None]
+
+
+def force_layout(num_nodes: int, edges: np.ndarray, pos: Optional[np.ndarray] = None,
+                 movable: Optional[np.ndarray] = None, iterations: int = 50,
+                 temperature: Optional[float] = None, seed: int = 0) -> np.ndarray:
+    """
+    Positions (num_nodes x 2) after `iterations` force steps.  edges is an
+    (m x 2) array of node indices; only `movable` nodes move if given.  The
+    ideal edge length is 1, so the layout spans about sqrt(num_nodes).
+    """
+    rng = np.random.default_rng(seed)
+    if pos is None:
+        pos = rng.random((num_nodes, 2)) * np.sqrt(max(num_nodes, 1))
+    else:
+        pos = np.array(pos, dtype=float)
+    if num_nodes < 2:
+        return pos
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    if temperature is None:
+        temperature = 0.1 * np.sqrt(num_nodes)
+    fixed = None
+    if movable is not None and num_nodes > EXACT_LIMIT:
+        rest = np.ones(num_nodes, dtype=bool)
+        rest[movable] = False
+        if rest.any():
+            fixed = _quadtree(pos[rest], _depth(int(rest.sum())))
+    cooling = temperature / (iterations + 1)
+    for _ in range(iterations):
+        _step(pos, edges, movable, 1.0, temperature, fixed)
+        temperature -= cooling
+    return pos
+
+
+class IncrementalLayout:
+    """Node positions that survive graph edits; only new nodes are placed"""
+
+    def __init__(self, iterations: int = 50, relax_steps: int = 15, node_steps: int = 250_000,
+                 seed: int = 0):
+        self.iterations = iterations
+        self.node_steps = node_steps
+        self.relax_steps = relax_steps
+        self.rng = np.random.default_rng(seed)
+        self.positions: Dict[Hashable, Tuple[float, float]] = {}
+        self.version = 0
+        # Statistics of the last update
+        self.placed = 0
+        self.relaid = False
+
+    def update(self, nodes: Sequence[Hashable], edges: Iterable[Tuple[Hashable, Hashable]]
+               ) -> Dict[Hashable, Tuple[float, float]]:
+        """Positions for the graph's nodes, keeping those already placed"""
+        index = {node: i for i, node in enumerate(nodes)}
+        positions = self.positions
+        new = [i for i, node in enumerate(nodes) if node not in positions]
+        known = len(nodes) - len(new)
+        stale = len(positions) != known
+        self.placed = len(new)
+        self.relaid = False
+        if not new:
+            if stale:
+                self.positions = {node: positions[node] for node in nodes}
+                self.version += 1
+            return self.positions
+
+        n = len(nodes)
+        if known < 2 or len(new) > n // 2:
+            # Mostly new: lay out everything, keeping old positions as the start
+            pairs = np.array([(index[a], index[b]) for a, b in edges], dtype=np.int64).reshape(-1, 2)
+            pos = self.rng.random((n, 2)) * np.sqrt(n)
+            rows = [i for i, node in enumerate(nodes) if node in positions]
+            if rows:
+                pos[rows] = [positions[nodes[i]] for i in rows]
+            iterations = max(1, min(self.iterations, self.node_steps // n))
+            pos = force_layout(n, pairs, pos, iterations=iterations)
+            self.positions = {node: (float(x), float(y)) for node, (x, y) in zip(nodes, pos.tolist())}
+            self.relaid = True
+        else:
+            # Only the new nodes' edges pull; fixed nodes would not move anyway
+            added = {nodes[i] for i in new}
+            pairs = np.array([(index[a], index[b]) for a, b in edges if a in added or b in added],
+                             dtype=np.int64).reshape(-1, 2)
+            pos = np.array([positions.get(node, (0.0, 0.0)) for node in nodes], dtype=float)
+            movable = np.array(new, dtype=np.int64)
+            self._seed(pos, pairs, movable)
+            pos = force_layout(n, pairs, pos, movable=movable, iterations=self.relax_steps,
+                               temperature=0.5, seed=int(self.rng.integers(1 << 30)))
+            # Everything else stayed put
+            if stale:
+                self.positions = {node: positions[node] for node in nodes if node in positions}
+            else:
+                self.positions = dict(positions)
+            for i, (x, y) in zip(new, pos[movable].tolist()):
+                self.positions[nodes[i]] = (x, y)
+        self.version += 1
+        return self.positions
+
+    def _seed(self, pos: np.ndarray, pairs: np.ndarray, new: np.ndarray, rounds: int = 3):
+        """
+        Start new nodes at the mean of their placed neighbours, spreading
+        outwards for a few rounds; the rest go beside the layout
+        """
+        placed = np.ones(len(pos), dtype=bool)
+        placed[new] = False
+        low, high = pos[placed].min(axis=0), pos[placed].max(axis=0)
+        both = np.concatenate([pairs, pairs[:, ::-1]])
+        for _ in range(rounds):
+            usable = both[~placed[both[:, 0]] & placed[both[:, 1]]]
+            if not len(usable):
+                break
+            targets, sources = usable[:, 0], usable[:, 1]
+            counts = np.bincount(targets, minlength=len(pos))
+            reached = np.flatnonzero(counts)
+            for axis in (0, 1):
+                sums = np.bincount(targets, pos[sources, axis], minlength=len(pos))
+                pos[reached, axis] = sums[reached] / counts[reached]
+            pos[reached] += self.rng.normal(0, 0.5, (len(reached), 2))
+            placed[reached] = True
+        rest = np.flatnonzero(~placed)
+        pos[rest, 0] = high[0] + 1.0 + self.rng.random(len(rest))
+        pos[rest, 1] = self.rng.uniform(low[1], high[1], len(rest))
@@ -0,0 +1,208 @@
+"""
+Lock-order validation in the style of the Linux kernel's lockdep.
+
+DeadlockDetector only sees a deadlock once the threads are stuck in it.
+LockOrderGraph instead records, for every acquisition, that each lock
+already held by the thread was taken before the new one ("held A while
+acquiring B").  Locks are aggregated by class, e.g. the creation site, so
+one observed A -> B order covers every pair of locks of those classes.  The
+first time an edge closes a cycle in this order graph, some interleaving of
+the threads could deadlock, and the inversion is reported even if this run
+never deadlocks.
+
+The order graph is an IncrementalCycleDetector over lock classes, so a new
+edge only searches the part of the order it could violate.  Most
+acquisitions repeat a known nesting.  Each distinct stack of held classes
+gets a chain id, interned by (parent chain, class), and an acquisition
+whose chain is known takes one dict lookup and needs no validation.
+Nesting two locks of one class is not an ordering and is not checked.
+
+Validation happens when an acquisition is attempted (a "request" event,
+or "acquire" when it was not contended), so an inversion that does
+deadlock is still reported.
+
+    python -m gui.lockorder trace.jsonl
+    python -m gui.lockorder --class-sep "#" trace.csv
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Callable, Dict, Hashable, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+# Allow running as a script as well as with python -m
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.incremental import IncrementalCycleDetector
+from gui.stream import Event, guess_format, read_events
+
+
+class LockInversion(NamedTuple):
+    cycle: List[Hashable]  # Lock classes, each taken before the next one somewhere
+    edges: List[tuple]     # (before, after, thread, where) of each order edge on the cycle
+
+    def format(self, thread_name: Callable[[Hashable], str] = str) -> str:
+        lines = ["Possible deadlock, lock order inversion: "
+                 + " -> ".join(str(cls) for cls in self.cycle + self.cycle[:1])]
+        for before, after, thread, where in self.edges:
+            seen = f" at {where}" if where is not None else ""
+            lines.append(f"  {after} taken while holding {before} by {thread_name(thread)}{seen}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "cycle": [str(cls) for cls in self.cycle],
+            "edges": [{"held": str(before), "acquired": str(after), "thread": str(thread),
+                       "where": where} for before, after, thread, where in self.edges],
+        }
+
+
+class LockOrderGraph:
+    """Observed lock nesting by class, checked for inversions as it grows"""
+
+    def __init__(self, classify: Optional[Callable[[Hashable], Hashable]] = None):
+        self.classify = classify
+        self.order = IncrementalCycleDetector()
+        self.first_seen: Dict[Tuple[Hashable, Hashable], tuple] = {}  # Edge -> (thread, where)
+        self.chains: Dict[tuple, int] = {}  # (parent chain id, class) -> chain id
+        # Per thread: (lock, class, chain id) for every held lock, oldest first
+        self.held: Dict[Hashable, List[Tuple[Hashable, Hashable, int]]] = {}
+        self.inversions: List[LockInversion] = []
+        self._reported: Set[frozenset] = set()
+        # Statistics
+        self.acquisitions = 0
+        self.validations = 0
+
+    def acquire(self, thread: Hashable, lock: Hashable, where=None) -> Optional[LockInversion]:
+        """
+        Record that thread takes (or tries to take) lock while holding its
+        current locks.  Returns the inversion this closes, if new.
+        """
+        self.acquisitions += 1
+        cls = lock if self.classify is None else self.classify(lock)
+        stack = self.held.get(thread)
+        if stack is None:
+            stack = self.held[thread] = []
+        key = (stack[-1][2] if stack else -1, cls)
+        chain = self.chains.get(key)
+        if chain is not None:
+            stack.append((lock, cls, chain))
+            return None
+
+        self.chains[key] = chain = len(self.chains)
+        stack.append((lock, cls, chain))
+        self.validations += 1
+        found = None
+        for _, before, _ in stack[:-1]:
+            if before == cls or (before, cls) in self.first_seen:
+                continue
+            self.first_seen[(before, cls)] = (thread, where)
+            cycle = self.order.add_edge(before, cls)
+            if cycle and found is None:
+                found = self._inversion(cycle)
+        return found
+
+    def release(self, thread: Hashable, lock: Hashable):
+        """Record that thread no longer holds (or waits for) lock"""
+        stack = self.held.get(thread)
+        if not stack:
+            return
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i][0] == lock:
+                break
+        else:
+            return
+        del stack[i]
+        # Locks taken after it now sit on a shorter chain; their pairs are
+        # already in the order graph
+        for j in range(i, len(stack)):
+            key = (stack[j - 1][2] if j else -1, stack[j][1])
+            chain = self.chains.get(key)
+            if chain is None:
+                self.chains[key] = chain = len(self.chains)
+            stack[j] = stack[j][:2] + (chain,)
+        if not stack:
+            del self.held[thread]
+
+    def holds(self, thread: Hashable, lock: Hashable) -> bool:
+        return any(entry[0] == lock for entry in self.held.get(thread, ()))
+
+    def _inversion(self, cycle: List[Hashable]) -> Optional[LockInversion]:
+        key = frozenset(cycle)
+        if key in self._reported:
+            return None
+        self._reported.add(key)
+        edges = []
+        for i, before in enumerate(cycle):
+            after = cycle[(i + 1) % len(cycle)]
+            edges.append((before, after) + self.first_seen.get((before, after), (None, None)))
+        inversion = LockInversion(cycle, edges)
+        self.inversions.append(inversion)
+        return inversion
+
+    def feed(self, event: Event, where=None) -> Optional[LockInversion]:
+        """Apply one trace event; requests and uncontended acquires are validated"""
+        if event.op == "request" or (event.op == "acquire"
+                                     and not self.holds(event.process, event.resource)):
+            return self.acquire(event.process, event.resource, where)
+        if event.op in ("release", "cancel"):
+            self.release(event.process, event.resource)
+        return None
+
+    def run(self, events: Iterable[Event]) -> Iterator[LockInversion]:
+        """Yield every new inversion in a trace, tagged with its event index"""
+        for index, event in enumerate(events):
+            inversion = self.feed(event, index)
+            if inversion is not None:
+                yield inversion
+
+    def stats(self) -> dict:
+        return {
+            "acquisitions": self.acquisitions,
+            "validations": self.validations,
+            "classes": len(self.order.order),
+            "order_edges": len(self.first_seen),
+            "chains": len(self.chains),
+            "inversions": len(self.inversions),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Report lock order inversions in lock-event traces")
+    parser.add_argument("paths", nargs="*", default=["-"],
+                        help="trace files, '-' for stdin (default)")
+    parser.add_argument("--format", choices=("jsonl", "csv"),
+                        help="trace format (default: from extension, jsonl for stdin)")
+    parser.add_argument("--class-sep",
+                        help="lock class is the resource name up to the last occurrence of this "
+                             "separator (default: every resource is its own class)")
+    args = parser.parse_args(argv)
+
+    classify = None
+    if args.class_sep:
+        sep = args.class_sep
+        classify = lambda name: name.rpartition(sep)[0] or name
+    graph = LockOrderGraph(classify)
+    for path in args.paths:
+        fmt = args.format or ("jsonl" if path == "-" else guess_format(path))
+        source = sys.stdin if path == "-" else open(path, newline="")
+        try:
+            for inversion in graph.run(read_events(source, fmt)):
+                print(json.dumps(inversion.to_dict()), flush=True)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+    stats = graph.stats()
+    print(f"{stats['acquisitions']} acquisitions, {stats['validations']} validated, "
+          f"{stats['classes']} lock classes, {stats['order_edges']} order edges, "
+          f"{stats['inversions']} inversions", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
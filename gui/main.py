@@ -215,69 +215,22 @@ class DeadlockDetectionSimulator:
             self.check_button.animate_result(False)
             return
 
-        # Build adjacency list for the graph
-        adjacency_list = {}
-        for process in processes:
-            adjacency_list[process] = []
-            # Add edges for resources this process is requesting
-            for resource in process.requesting:
-                # Find processes that have this resource allocated
-                for other_process in processes:
-                    if resource in other_process.allocated:
-                        adjacency_list[process].append(other_process)
-
-        # Check each process for deadlock using DFS
-        def find_cycle(start_process):
-            visited = set()
-            path = []
-            cycle_found = [False]
-            cycle_nodes = []
-
-            def dfs(current, path_so_far):
-                if current in path_so_far:
-                    # Found a cycle
-                    cycle_start = path_so_far.index(current)
-                    cycle_nodes.extend(path_so_far[cycle_start:])
-                    cycle_found[0] = True
-                    return
-                
-                if current in visited or cycle_found[0]:
-                    return
-
-                visited.add(current)
-                path_so_far.append(current)
-
-                for next_process in adjacency_list[current]:
-                    dfs(next_process, path_so_far)
-
-                if not cycle_found[0]:
-                    path_so_far.pop()
-
-            dfs(start_process, path)
-            return cycle_nodes
-
-        # Check each process for deadlock
-        for start_process in processes:
-            cycle = find_cycle(start_process)
-            if cycle:
-                # Highlight the cycle with bright orange color and glow effect
-                deadlock_color = (255, 165, 0)  # Bright orange
-                for process in cycle:
+        # Highlight every deadlocked set with bright orange color and glow effect
+        deadlocks = self.detector.find_deadlocks()
+        if deadlocks:
+            deadlock_color = (255, 165, 0)  # Bright orange
+            for deadlock in deadlocks:
+                for process in deadlock.processes:
                     process.color = deadlock_color
                     process.has_glow = True  # Enable glow effect
-                    # Highlight the edges (resources) involved in the cycle
-                    for i in range(len(cycle)):
-                        current = cycle[i]
-                        next_process = cycle[(i + 1) % len(cycle)]
-                        # Find the resource that connects these processes
-                        for resource in current.requesting:
-                            if resource in next_process.allocated:
-                                resource.color = deadlock_color
-                                resource.has_glow = True  # Enable glow effect
+                # Highlight the resources connecting the witness cycle
+                for resource in deadlock.resources:
+                    resource.color = deadlock_color
+                    resource.has_glow = True  # Enable glow effect
 
-                self.popup = Popup("Deadlock Detected!", False)
-                self.check_button.animate_result(False)
-                return
+            self.popup = Popup("Deadlock Detected!", False)
+            self.check_button.animate_result(False)
+            return
 
         self.popup = Popup("No Deadlock Detected", True)
         self.check_button.animate_result(True)
@@ -537,29 +490,29 @@ class DeadlockDetectionSimulator:
         if self.edge_type == "request":
             if isinstance(start_node, Process) and isinstance(end_node, Resource):
                 # Process requesting resource
-                start_node.request_resource(end_node)
+                self.detector.request_resource(start_node, end_node)
                 self.popup = Popup(f"{start_node.name} requested {end_node.name}", True)
             elif isinstance(start_node, Resource) and isinstance(end_node, Process):
                 # Process requesting resource (reverse order)
-                end_node.request_resource(start_node)
+                self.detector.request_resource(end_node, start_node)
                 self.popup = Popup(f"{end_node.name} requested {start_node.name}", True)
             else:
                 self.popup = Popup("Invalid request edge: Must connect Process and Resource", False)
         else:  # allocation edge
             if isinstance(start_node, Resource) and isinstance(end_node, Process):
                 # Resource allocated to process
-                if start_node not in end_node.allocated:
-                    end_node.allocated.add(start_node)
+                if start_node.allocated_to is None:
+                    self.detector.allocate_resource(start_node, end_node)
                     self.popup = Popup(f"{start_node.name} allocated to {end_node.name}", True)
                 else:
-                    self.popup = Popup(f"{start_node.name} already allocated to {end_node.name}", False)
+                    self.popup = Popup(f"{start_node.name} already allocated to {start_node.allocated_to.name}", False)
             elif isinstance(start_node, Process) and isinstance(end_node, Resource):
                 # Resource allocated to process (reverse order)
-                if end_node not in start_node.allocated:
-                    start_node.allocated.add(end_node)
+                if end_node.allocated_to is None:
+                    self.detector.allocate_resource(end_node, start_node)
                     self.popup = Popup(f"{end_node.name} allocated to {start_node.name}", True)
                 else:
-                    self.popup = Popup(f"{end_node.name} already allocated to {start_node.name}", False)
+                    self.popup = Popup(f"{end_node.name} already allocated to {end_node.allocated_to.name}", False)
             else:
                 self.popup = Popup("Invalid allocation edge: Must connect Resource and Process", False)
 
@@ -0,0 +1,67 @@
+"""
+Matrix-based deadlock detection for multi-instance resources.
+
+Implements the classical detection algorithm over the Available vector
+and the Allocation/Request matrices.  Instead of scanning processes one
+at a time, every round grants all processes whose outstanding requests
+fit into the current work vector at once.  Each round only touches the
+non-zero request entries of unfinished processes, so sparse workloads
+with thousands of processes and resource types reduce in milliseconds.
+"""
+
+from typing import Tuple
+import numpy as np
+
+
+Coordinates = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def detect_matrix_deadlock(available: np.ndarray, allocation: np.ndarray,
+                           request: np.ndarray) -> np.ndarray:
+    """
+    Run the detection algorithm on dense matrices and return a boolean
+    mask of the processes that can never finish, i.e. the deadlocked ones.
+    """
+    allocation = np.asarray(allocation)
+    request = np.asarray(request)
+    rows, cols = np.nonzero(allocation)
+    alloc = (rows, cols, allocation[rows, cols])
+    rows, cols = np.nonzero(request)
+    req = (rows, cols, request[rows, cols])
+    return detect_sparse_deadlock(available, allocation.shape[0], alloc, req)
+
+
+def detect_sparse_deadlock(available: np.ndarray, num_processes: int,
+                           allocation: Coordinates, request: Coordinates) -> np.ndarray:
+    """
+    Same as detect_matrix_deadlock, with Allocation and Request given as
+    their non-zero (rows, cols, counts) coordinates.
+    """
+    work = np.array(available, dtype=np.int64)
+    alloc_rows, alloc_cols, alloc_counts = allocation
+    rows, cols, amounts = request
+
+    # A process holding nothing cannot be part of a deadlock
+    finished = np.ones(num_processes, dtype=bool)
+    finished[alloc_rows] = False
+    keep = ~finished[rows]
+    rows, cols, amounts = rows[keep], cols[keep], amounts[keep]
+
+    while True:
+        # A process is blocked while any of its requests exceeds the work vector
+        unmet = amounts > work[cols]
+        blocked = np.zeros(num_processes, dtype=bool)
+        blocked[rows[unmet]] = True
+        ready = ~finished & ~blocked
+        if not ready.any():
+            break
+
+        # Grant every ready process at once and reclaim its allocation
+        finished |= ready
+        released = ready[alloc_rows]
+        work += np.bincount(alloc_cols[released], weights=alloc_counts[released],
+                            minlength=work.shape[0]).astype(np.int64)
+        keep = ~ready[rows]
+        rows, cols, amounts = rows[keep], cols[keep], amounts[keep]
+
+    return ~finished
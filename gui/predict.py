@@ -0,0 +1,333 @@
+"""
+Predictive deadlock analysis of recorded traces.
+
+A lock-order cycle (gui.lockorder) is only a potential deadlock.  Many
+never can deadlock: the acquisitions belong to one thread, are serialized
+by a common gate lock held around all of them, or are ordered because one
+thread was forked or joined by the other.  This analysis records, for
+every acquisition attempt made while holding other locks, a dependency
+
+    (thread, held lock, acquired lock, guard set, vector clock)
+
+where the guard set is every lock the thread held.  A cycle of
+dependencies d1 -> d2 -> ... (each acquiring the lock the next one holds)
+is reported only if its threads are distinct, its guard sets are pairwise
+disjoint and its acquisitions are pairwise concurrent.
+
+Vector clocks advance only at fork and join events (lock hand-offs must
+not order threads here, or every lock cycle would order itself away).
+They are immutable and shared by every dependency of the epoch they cover.
+Rather than a dense array over thousands of threads, a clock is the
+thread's own tick plus references to the clocks it succeeded (the parent's
+at a fork, the child's at a join), flattened into a sparse dict once it
+references too many.  Ordering is the epoch test: d happens before e iff
+d's own tick <= e.clock.get(d.thread).  Recording is one pass over the
+trace, with dependencies deduplicated per (thread, locks, guards, epoch)
+and at most `per_edge` of them kept per lock pair.  The search enumerates
+simple cycles of the lock graph, within its cyclic components and up to
+`max_length` locks (and `max_cycles` cycles in all), and backtracks over
+the dependencies of each cycle's lock pairs for one compatible choice.
+
+Every surviving cycle is replayed into a DeadlockDetector, each thread
+holding its lock and requesting the next, and reported through the
+detector's own cycle and DeadlockReport.
+
+    python -m gui.predict trace.jsonl
+    python -m gui.predict --max-length 3 --no-happens-before trace.csv
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Allow running as a script as well as with python -m
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.scc import cyclic_components
+from gui.stream import DeadlockReport, Event, StreamingDetector, guess_format, read_events
+
+FLATTEN_SIZE = 64
+
+
+class VectorClock:
+    """Immutable sparse vector clock of one thread's epoch"""
+
+    __slots__ = ("thread", "tick", "parents", "flat", "size")
+
+    def __init__(self, thread: str, tick: int, parents: tuple = ()):
+        self.thread = thread
+        self.tick = tick
+        self.parents = parents
+        self.flat: Optional[Dict[str, int]] = None
+        # Bounds the cost of get(); shared parents are counted more than once
+        self.size = 1 + sum(parent.size for parent in parents)
+        if self.size > FLATTEN_SIZE:
+            self.flat = self._entries({})
+            self.parents = ()
+            self.size = 1
+
+    def get(self, thread: str) -> int:
+        if thread == self.thread:
+            return self.tick
+        if self.flat is not None:
+            return self.flat.get(thread, 0)
+        return max((parent.get(thread) for parent in self.parents), default=0)
+
+    def _entries(self, seen: dict) -> Dict[str, int]:
+        """Every thread's tick known to the parents, without this thread's own"""
+        if self.flat is not None:
+            return self.flat
+        result: Dict[str, int] = {}
+        for parent in self.parents:
+            if id(parent) in seen:
+                continue
+            seen[id(parent)] = parent
+            for thread, tick in parent._entries(seen).items():
+                if result.get(thread, 0) < tick:
+                    result[thread] = tick
+            if result.get(parent.thread, 0) < parent.tick:
+                result[parent.thread] = parent.tick
+        return result
+
+
+class Dependency(NamedTuple):
+    thread: str
+    held: str
+    acquired: str
+    guards: frozenset  # Every lock the thread held, including `held`
+    clock: VectorClock
+    index: int         # First event recording this dependency
+    event: Event
+
+
+def happens_before(a: Dependency, b: Dependency) -> bool:
+    return a.clock.tick <= b.clock.get(a.thread)
+
+
+class PredictiveAnalysis:
+    """Records lock dependencies from a trace and predicts feasible deadlocks"""
+
+    def __init__(self, max_length: int = 4, use_happens_before: bool = True,
+                 use_guards: bool = True, per_edge: int = 32, max_cycles: int = 100_000):
+        self.max_length = max(2, max_length)
+        self.per_edge = per_edge
+        self.max_cycles = max_cycles
+        self.use_happens_before = use_happens_before
+        self.use_guards = use_guards
+        self.clocks: Dict[str, VectorClock] = {}
+        self.held: Dict[str, List[str]] = {}
+        self.dependencies: Dict[tuple, Dependency] = {}
+        # (held, acquired) -> at most per_edge of its dependencies
+        self.edges: Dict[tuple, List[Dependency]] = {}
+        self.events = 0
+        self.dropped = 0  # Dependencies beyond per_edge for their lock pair
+        # Statistics of the cycle search
+        self.examined = 0
+        self.truncated = False
+        self.rejected = {"thread": 0, "guards": 0, "happens_before": 0}
+
+    def _clock(self, thread: str) -> VectorClock:
+        clock = self.clocks.get(thread)
+        if clock is None:
+            clock = self.clocks[thread] = VectorClock(thread, 1)
+        return clock
+
+    def feed(self, event: Event, index: int):
+        self.events += 1
+        op, thread, lock = event.op, event.process, event.resource
+        if op == "fork":
+            # A new epoch for the parent, so its later events are not before the child
+            parent = self._clock(thread)
+            self.clocks[lock] = VectorClock(lock, parent.get(lock) + 1, (parent,))
+            self.clocks[thread] = VectorClock(thread, parent.tick + 1, (parent,))
+        elif op == "join":
+            joiner = self._clock(thread)
+            self.clocks[thread] = VectorClock(thread, joiner.tick + 1, (joiner, self._clock(lock)))
+        elif op == "request" or (op == "acquire" and lock not in self.held.get(thread, ())):
+            stack = self.held.setdefault(thread, [])
+            if stack:
+                clock = self._clock(thread)
+                guards = frozenset(stack)
+                for held in stack:
+                    if held == lock:
+                        continue
+                    key = (thread, held, lock, guards, id(clock))
+                    if key not in self.dependencies:
+                        dependency = Dependency(thread, held, lock, guards, clock, index, event)
+                        self.dependencies[key] = dependency
+                        group = self.edges.setdefault((held, lock), [])
+                        if len(group) < self.per_edge:
+                            group.append(dependency)
+                        else:
+                            self.dropped += 1
+            stack.append(lock)
+        elif op in ("release", "cancel"):
+            stack = self.held.get(thread)
+            if stack and lock in stack:
+                # Drop the most recent entry for the lock
+                del stack[len(stack) - 1 - stack[::-1].index(lock)]
+
+    def run(self, events: Iterable[Event]) -> List[DeadlockReport]:
+        for index, event in enumerate(events):
+            self.feed(event, index)
+        return self.predict()
+
+    def predict(self) -> List[DeadlockReport]:
+        """Search the recorded dependencies for feasible deadlock cycles"""
+        locks = sorted({lock for edge in self.edges for lock in edge})
+        ids = {lock: i for i, lock in enumerate(locks)}
+        successors: List[List[int]] = [[] for _ in locks]
+        for held, acquired in self.edges:
+            successors[ids[held]].append(ids[acquired])
+        indptr = [0]
+        indices: List[int] = []
+        for targets in successors:
+            targets.sort()
+            indices.extend(targets)
+            indptr.append(len(indices))
+
+        reports = []
+        for component in cyclic_components(len(locks), indptr, indices):
+            members = set(component)
+            for start in sorted(component):
+                for cycle in self._lock_cycles(successors, members, start):
+                    if self.examined >= self.max_cycles:
+                        self.truncated = True
+                        break
+                    self.examined += 1
+                    chain = self._assign([(locks[a], locks[cycle[(i + 1) % len(cycle)]])
+                                          for i, a in enumerate(cycle)])
+                    report = self._confirm(chain) if chain else None
+                    if report is not None:
+                        reports.append(report)
+        reports.sort(key=lambda report: report.index)
+        return reports
+
+    def _lock_cycles(self, successors: List[List[int]], members: set, start: int):
+        """
+        Simple cycles of at most max_length locks through `start` whose
+        other locks all have larger ids, so each is found from one start
+        """
+        path = [start]
+        on_path = {start}
+        iterators = [iter(successors[start])]
+        while iterators:
+            for target in iterators[-1]:
+                if target == start:
+                    if len(path) > 1:
+                        yield list(path)
+                elif target > start and target in members and target not in on_path \
+                        and len(path) < self.max_length:
+                    path.append(target)
+                    on_path.add(target)
+                    iterators.append(iter(successors[target]))
+                    break
+            else:
+                iterators.pop()
+                on_path.discard(path.pop())
+
+    def _assign(self, cycle: List[tuple]) -> Optional[List[Dependency]]:
+        """One dependency per lock edge of the cycle, all mutually compatible"""
+        groups = sorted((self.edges[edge] for edge in cycle), key=len)
+        chosen: List[Dependency] = []
+
+        def extend(depth: int) -> bool:
+            if depth == len(groups):
+                return True
+            for dependency in groups[depth]:
+                if self._compatible(chosen, dependency):
+                    chosen.append(dependency)
+                    if extend(depth + 1):
+                        return True
+                    chosen.pop()
+            return False
+
+        if not extend(0):
+            return None
+        order = {edge: i for i, edge in enumerate(cycle)}
+        return sorted(chosen, key=lambda d: order[(d.held, d.acquired)])
+
+    def _compatible(self, chain: List[Dependency], dependency: Dependency) -> bool:
+        for other in chain:
+            if other.thread == dependency.thread:
+                self.rejected["thread"] += 1
+                return False
+            if self.use_guards and not other.guards.isdisjoint(dependency.guards):
+                self.rejected["guards"] += 1
+                return False
+            if self.use_happens_before and (happens_before(other, dependency)
+                                            or happens_before(dependency, other)):
+                self.rejected["happens_before"] += 1
+                return False
+        return True
+
+    @staticmethod
+    def _confirm(cycle: List[Dependency]) -> Optional[DeadlockReport]:
+        """Replay the cycle's hold-and-wait state into a DeadlockDetector"""
+        streaming = StreamingDetector(evict_idle=False)
+        for dependency in cycle:
+            streaming.apply("acquire", dependency.thread, dependency.held)
+        closed = None
+        for dependency in cycle:
+            closed = streaming.apply("request", dependency.thread, dependency.acquired) or closed
+        if not closed:
+            return None
+        last = max(cycle, key=lambda d: d.index)
+        return DeadlockReport(last.index, last.event, streaming.describe(closed))
+
+    def stats(self) -> dict:
+        return {
+            "events": self.events,
+            "threads": len(self.clocks),
+            "dependencies": len(self.dependencies),
+            "dropped": self.dropped,
+            "lock_cycles": self.examined,
+            "truncated": self.truncated,
+            "rejected": dict(self.rejected),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Predict deadlocks that a lock-event trace could reach")
+    parser.add_argument("paths", nargs="*", default=["-"],
+                        help="trace files, '-' for stdin (default)")
+    parser.add_argument("--format", choices=("jsonl", "csv"),
+                        help="trace format (default: from extension, jsonl for stdin)")
+    parser.add_argument("--max-length", type=int, default=4,
+                        help="longest cycle, in threads, to search for (default 4)")
+    parser.add_argument("--no-happens-before", action="store_true",
+                        help="do not discard cycles ordered by fork/join")
+    parser.add_argument("--no-guards", action="store_true",
+                        help="do not discard cycles serialized by a common gate lock")
+    args = parser.parse_args(argv)
+
+    analysis = PredictiveAnalysis(args.max_length, not args.no_happens_before, not args.no_guards)
+    index = 0
+    for path in args.paths:
+        fmt = args.format or ("jsonl" if path == "-" else guess_format(path))
+        source = sys.stdin if path == "-" else open(path, newline="")
+        try:
+            for event in read_events(source, fmt):
+                analysis.feed(event, index)
+                index += 1
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+    reports = analysis.predict()
+    for report in reports:
+        print(json.dumps(report.to_dict()), flush=True)
+    stats = analysis.stats()
+    rejected = ", ".join(f"{count} by {reason}" for reason, count in stats["rejected"].items())
+    print(f"{stats['events']} events, {stats['threads']} threads, {stats['dependencies']} dependencies, "
+          f"{len(reports)} predicted deadlocks; candidates rejected: {rejected}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
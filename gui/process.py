@@ -1,37 +1,90 @@
-from typing import List, Set, Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional
 
-class Process:
-    def __init__(self, name: str, position: Tuple[int, int], color=(50, 205, 50)):
-        self.name = name
+class Appearance:
+    """GUI-only attributes of a node, kept in a side table off the hot model"""
+    __slots__ = ('position', 'color', 'original_color', 'has_glow')
+
+    def __init__(self, position: Tuple[int, int], color: Tuple[int, int, int]):
         self.position = position
         self.color = color
         self.original_color = color
         self.has_glow = False  # Flag for glow effect
-        self.requesting = set()  # Set of resources this process is requesting
-        self.allocated = set()   # Set of resources allocated to this process
-        
+
+
+def _appearance_attribute(field: str):
+    """Property reading and writing one Appearance field from the side table"""
+    def getter(self):
+        appearance = getattr(self.owner, self.appearance_table).get(self.uid)
+        if appearance is None:
+            return getattr(Appearance((0, 0), self.default_color), field)
+        return getattr(appearance, field)
+
+    def setter(self, value):
+        appearances = getattr(self.owner, self.appearance_table)
+        appearance = appearances.get(self.uid)
+        if appearance is None:
+            appearance = appearances[self.uid] = Appearance((0, 0), self.default_color)
+        setattr(appearance, field, value)
+
+    return property(getter, setter, doc=f"GUI {field}, stored in the owner's side table")
+
+
+class _NodeView:
+    """Slotted view of a node; GUI attributes live in the owner's side table"""
+    __slots__ = ('owner', 'id', 'uid')
+    default_color = (255, 255, 255)
+    appearance_table = ''  # Name of the owner's side table, set by each subclass
+
+    def __init__(self, owner, slot: int, uid: int):
+        self.owner = owner  # DeadlockDetector holding the graph store
+        self.id = slot      # Graph store slot, reused after removal
+        self.uid = uid      # Stable ID, never reused by the owner
+
+    position = _appearance_attribute('position')
+    color = _appearance_attribute('color')
+    original_color = _appearance_attribute('original_color')
+    has_glow = _appearance_attribute('has_glow')
+
+
+class Process(_NodeView):
+    """View of one process stored in its owner DeadlockDetector's graph store"""
+    __slots__ = ()
+    default_color = (50, 205, 50)
+    appearance_table = 'process_appearance'
+
+    @property
+    def name(self) -> str:
+        """Display label, e.g. P3"""
+        return self.owner.process_label(self)
+
+    @property
+    def requesting(self) -> Set['Resource']:
+        """Set of resources this process is requesting"""
+        views = self.owner.resource_views
+        return {views[rid] for rid in self.owner.store.requests.out(self.id)}
+
+    @property
+    def allocated(self) -> Set['Resource']:
+        """Set of resources allocated to this process"""
+        views = self.owner.resource_views
+        return {views[rid] for rid in self.owner.store.holds.out(self.id)}
+
     def request_resource(self, resource: 'Resource') -> bool:
         """Request a resource"""
-        if resource not in self.allocated:
-            self.requesting.add(resource)
-            return True
-        return False
-        
+        self.owner.request_resource(self, resource)
+        return resource in self.requesting
+
     def allocate_resource(self, resource: 'Resource') -> bool:
         """Allocate a resource to this process"""
         if resource in self.requesting:
-            self.requesting.remove(resource)
-            self.allocated.add(resource)
-            return True
+            self.owner.allocate_resource(resource, self)
+            return resource in self.allocated
         return False
-        
+
     def release_resource(self, resource: 'Resource') -> bool:
         """Release an allocated resource"""
-        if resource in self.allocated:
-            self.allocated.remove(resource)
-            return True
-        return False
-        
+        return self.owner.release_resource(self, resource)
+
     def contains_point(self, point: Tuple[int, int]) -> bool:
         """Check if a point is within this process's bounds"""
         x, y = point
@@ -40,26 +93,54 @@ class Process:
         dx = x - (px + 25)
         dy = y - (py + 25)
         return (dx * dx + dy * dy) <= 625  # 25^2
-        
+
     def __repr__(self) -> str:
         return f"Process({self.name})"
 
-class Resource:
-    def __init__(self, name: str, position: Tuple[int, int], color=(200, 50, 50)):
-        self.name = name
-        self.position = position
-        self.color = color
-        self.original_color = color
-        self.has_glow = False  # Flag for glow effect
-        self.allocated_to: Optional[Process] = None  # Process this resource is allocated to
-        self.requested_by: Set[Process] = set()      # Processes requesting this resource
-        
+class Resource(_NodeView):
+    """View of one resource stored in its owner DeadlockDetector's graph store"""
+    __slots__ = ()
+    default_color = (200, 50, 50)
+    appearance_table = 'resource_appearance'
+
+    @property
+    def name(self) -> str:
+        """Display label, e.g. R3"""
+        return self.owner.resource_label(self)
+
+    @property
+    def instances(self) -> int:
+        """Capacity (1 for a plain lock)"""
+        return self.owner.store.instances[self.id]
+
+    @property
+    def holders(self) -> Dict[Process, int]:
+        """Instances held by each process"""
+        views = self.owner.process_views
+        return {views[pid]: count for pid, count in self.owner.store.holds.into(self.id).items()}
+
+    @property
+    def requested_by(self) -> Dict[Process, int]:
+        """Instances requested by each process"""
+        views = self.owner.process_views
+        return {views[pid]: count for pid, count in self.owner.store.requests.into(self.id).items()}
+
+    @property
+    def allocated_to(self) -> Optional[Process]:
+        """The holding process of a single-instance resource (any holder otherwise)"""
+        return next(iter(self.holders), None)
+
+    @property
+    def available(self) -> int:
+        """Number of free instances"""
+        return self.owner.store.available(self.id)
+
     def contains_point(self, point: Tuple[int, int]) -> bool:
         """Check if a point is within this resource's bounds"""
         x, y = point
         rx, ry = self.position
         # Assuming square shape with side 50
         return (rx <= x <= rx + 50) and (ry <= y <= ry + 50)
-                
+
     def __repr__(self) -> str:
-        return f"Resource({self.name})" 
\ No newline at end of file
+        return f"Resource({self.name})"
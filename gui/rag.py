@@ -0,0 +1,276 @@
+"""
+Resource allocation graphs given as a networkx DiGraph.
+
+The Streamlit app edits a DiGraph whose nodes carry a "type" of Process
+or Resource (and optionally "instances"); an edge Process -> Resource is
+a request and Resource -> Process an allocation.  These helpers map such
+a graph onto a DeadlockDetector and return the analysis as plain data, so
+it can be cached and shared between sessions.  graph_fingerprint() is the
+cache key: it depends only on the nodes, their types and capacities, and
+the edges, not on insertion order.
+
+Graphs are imported and exported in bulk as gui.stream traces (CSV or
+JSONL) or gui.eventlog binary logs.  An import replays the events to the
+final allocation state; CSV/JSONL input may instead be a plain edge list
+with "source" and "target" columns.  Records are parsed lazily and
+collected in a GraphImport, which is added to the DiGraph in one batch.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from gui.deadlock_detector import DeadlockDetector
+from gui.eventlog import EventLog, EventLogWriter
+from gui.stream import THREAD_OPS, Event, _event
+
+
+def graph_fingerprint(graph) -> str:
+    """Content hash of a resource allocation graph"""
+    nodes = sorted((str(node), data.get("type", ""), int(data.get("instances", 1)))
+                   for node, data in graph.nodes(data=True))
+    edges = sorted((str(source), str(target)) for source, target in graph.edges())
+    payload = json.dumps([nodes, edges], separators=(",", ":")).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def to_csr(graph) -> Tuple[list, List[int], List[int]]:
+    """(nodes, indptr, indices) of a DiGraph in the form of gui.scc"""
+    nodes = list(graph.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    indptr, indices = [0], []
+    for node in nodes:
+        indices.extend(index[successor] for successor in graph.successors(node))
+        indptr.append(len(indices))
+    return nodes, indptr, indices
+
+
+def build_detector(graph) -> Tuple[DeadlockDetector, Dict[tuple, str], List[Tuple[str, str]]]:
+    """
+    DeadlockDetector for a graph, the graph node of each process and
+    resource by ("P" | "R", uid) as in gui.stream, and the edges that
+    could not be applied: ones between nodes of the same type, and
+    allocations beyond a capacity.
+    """
+    detector = DeadlockDetector(incremental=False)
+    views, names = {}, {}
+    for node, data in graph.nodes(data=True):
+        if data.get("type") == "Resource":
+            view = detector.add_resource(instances=max(1, int(data.get("instances", 1))))
+            names[("R", view.uid)] = str(node)
+        else:
+            view = detector.add_process()
+            names[("P", view.uid)] = str(node)
+        views[node] = view
+
+    store = detector.store
+    ignored = []
+    requests = []
+    # Allocations first, so a request is never mistaken for one it satisfies
+    for source, target in graph.edges():
+        kinds = (graph.nodes[source].get("type"), graph.nodes[target].get("type"))
+        if kinds == ("Resource", "Process"):
+            resource, process = views[source], views[target]
+            held = store.holds.get(process.id, resource.id)
+            detector.allocate_resource(resource, process)
+            if store.holds.get(process.id, resource.id) == held:
+                ignored.append((str(source), str(target)))
+        elif kinds == ("Process", "Resource"):
+            requests.append((source, target))
+        else:
+            ignored.append((str(source), str(target)))
+    for source, target in requests:
+        process, resource = views[source], views[target]
+        detector.request_resource(process, resource)
+        if not store.requests.get(process.id, resource.id):
+            ignored.append((str(source), str(target)))
+    return detector, names, ignored
+
+
+def analyze(graph) -> dict:
+    """Deadlock analysis of a graph as JSON-friendly data"""
+    detector, names, ignored = build_detector(graph)
+    deadlocked = {names[("P", process.uid)] for process in detector.detect_deadlock("auto")[1]}
+    deadlocks = []
+    for deadlock in detector.find_deadlocks():
+        processes = sorted(names[("P", process.uid)] for process in deadlock.processes)
+        if deadlocked.intersection(processes):
+            deadlocks.append({
+                "processes": processes,
+                "cycle": [[names[("P", process.uid)], names[("R", resource.uid)]]
+                          for process, resource in deadlock.cycle],
+            })
+    return {
+        "processes": len(detector.processes),
+        "resources": len(detector.resources),
+        "deadlocked": sorted(deadlocked),
+        "deadlocks": deadlocks,
+        "ignored": ignored,
+    }
+
+
+OTHER_TYPE = {"Process": "Resource", "Resource": "Process"}
+EXPORT_FIELDS = ("op", "process", "resource", "instances")
+
+
+class GraphImport:
+    """Nodes and edges collected from a stream of events or edge rows"""
+
+    def __init__(self):
+        self.nodes: Dict[str, dict] = {}
+        self.edges: Dict[Tuple[str, str], None] = {}  # Insertion-ordered set
+        self.records = 0
+
+    def _node(self, name: str, kind: str, instances: Optional[int] = None):
+        data = self.nodes.get(name)
+        if data is None:
+            data = self.nodes[name] = {"type": kind}
+            if kind == "Resource":
+                data["instances"] = instances or 1
+        return data
+
+    def add_event(self, event: Event):
+        """Apply a trace event; fork and join carry no graph state"""
+        self.records += 1
+        if event.op in THREAD_OPS:
+            return
+        self._node(event.process, "Process")
+        self._node(event.resource, "Resource", event.instances)
+        request, allocation = (event.process, event.resource), (event.resource, event.process)
+        if event.op == "request":
+            self.edges[request] = None
+        elif event.op == "acquire":
+            self.edges.pop(request, None)
+            self.edges[allocation] = None
+        elif event.op == "release":
+            self.edges.pop(allocation, None)
+        else:
+            self.edges.pop(request, None)
+
+    def add_edge(self, record: dict):
+        """
+        Apply an edge row.  Missing node types are taken from an earlier
+        row, then as the opposite of the other end's, else Process for
+        the source and Resource for the target.
+        """
+        self.records += 1
+        source, target = str(record["source"]), str(record["target"])
+        kinds = [record.get("source_type") or None, record.get("target_type") or None]
+        for i, name in enumerate((source, target)):
+            if kinds[i] is None and name in self.nodes:
+                kinds[i] = self.nodes[name]["type"]
+        if kinds[0] is None:
+            kinds[0] = OTHER_TYPE.get(kinds[1], "Process")
+        if kinds[1] is None:
+            kinds[1] = OTHER_TYPE[kinds[0]]
+        instances = record.get("instances")
+        instances = int(instances) if instances not in (None, "") else None
+        self._node(source, kinds[0], instances)
+        self._node(target, kinds[1], instances)
+        self.edges[(source, target)] = None
+
+    def add_records(self, records: Iterable[dict]) -> 'GraphImport':
+        for record in records:
+            if "op" in record:
+                self.add_event(_event(record))
+            else:
+                self.add_edge(record)
+        return self
+
+    def add_events(self, events: Iterable[Event]) -> 'GraphImport':
+        for event in events:
+            self.add_event(event)
+        return self
+
+    def into(self, graph):
+        """Add everything to a DiGraph in one batch and return it"""
+        graph.add_nodes_from(self.nodes.items())
+        graph.add_edges_from(self.edges)
+        return graph
+
+
+def _jsonl_records(lines: Iterable[str]) -> Iterator[dict]:
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError(f"line {number}: expected a JSON object, got {type(record).__name__}")
+            yield record
+
+
+def import_graph(source, fmt: str) -> GraphImport:
+    """
+    Read a graph from a binary stream: "csv" or "jsonl" (trace events or
+    an edge list) or "dlev" (gui.eventlog)
+    """
+    imported = GraphImport()
+    if fmt == "dlev":
+        # The log is memory-mapped, so it needs a real file
+        handle, path = tempfile.mkstemp(suffix=".dlev")
+        try:
+            with os.fdopen(handle, "wb") as out:
+                while True:
+                    block = source.read(1 << 20)
+                    if not block:
+                        break
+                    out.write(block)
+            with EventLog(path) as log:
+                return imported.add_events(log)
+        finally:
+            os.remove(path)
+    text = io.TextIOWrapper(source, encoding="utf-8", newline="")
+    try:
+        records = csv.DictReader(text) if fmt == "csv" else _jsonl_records(text)
+        return imported.add_records(records)
+    finally:
+        text.detach()
+
+
+def graph_events(graph, skipped: Optional[List[Tuple[str, str]]] = None) -> Iterator[Event]:
+    """
+    Events that rebuild a graph's requests and allocations: acquires
+    first, then requests.  Other edges are appended to `skipped`;
+    isolated nodes have no event.
+    """
+    requests = []
+    for source, target in graph.edges():
+        kinds = (graph.nodes[source].get("type"), graph.nodes[target].get("type"))
+        if kinds == ("Resource", "Process"):
+            yield Event("acquire", str(target), str(source),
+                        instances=max(1, int(graph.nodes[source].get("instances", 1))))
+        elif kinds == ("Process", "Resource"):
+            requests.append((source, target))
+        elif skipped is not None:
+            skipped.append((str(source), str(target)))
+    for source, target in requests:
+        yield Event("request", str(source), str(target),
+                    instances=max(1, int(graph.nodes[target].get("instances", 1))))
+
+
+def export_graph(graph, fmt: str, skipped: Optional[List[Tuple[str, str]]] = None) -> bytes:
+    """A graph as a "csv" or "jsonl" trace or a "dlev" binary log"""
+    events = graph_events(graph, skipped)
+    if fmt == "dlev":
+        handle, path = tempfile.mkstemp(suffix=".dlev")
+        os.close(handle)
+        try:
+            with EventLogWriter(path) as writer:
+                writer.write_all(events)
+            with open(path, "rb") as log:
+                return log.read()
+        finally:
+            os.remove(path)
+    out = io.StringIO(newline="")
+    if fmt == "csv":
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(EXPORT_FIELDS)
+        writer.writerows((e.op, e.process, e.resource, e.instances) for e in events)
+    else:
+        out.writelines(json.dumps(dict(zip(EXPORT_FIELDS, (e.op, e.process, e.resource, e.instances))))
+                       + "\n" for e in events)
+    return out.getvalue().encode("utf-8")
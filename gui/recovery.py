@@ -0,0 +1,265 @@
+"""
+Victim selection for deadlock recovery.
+
+Detection reports which processes are deadlocked; recovery has to pick
+processes to abort (or to preempt, taking back the resources others wait
+for) so that every cycle of the wait-for graph breaks.  That is a minimum
+weight feedback vertex set, NP-hard in general, so the planner uses the
+usual reductions plus a greedy choice, restricted to the cyclic strongly
+connected components:
+
+- a process with no waiting predecessor or successor left is on no cycle;
+- a process that waits on itself (after contraction) must be a victim;
+- a process whose only predecessor (or successor) is u lies on no cycle
+  that avoids u, so if u is no more costly it is contracted into u;
+- otherwise the process with the largest in-degree * out-degree / cost
+  becomes a victim.
+
+Every step touches only the neighbours of the process removed, so the
+plan costs O((V + E) log V).  A last pass puts victims back, costliest
+first, wherever a topological order of the survivors leaves room for them.
+
+The cost of a process is priority * (1 + held + work), with held the
+instances it would give up.  A preempted process loses no work, so
+preemption is cheaper by that term.  Breaking every wait-for cycle is
+enough for multi-instance resources too, though it may free more than a
+matrix reduction would need.
+"""
+
+import heapq
+from collections import deque
+from typing import Callable, Dict, List, Mapping, NamedTuple, Optional
+
+import numpy as np
+
+from gui.process import Process, Resource
+from gui.scc import cyclic_components
+
+ACTIONS = ("abort", "preempt")
+
+
+class Victim(NamedTuple):
+    process: Process
+    action: str                  # "abort" or "preempt"
+    cost: float
+    freed: Dict[Resource, int]   # Instances given up
+
+
+class RecoveryPlan(NamedTuple):
+    victims: List[Victim]
+    cost: float
+    freed: Dict[Resource, int]   # Instances freed by all victims together
+
+    def __bool__(self) -> bool:
+        return bool(self.victims)
+
+
+def _freed(detector, pid: int, action: str) -> Dict[Resource, int]:
+    store = detector.store
+    views = detector.resource_views
+    held = store.holds.out(pid)
+    if action == "abort":
+        return {views[rid]: count for rid, count in held.items()}
+    # Preemption takes back only what some other process is waiting for
+    requests = store.requests
+    return {views[rid]: count for rid, count in held.items()
+            if any(waiter != pid for waiter in requests.into(rid))}
+
+
+def plan_recovery(detector, action: str = "abort",
+                  priority: Optional[Mapping[Process, float]] = None,
+                  work: Optional[Mapping[Process, float]] = None,
+                  cost: Optional[Callable[[Process, Dict[Resource, int]], float]] = None) -> RecoveryPlan:
+    """
+    Choose low-cost victims whose abort or preemption breaks every
+    deadlock of the detector.  cost(process, freed) overrides the default
+    priority * (1 + held + work), where priority defaults to 1 and work to 0.
+    Raises ValueError if a deadlocked process gets a cost that is not
+    positive.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown recovery action: {action}")
+    store = detector.store
+    waiter, holder, _ = store.wait_for_edges()
+    num_processes = store.num_processes
+    counts = np.bincount(waiter, minlength=num_processes)
+    indptr = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    components = cyclic_components(num_processes, indptr, holder.tolist())
+    if not components:
+        return RecoveryPlan([], 0.0, {})
+
+    # Keep the edges inside cyclic components, deduplicated, on local ids
+    component_of = np.full(num_processes, -1, dtype=np.int64)
+    nodes = np.concatenate([np.asarray(c, dtype=np.int64) for c in components])
+    local = np.full(num_processes, -1, dtype=np.int64)
+    local[nodes] = np.arange(len(nodes))
+    for i, component in enumerate(components):
+        component_of[component] = i
+    inside = (component_of[waiter] >= 0) & (component_of[waiter] == component_of[holder])
+    edges = np.unique(np.stack([local[waiter[inside]], local[holder[inside]]], axis=1), axis=0)
+    sources, targets = edges[:, 0].tolist(), edges[:, 1].tolist()
+    n = len(nodes)
+    pids = nodes.tolist()
+
+    views = detector.process_views
+    freed = [_freed(detector, pid, action) for pid in pids]
+    weights = []
+    for pid, gives_up in zip(pids, freed):
+        process = views[pid]
+        if cost is not None:
+            weight = float(cost(process, gives_up))
+        else:
+            lost = sum(gives_up.values())
+            if action == "abort" and work is not None:
+                lost += work.get(process, 0.0)
+            factor = 1.0 if priority is None else priority.get(process, 1.0)
+            weight = factor * (1.0 + lost)
+        # The victim choice divides by the cost
+        if not weight > 0:
+            raise ValueError(f"Recovery cost of {process!r} must be positive, got {weight}")
+        weights.append(weight)
+
+    victims = _feedback_vertex_set(n, sources, targets, weights)
+
+    chosen = [Victim(views[pids[v]], action, weights[v], freed[v]) for v in victims]
+    total: Dict[Resource, int] = {}
+    for victim in chosen:
+        for resource, count in victim.freed.items():
+            total[resource] = total.get(resource, 0) + count
+    return RecoveryPlan(chosen, sum(victim.cost for victim in chosen), total)
+
+
+def _feedback_vertex_set(n: int, sources: List[int], targets: List[int],
+                         weights: List[float]) -> List[int]:
+    """Low-weight set of nodes whose removal leaves the graph acyclic"""
+    succ = [set() for _ in range(n)]
+    pred = [set() for _ in range(n)]
+    for s, t in zip(sources, targets):
+        succ[s].add(t)
+        pred[t].add(s)
+    alive = bytearray(b"\x01") * n
+    queue = deque(range(n))
+    heap: List[tuple] = []
+    victims: List[int] = []
+
+    def remove(v: int):
+        for x in succ[v]:
+            pred[x].discard(v)
+            queue.append(x)
+        for x in pred[v]:
+            succ[x].discard(v)
+            queue.append(x)
+        succ[v] = pred[v] = set()
+        alive[v] = 0
+
+    def contract(v: int, into: int, forward: bool):
+        # Replace v by `into`: its other edges now start (or end) at `into`
+        if forward:
+            for x in succ[v]:
+                pred[x].discard(v)
+                pred[x].add(into)
+                succ[into].add(x)
+                queue.append(x)
+            succ[into].discard(v)
+        else:
+            for x in pred[v]:
+                succ[x].discard(v)
+                succ[x].add(into)
+                pred[into].add(x)
+                queue.append(x)
+            pred[into].discard(v)
+        succ[v] = pred[v] = set()
+        alive[v] = 0
+        queue.append(into)
+
+    while True:
+        while queue:
+            v = queue.pop()
+            if not alive[v]:
+                continue
+            ins, outs = pred[v], succ[v]
+            if v in outs:
+                victims.append(v)
+                remove(v)
+            elif not ins or not outs:
+                remove(v)
+            elif len(ins) == 1 and weights[next(iter(ins))] <= weights[v]:
+                contract(v, next(iter(ins)), True)
+            elif len(outs) == 1 and weights[next(iter(outs))] <= weights[v]:
+                contract(v, next(iter(outs)), False)
+            else:
+                heapq.heappush(heap, (-len(ins) * len(outs) / weights[v], v))
+        # Entries go stale as degrees change; each change also queued a fresh one
+        while heap:
+            score, v = heapq.heappop(heap)
+            if alive[v] and -score == len(pred[v]) * len(succ[v]) / weights[v]:
+                break
+        else:
+            break
+        victims.append(v)
+        remove(v)
+
+    return _prune(n, sources, targets, weights, victims)
+
+
+def _prune(n: int, sources: List[int], targets: List[int], weights: List[float],
+           victims: List[int]) -> List[int]:
+    """
+    Drop victims that are not needed: with the survivors in topological
+    order, a victim whose predecessors all come before its successors can
+    be put back between them.  Costliest victims are tried first.
+    """
+    removed = bytearray(n)
+    for v in victims:
+        removed[v] = 1
+    succ: List[List[int]] = [[] for _ in range(n)]
+    pred: List[List[int]] = [[] for _ in range(n)]
+    for s, t in zip(sources, targets):
+        succ[s].append(t)
+        pred[t].append(s)
+
+    position = [0.0] * n
+    indegree = [0] * n
+    for s, t in zip(sources, targets):
+        if not removed[s] and not removed[t]:
+            indegree[t] += 1
+    ready = [v for v in range(n) if not removed[v] and not indegree[v]]
+    placed = 0
+    while ready:
+        v = ready.pop()
+        position[v] = float(placed)
+        placed += 1
+        for t in succ[v]:
+            if not removed[t]:
+                indegree[t] -= 1
+                if not indegree[t]:
+                    ready.append(t)
+
+    kept = []
+    for v in sorted(victims, key=lambda v: -weights[v]):
+        low = max((position[u] for u in pred[v] if not removed[u]), default=None)
+        high = min((position[w] for w in succ[v] if not removed[w]), default=None)
+        if low is None:
+            spot = -1.0 if high is None else high - 1.0
+        elif high is None:
+            spot = low + 1.0
+        else:
+            spot = (low + high) / 2
+            if not low < spot < high:
+                kept.append(v)
+                continue
+        removed[v] = 0
+        position[v] = spot
+    order = {v: i for i, v in enumerate(victims)}
+    kept.sort(key=order.__getitem__)
+    return kept
+
+
+def apply_recovery(detector, plan: RecoveryPlan):
+    """Abort or preempt the victims of a plan"""
+    for victim in plan.victims:
+        if victim.action == "abort":
+            detector.remove_process(victim.process)
+        else:
+            for resource in victim.freed:
+                detector.release_resource(victim.process, resource)
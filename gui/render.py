@@ -0,0 +1,240 @@
+"""
+Rendering of resource allocation graphs for the Streamlit app.
+
+A PNG drawn by matplotlib costs seconds and megabytes once a graph has a
+few thousand nodes, and most of what it draws cannot be told apart.
+build_scene() projects the layout onto the viewport in pixels and culls
+it to what can be seen there:
+
+- nodes falling on the same pixel (and of the same kind) are drawn once;
+- edges whose ends fall on the same pixels as another edge's, or that are
+  shorter than a pixel, are dropped;
+- above LABEL_LIMIT nodes only deadlocked nodes keep their labels, above
+  SHAPE_LIMIT nodes become small squares, and above ARROW_LIMIT edges
+  lose their arrowheads.
+
+Deadlocked nodes and the edges between them are never culled.  A scene is
+written as compact SVG (one path per kind of edge and node when the
+graph is large) or as compact JSON drawn by canvas_html() in the browser.
+render_png() keeps the matplotlib drawing as a fallback.
+"""
+
+import base64
+import html
+import json
+from io import BytesIO
+from typing import Dict, Hashable, List, NamedTuple, Sequence, Set, Tuple
+
+import numpy as np
+
+WIDTH, HEIGHT = 900, 700
+MARGIN = 24
+LABEL_LIMIT = 200
+SHAPE_LIMIT = 500
+ARROW_LIMIT = 2000
+
+PROCESS, RESOURCE = 0, 1
+REQUEST, ALLOCATION, OTHER = 0, 1, 2
+NODE_COLORS = ("#add8e6", "#90ee90")
+EDGE_COLORS = ("#607d8b", "#9e9e9e", "#bdbdbd")
+HOT = "#e53935"
+
+
+class Scene(NamedTuple):
+    nodes: np.ndarray          # (n x 4) int: x, y, kind, hot
+    labels: Dict[int, str]     # Row of nodes -> label, for the labelled nodes only
+    edges: np.ndarray          # (m x 6) int: x1, y1, x2, y2, kind, hot
+    radius: int
+    shapes: bool               # Circles and squares rather than dots
+    arrows: bool
+    total_nodes: int
+    total_edges: int
+    width: int
+    height: int
+
+
+def build_scene(nodes: Sequence[Hashable], kinds: Sequence[int],
+                positions: Dict[Hashable, Tuple[float, float]],
+                edges: Sequence[Tuple[Hashable, Hashable]], hot: Set[Hashable] = frozenset(),
+                width: int = WIDTH, height: int = HEIGHT) -> Scene:
+    """Project a laid-out graph onto a width x height viewport and cull it"""
+    n = len(nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    xy = np.array([positions[node] for node in nodes], dtype=float).reshape(-1, 2)
+    shapes = n <= SHAPE_LIMIT
+    radius = int(np.clip(0.35 * np.sqrt(width * height / max(n, 1)), 2, 20)) if shapes else 1
+    margin = MARGIN + radius
+    low = xy.min(axis=0) if n else np.zeros(2)
+    span = np.maximum(xy.max(axis=0) - low, 1e-9) if n else np.ones(2)
+    scale = min((width - 2 * margin) / span[0], (height - 2 * margin) / span[1])
+    pixel = np.rint((xy - low) * scale + margin).astype(np.int64)
+    kind = np.asarray(kinds, dtype=np.int64)
+    is_hot = np.array([node in hot for node in nodes], dtype=bool)
+
+    # Nodes: one per (pixel, kind), hot nodes always kept
+    rows = np.column_stack([pixel, kind, is_hot]) if n else np.zeros((0, 4), dtype=np.int64)
+    if shapes:
+        keep = np.arange(n)
+    else:
+        _, first = np.unique(rows[:, :3], axis=0, return_index=True)
+        keep = np.union1d(first, np.flatnonzero(is_hot))
+    labelled = keep if len(keep) <= LABEL_LIMIT else keep[is_hot[keep]]
+    labels = {int(np.searchsorted(keep, i)): str(nodes[i]) for i in labelled}
+
+    # Edges: dropped below a pixel or when another edge covers the same pixels
+    m = len(edges)
+    pairs = np.array([(index[a], index[b]) for a, b in edges], dtype=np.int64).reshape(-1, 2)
+    edge_kind = np.full(m, OTHER, dtype=np.int64)
+    if m:
+        source_kind, target_kind = kind[pairs[:, 0]], kind[pairs[:, 1]]
+        edge_kind[(source_kind == PROCESS) & (target_kind == RESOURCE)] = REQUEST
+        edge_kind[(source_kind == RESOURCE) & (target_kind == PROCESS)] = ALLOCATION
+    edge_hot = is_hot[pairs[:, 0]] & is_hot[pairs[:, 1]] if m else np.zeros(0, dtype=bool)
+    segments = np.column_stack([pixel[pairs[:, 0]], pixel[pairs[:, 1]], edge_kind, edge_hot]) \
+        if m else np.zeros((0, 6), dtype=np.int64)
+    arrows = m <= ARROW_LIMIT
+    if not arrows:
+        # Without arrowheads direction is invisible, so a -> b covers b -> a
+        flip = (segments[:, 0] > segments[:, 2]) | ((segments[:, 0] == segments[:, 2])
+                                                     & (segments[:, 1] > segments[:, 3]))
+        segments[flip, :4] = segments[flip][:, [2, 3, 0, 1]]
+    visible = edge_hot | (segments[:, 0] != segments[:, 2]) | (segments[:, 1] != segments[:, 3])
+    segments = np.unique(segments[visible], axis=0) if len(segments) else segments
+    return Scene(rows[keep], labels, segments, radius, shapes, arrows, n, m, width, height)
+
+
+def _shortened(segments: np.ndarray, radius: int) -> np.ndarray:
+    """Segment ends pulled back to the node border, so arrowheads stay visible"""
+    start, end = segments[:, 0:2].astype(float), segments[:, 2:4].astype(float)
+    delta = end - start
+    length = np.maximum(np.sqrt((delta ** 2).sum(axis=1)), 1e-9)[:, None]
+    cut = np.minimum(radius + 1, length / 2)
+    return np.rint(np.hstack([start + delta / length * cut, end - delta / length * cut])).astype(np.int64)
+
+
+def to_svg(scene: Scene) -> str:
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {scene.width} {scene.height}" '
+           f'width="100%" height="100%" font-family="sans-serif" font-size="11" text-anchor="middle">']
+    segments = scene.edges
+    if scene.arrows:
+        out.append('<defs>' + "".join(
+            f'<marker id="a{i}" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="6" markerHeight="6" '
+            f'orient="auto"><path d="M0 0L10 5L0 10z" fill="{color}"/></marker>'
+            for i, color in enumerate(EDGE_COLORS + (HOT,))) + '</defs>')
+        ends = _shortened(segments, scene.radius)
+        for (x1, y1, x2, y2), (_, _, _, _, kind, hot) in zip(ends.tolist(), segments.tolist()):
+            style = 3 if hot else kind
+            color = HOT if hot else EDGE_COLORS[kind]
+            out.append(f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="{color}" '
+                       f'marker-end="url(#a{style})"/>')
+    else:
+        # One path per colour: a move and a line per edge
+        for color, mask in _edge_groups(segments):
+            d = "".join(f"M{x1} {y1}L{x2} {y2}" for x1, y1, x2, y2 in segments[mask, :4].tolist())
+            out.append(f'<path d="{d}" stroke="{color}" stroke-width=".5" fill="none"/>')
+
+    nodes = scene.nodes
+    r = scene.radius
+    if scene.shapes:
+        for x, y, kind, hot in nodes.tolist():
+            stroke = f' stroke="{HOT}" stroke-width="3"' if hot else ' stroke="#455a64"'
+            if kind == PROCESS:
+                out.append(f'<circle cx="{x}" cy="{y}" r="{r}" fill="{NODE_COLORS[kind]}"{stroke}/>')
+            else:
+                out.append(f'<rect x="{x - r}" y="{y - r}" width="{2 * r}" height="{2 * r}" '
+                           f'fill="{NODE_COLORS[kind]}"{stroke}/>')
+    else:
+        for color, mask in ((NODE_COLORS[PROCESS], (nodes[:, 2] == PROCESS) & (nodes[:, 3] == 0)),
+                            (NODE_COLORS[RESOURCE], (nodes[:, 2] == RESOURCE) & (nodes[:, 3] == 0)),
+                            (HOT, nodes[:, 3] == 1)):
+            if mask.any():
+                d = "".join(f"M{x - 1} {y - 1}h3v3h-3z" for x, y in nodes[mask, :2].tolist())
+                out.append(f'<path d="{d}" fill="{color}"/>')
+    for row, label in scene.labels.items():
+        x, y = nodes[row, 0], nodes[row, 1]
+        dy = 4 if scene.shapes and r >= 8 else -r - 3
+        out.append(f'<text x="{x}" y="{y + dy}">{html.escape(label)}</text>')
+    out.append('</svg>')
+    return "".join(out)
+
+
+def _edge_groups(segments: np.ndarray) -> List[Tuple[str, np.ndarray]]:
+    groups = []
+    for kind, color in enumerate(EDGE_COLORS):
+        mask = (segments[:, 4] == kind) & (segments[:, 5] == 0)
+        if mask.any():
+            groups.append((color, mask))
+    hot = segments[:, 5] == 1
+    if hot.any():
+        groups.append((HOT, hot))
+    return groups
+
+
+def to_json(scene: Scene) -> str:
+    """Compact scene for a client-side canvas: flat integer lists"""
+    return json.dumps({
+        "w": scene.width, "h": scene.height, "r": scene.radius, "shapes": scene.shapes, "arrows": scene.arrows,
+        "nodes": scene.nodes.ravel().tolist(),
+        "edges": scene.edges.ravel().tolist(),
+        "labels": [[row, label] for row, label in scene.labels.items()],
+        "colors": {"node": NODE_COLORS, "edge": EDGE_COLORS, "hot": HOT},
+    }, separators=(",", ":"))
+
+
+_CANVAS_SCRIPT = """
+const s = SCENE, c = document.getElementById("c"), g = c.getContext("2d");
+const k = Math.min(c.clientWidth / s.w, c.clientHeight / s.h), d = devicePixelRatio;
+c.width = c.clientWidth * d; c.height = c.clientHeight * d; g.scale(k * d, k * d);
+g.lineWidth = s.arrows ? 1 : .5;
+for (let i = 0; i < s.edges.length; i += 6) {
+  const [x1, y1, x2, y2, kind, hot] = s.edges.slice(i, i + 6);
+  g.strokeStyle = g.fillStyle = hot ? s.colors.hot : s.colors.edge[kind];
+  g.beginPath(); g.moveTo(x1, y1); g.lineTo(x2, y2); g.stroke();
+  if (s.arrows) {
+    const a = Math.atan2(y2 - y1, x2 - x1), tx = x2 - Math.cos(a) * (s.r + 1), ty = y2 - Math.sin(a) * (s.r + 1);
+    g.beginPath(); g.moveTo(tx, ty);
+    g.lineTo(tx - 8 * Math.cos(a - .4), ty - 8 * Math.sin(a - .4));
+    g.lineTo(tx - 8 * Math.cos(a + .4), ty - 8 * Math.sin(a + .4)); g.fill();
+  }
+}
+for (let i = 0; i < s.nodes.length; i += 4) {
+  const [x, y, kind, hot] = s.nodes.slice(i, i + 4), r = s.r;
+  g.fillStyle = hot && !s.shapes ? s.colors.hot : s.colors.node[kind];
+  g.beginPath();
+  if (!s.shapes) g.rect(x - 1, y - 1, 3, 3);
+  else if (kind === 0) g.arc(x, y, r, 0, 2 * Math.PI);
+  else g.rect(x - r, y - r, 2 * r, 2 * r);
+  g.fill();
+  if (s.shapes) { g.lineWidth = hot ? 3 : 1; g.strokeStyle = hot ? s.colors.hot : "#455a64"; g.stroke(); }
+}
+g.fillStyle = "#000"; g.font = "11px sans-serif"; g.textAlign = "center";
+for (const [row, label] of s.labels) {
+  const x = s.nodes[4 * row], y = s.nodes[4 * row + 1];
+  g.fillText(label, x, y + (s.shapes && s.r >= 8 ? 4 : -s.r - 3));
+}
+"""
+
+
+def canvas_html(scene: Scene) -> str:
+    """HTML page drawing the scene on a canvas that fills the page"""
+    script = _CANVAS_SCRIPT.replace("SCENE", to_json(scene).replace("</", "<\\/"))
+    return ('<canvas id="c" style="width:100%;height:96vh"></canvas>'
+            f'<script>{script}</script>')
+
+
+def render_png(graph, positions: Dict[Hashable, Tuple[float, float]]) -> str:
+    """The matplotlib drawing as base64 PNG; matplotlib is only needed here"""
+    import networkx as nx
+    from matplotlib.figure import Figure
+
+    # A Figure of its own rather than pyplot, whose global state is shared
+    # by the threads serving concurrent sessions
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
+    node_colors = ['lightblue' if graph.nodes[n].get('type') == 'Process' else 'lightgreen'
+                   for n in graph.nodes()]
+    nx.draw(graph, positions, with_labels=True, node_color=node_colors,
+            node_size=2000, font_size=12, font_weight='bold', ax=ax)
+    buf = BytesIO()
+    fig.savefig(buf, format='png')
+    return base64.b64encode(buf.getvalue()).decode()
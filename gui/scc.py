@@ -0,0 +1,109 @@
+"""
+Iterative strongly-connected-components search over an integer graph.
+
+The graph is given in compressed sparse row form: the successors of node
+``v`` are ``indices[indptr[v]:indptr[v + 1]]``.  Tarjan's algorithm runs
+with an explicit stack, so chains of any length are handled without
+touching Python's recursion limit, and the whole pass is O(V + E).
+"""
+
+from array import array
+from typing import List, Sequence
+
+
+def strongly_connected_components(num_nodes: int, indptr: Sequence[int],
+                                  indices: Sequence[int]) -> List[List[int]]:
+    """Return every strongly connected component, in reverse topological order"""
+    unvisited = -1
+    index = array('i', [unvisited]) * num_nodes
+    lowlink = array('i', [0]) * num_nodes
+    on_stack = bytearray(num_nodes)
+    # Position of the next edge to explore for each node on the call stack
+    next_edge = array('i', [0]) * num_nodes
+
+    components: List[List[int]] = []
+    stack: List[int] = []
+    counter = 0
+
+    for root in range(num_nodes):
+        if index[root] != unvisited:
+            continue
+        call_stack = [root]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        next_edge[root] = indptr[root]
+        stack.append(root)
+        on_stack[root] = 1
+
+        while call_stack:
+            node = call_stack[-1]
+            edge = next_edge[node]
+            end = indptr[node + 1]
+            # Advance through successors until one needs to be descended into
+            while edge < end:
+                successor = indices[edge]
+                edge += 1
+                if index[successor] == unvisited:
+                    next_edge[node] = edge
+                    index[successor] = lowlink[successor] = counter
+                    counter += 1
+                    next_edge[successor] = indptr[successor]
+                    stack.append(successor)
+                    on_stack[successor] = 1
+                    call_stack.append(successor)
+                    break
+                if on_stack[successor] and index[successor] < lowlink[node]:
+                    lowlink[node] = index[successor]
+            else:
+                # All successors explored: pop the node
+                call_stack.pop()
+                if call_stack:
+                    parent = call_stack[-1]
+                    if lowlink[node] < lowlink[parent]:
+                        lowlink[parent] = lowlink[node]
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    return components
+
+
+def cyclic_components(num_nodes: int, indptr: Sequence[int],
+                      indices: Sequence[int]) -> List[List[int]]:
+    """Components that contain at least one cycle (size > 1 or a self-loop)"""
+    result = []
+    for component in strongly_connected_components(num_nodes, indptr, indices):
+        if len(component) > 1:
+            result.append(component)
+        else:
+            node = component[0]
+            if node in indices[indptr[node]:indptr[node + 1]]:
+                result.append(component)
+    return result
+
+
+def witness_cycle(component: Sequence[int], indptr: Sequence[int],
+                  indices: Sequence[int]) -> List[int]:
+    """
+    Return the edge positions of one simple cycle inside a component.
+    Every node of a cyclic component has a successor inside it, so walking
+    such successors must revisit a node within len(component) steps.
+    """
+    members = set(component)
+    position = {}
+    walk: List[int] = []
+    node = component[0]
+    while node not in position:
+        position[node] = len(walk)
+        for edge in range(indptr[node], indptr[node + 1]):
+            if indices[edge] in members:
+                walk.append(edge)
+                node = indices[edge]
+                break
+    return walk[position[node]:]
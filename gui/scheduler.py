@@ -0,0 +1,227 @@
+"""
+Adaptive detection scheduling for streaming ingestion.
+
+Running a full detection after every event makes detection dominate CPU
+time, while running it rarely reports deadlocks late.  DetectionScheduler
+feeds events into a StreamingDetector whose DeadlockDetector does no
+per-event cycle maintenance, remembers the processes that gained wait-for
+edges since the last run, and only searches the region reachable from
+them when a trigger fires:
+
+    "events"     every N events
+    "interval"   every T milliseconds (checked as events arrive)
+    "contended"  whenever a request targets a held resource, or an
+                 allocation makes waiting processes wait for a new holder
+
+With adapt=True the spacing follows the measured detection cost so that
+detection takes at most `budget` of the processing time: N and T are
+never shorter than configured but stretch when detection gets expensive,
+and contended triggers are coalesced until enough time has passed.
+
+Each report carries its detection latency: the wall time, and number of
+events, between the cycle-closing event and the report.
+"""
+
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from gui.deadlock_detector import DeadlockDetector
+from gui.process import Process, Resource
+from gui.stream import DeadlockReport, Event, StreamingDetector
+
+POLICIES = ("events", "interval", "contended")
+
+
+class _Pending(NamedTuple):
+    index: int      # Event that gave the process a new wait-for edge
+    event: Event
+    arrived: float  # Clock reading when that event was fed
+
+
+class DetectionScheduler:
+    """Runs detection over a stream of events on configurable triggers"""
+
+    def __init__(self, streaming: Optional[StreamingDetector] = None, policy: str = "contended",
+                 every: int = 1000, interval_ms: float = 50.0, adapt: bool = True,
+                 budget: float = 0.1, smoothing: float = 0.25,
+                 clock: Callable[[], float] = time.perf_counter):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy: {policy}, expected one of {POLICIES}")
+        if not 0 < budget <= 1:
+            raise ValueError("budget must be a fraction of processing time in (0, 1]")
+        self.streaming = streaming or StreamingDetector(
+            DeadlockDetector(incremental=False, contiguous_labels=False))
+        self.policy = policy
+        self.every = self.min_every = max(1, every)
+        self.interval = self.min_interval = interval_ms / 1000.0
+        self.adapt = adapt
+        self.budget = budget
+        self.smoothing = smoothing
+        self.clock = clock
+        # Processes with wait-for edges added since the last detection run
+        self.pending: Dict[Process, _Pending] = {}
+        # Reported deadlocks by member uid, so a deadlock is reported once
+        self.reported: Dict[int, frozenset] = {}
+        self.since_detection = 0
+        self.last_detection = clock()
+        # Exponential moving averages of detection cost and per-event cost
+        self.detection_cost = 0.0
+        self.event_cost = 0.0
+        # Statistics
+        self.detections = 0
+        self.detection_time = 0.0
+        self.reports = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.max_lag = 0
+
+    def feed(self, event: Event) -> List[DeadlockReport]:
+        """Apply one event; returns the reports of any detection it triggered"""
+        started = self.clock()
+        streaming = self.streaming
+        index = streaming.events
+        rejected = streaming.rejected
+        # Looked up first: releasing or cancelling may evict the nodes
+        process = streaming.processes.get(event.process)
+        resource = streaming.resources.get(event.resource)
+        streaming.apply(event.op, event.process, event.resource, event.count, event.instances)
+        if streaming.rejected == rejected:  # The event changed the graph
+            if event.op in ("release", "cancel"):
+                if process is not None and resource is not None:
+                    self._forget(event.op, process, resource)
+            else:
+                self._track(index, event, started)
+        self.since_detection += 1
+        now = self.clock()
+        self.event_cost += self.smoothing * ((now - started) - self.event_cost)
+
+        if not self.pending or not self._due(now):
+            return []
+        return self.detect()
+
+    def run(self, events: Iterable[Event]) -> Iterator[DeadlockReport]:
+        """Yield reports as detections fire, flushing at the end of the stream"""
+        for event in events:
+            yield from self.feed(event)
+        yield from self.detect()
+
+    def detect(self) -> List[DeadlockReport]:
+        """Search the region reachable from the pending processes now"""
+        started = self.clock()
+        self.since_detection = 0
+        self.last_detection = started
+        if not self.pending:
+            return []
+        detector = self.streaming.detector
+        pending, self.pending = self.pending, {}
+        deadlocks = detector.find_deadlocks_from(process.id for process in pending)
+
+        names = self.streaming.names
+        now = self.clock()
+        reports = []
+        for deadlock in deadlocks:
+            key = frozenset(process.uid for process in deadlock.processes)
+            closing = max((pending[p] for p in deadlock.processes if p in pending),
+                          default=None, key=lambda entry: entry.index)
+            if closing is None or self.reported.get(next(iter(key))) == key:
+                continue  # Older deadlock reached from a pending process
+            for uid in key:
+                self.reported[uid] = key
+            latency = now - closing.arrived
+            lag = self.streaming.events - 1 - closing.index
+            cycle = [(names[("P", p.uid)], names[("R", r.uid)]) for p, r in deadlock.cycle]
+            reports.append(DeadlockReport(closing.index, closing.event, cycle, latency, lag))
+            self.reports += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.max_lag = max(self.max_lag, lag)
+
+        cost = self.clock() - started
+        self.detections += 1
+        self.detection_time += cost
+        self.detection_cost += self.smoothing * (cost - self.detection_cost)
+        if self.adapt:
+            self._adapt()
+        return reports
+
+    def _track(self, index: int, event: Event, arrived: float):
+        """Record the process if the event gave it new wait-for edges"""
+        streaming = self.streaming
+        process = streaming.processes.get(event.process)
+        resource = streaming.resources.get(event.resource)
+        if process is None or resource is None:
+            return  # Evicted: the event left both nodes idle
+        store = streaming.detector.store
+        pid, rid = process.id, resource.id
+        if event.op == "request":
+            waits = store.requests.get(pid, rid) and any(h != pid for h in store.holds.into(rid))
+        elif event.op == "acquire":
+            # Other waiters now also wait for this process
+            waits = store.holds.get(pid, rid) and any(w != pid for w in store.requests.into(rid))
+        else:
+            waits = False
+        if waits:
+            self.pending[process] = _Pending(index, event, arrived)
+
+    def _forget(self, op: str, process: Process, resource: Resource):
+        """
+        Re-check a reported deadlock once the process lost an edge: the
+        members that still wait for each other remain that deadlock and
+        are not reported again, the others may deadlock anew.
+        """
+        key = self.reported.get(process.uid)
+        if key is None:
+            return
+        detector = self.streaming.detector
+        if (detector.processes.get(process.uid) is process
+                and detector.resources.get(resource.uid) is resource):
+            table = detector.store.holds if op == "release" else detector.store.requests
+            if table.get(process.id, resource.id):
+                return  # Partial release: the edge is still there
+        for uid in key:
+            if self.reported.get(uid) == key:
+                del self.reported[uid]
+        seeds = [detector.processes[uid].id for uid in key if uid in detector.processes]
+        for deadlock in detector.find_deadlocks_from(seeds):
+            remaining = frozenset(member.uid for member in deadlock.processes)
+            if remaining <= key:
+                for uid in remaining:
+                    self.reported[uid] = remaining
+
+    def poll(self) -> List[DeadlockReport]:
+        """Run detection if it is due; call from a timer when events may pause"""
+        if not self.pending or not self._due(self.clock()):
+            return []
+        return self.detect()
+
+    def _due(self, now: float) -> bool:
+        if self.policy == "events":
+            return self.since_detection >= self.every
+        if self.policy == "interval":
+            return now - self.last_detection >= self.interval
+        # Pending processes come from contended events; while detection
+        # would exceed the budget they are coalesced into a later run
+        return not self.adapt or now - self.last_detection >= self.detection_cost / self.budget
+
+    def _adapt(self):
+        """Stretch or shrink the spacing so detection stays within budget"""
+        gap = self.detection_cost / self.budget  # Processing time per detection
+        self.interval = max(self.min_interval, gap)
+        if self.event_cost > 0:
+            self.every = max(self.min_every, int(gap / self.event_cost))
+
+    def stats(self) -> dict:
+        """Detection counts, cost and latency so far"""
+        events = self.streaming.events
+        return {
+            "events": events,
+            "detections": self.detections,
+            "detection_ms": self.detection_time * 1000,
+            "mean_detection_ms": self.detection_time * 1000 / self.detections if self.detections else 0.0,
+            "deadlocks": self.reports,
+            "mean_latency_ms": self.total_latency * 1000 / self.reports if self.reports else 0.0,
+            "max_latency_ms": self.max_latency * 1000,
+            "max_lag_events": self.max_lag,
+            "every": self.every,
+            "interval_ms": self.interval * 1000,
+        }
@@ -0,0 +1,323 @@
+"""
+Asyncio detection service over TCP or Unix sockets.
+
+Runs a DeadlockDetector as a long-lived sidecar.  Every message, in both
+directions, is a frame: a 4-byte big-endian length followed by that many
+bytes of UTF-8 JSON.  Requests carry an "id" that is echoed in the reply:
+
+    {"id": 1, "cmd": "request",  "process": "T1", "resource": "L1", "count": 1}
+    {"id": 2, "cmd": "allocate", "process": "T1", "resource": "L1"}
+    {"id": 3, "cmd": "release",  "process": "T1", "resource": "L1"}
+    {"id": 4, "cmd": "cancel",   "process": "T1", "resource": "L1"}
+    {"id": 5, "cmd": "detect"}
+    {"id": 6, "cmd": "query", "process": "T1"}   (or "resource", or neither for stats)
+
+Processes and resources are named as in gui.stream and created on first
+use; "instances" sets a new resource's capacity.  Mutation replies carry
+"ok" and, if the mutation closed a wait-for cycle, the "cycle".
+
+Clients may pipeline: each connection's frames are handled strictly in
+order and replies are written without waiting for the client, flushing
+only when the socket buffer fills up.  Detect calls that arrive while a
+run is pending share that run, so any number of concurrent callers cost
+one detection pass.
+
+    python -m gui.server --port 7878
+    python -m gui.server --unix /tmp/deadlock.sock
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+from typing import Dict, List, Optional
+
+# Allow running as a script as well as with python -m
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.graph_store import COUNT_MAX
+from gui.stream import StreamingDetector
+
+FRAME = struct.Struct(">I")
+MAX_FRAME = 1 << 20
+READ_SIZE = 64 * 1024
+HIGH_WATER = 64 * 1024  # Buffered reply bytes before a connection waits for the client
+
+MUTATIONS = {"request": "request", "allocate": "acquire", "release": "release", "cancel": "cancel"}
+
+
+def _bounded(message: dict, key: str, default: Optional[int] = None) -> Optional[int]:
+    """An optional count field as an int in 1..COUNT_MAX"""
+    value = message.get(key, default)
+    if value is None:
+        return None
+    value = int(value)
+    if not 0 < value <= COUNT_MAX:
+        raise ValueError(f"{key} must be between 1 and {COUNT_MAX}, got {value}")
+    return value
+
+
+def encode(message: dict) -> bytes:
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return FRAME.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[dict]:
+    """Next frame from the stream, or None at a clean end of stream"""
+    try:
+        header = await reader.readexactly(FRAME.size)
+    except asyncio.IncompleteReadError as error:
+        if error.partial:
+            raise
+        return None
+    (length,) = FRAME.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError(f"frame of {length} bytes exceeds the {MAX_FRAME} byte limit")
+    return json.loads(await reader.readexactly(length))
+
+
+class DetectionService:
+    """Command handling shared by every connection"""
+
+    def __init__(self, streaming: Optional[StreamingDetector] = None):
+        self.streaming = streaming or StreamingDetector()
+        self.pending_detection: Optional[asyncio.Future] = None
+        self.detections = 0
+        self.detect_calls = 0
+        self.connections = 0
+        self.commands = 0
+
+    def handle(self, message: dict):
+        """Reply dict for a command, or an awaitable for detect"""
+        self.commands += 1
+        cmd = message.get("cmd")
+        if cmd in MUTATIONS:
+            return self._mutate(MUTATIONS[cmd], message)
+        if cmd == "detect":
+            return self.detect()
+        if cmd == "query":
+            return self._query(message)
+        raise ValueError(f"unknown command: {cmd!r}")
+
+    def _mutate(self, op: str, message: dict) -> dict:
+        streaming = self.streaming
+        process, resource = str(message["process"]), str(message["resource"])
+        # Checked before anything is created, so a bad frame leaves no trace
+        count = _bounded(message, "count")
+        instances = _bounded(message, "instances", 1)
+        rejected = streaming.rejected
+        cycle = streaming.apply(op, process, resource, count, instances)
+        reply = {"ok": streaming.rejected == rejected}
+        if cycle:
+            reply["cycle"] = [list(step) for step in streaming.describe(cycle)]
+        return reply
+
+    def detect(self) -> asyncio.Future:
+        """Join the pending detection run or schedule one for the next loop turn"""
+        self.detect_calls += 1
+        if self.pending_detection is None:
+            loop = asyncio.get_running_loop()
+            self.pending_detection = loop.create_future()
+            loop.call_soon(self._run_detection)
+        return self.pending_detection
+
+    def _run_detection(self):
+        future, self.pending_detection = self.pending_detection, None
+        self.detections += 1
+        names = self.streaming.names
+        try:
+            deadlocks = [{
+                "processes": sorted(names[("P", p.uid)] for p in deadlock.processes),
+                "cycle": [[names[("P", p.uid)], names[("R", r.uid)]] for p, r in deadlock.cycle],
+            } for deadlock in self.streaming.detector.find_deadlocks()]
+        except Exception as error:  # Surface to every waiting caller
+            future.set_exception(error)
+            return
+        future.set_result({"deadlocks": deadlocks})
+
+    def _query(self, message: dict) -> dict:
+        streaming = self.streaming
+        store = streaming.detector.store
+        names = streaming.names
+        detector = streaming.detector
+        if "process" in message:
+            process = streaming.processes.get(str(message["process"]))
+            if process is None:
+                return {"holds": {}, "requests": {}}
+            return {
+                "holds": {names[("R", detector.resource_views[rid].uid)]: count
+                          for rid, count in store.holds.out(process.id).items()},
+                "requests": {names[("R", detector.resource_views[rid].uid)]: count
+                             for rid, count in store.requests.out(process.id).items()},
+            }
+        if "resource" in message:
+            resource = streaming.resources.get(str(message["resource"]))
+            if resource is None:
+                return {"instances": None, "holders": {}, "waiters": {}}
+            return {
+                "instances": resource.instances,
+                "holders": {names[("P", p.uid)]: count for p, count in resource.holders.items()},
+                "waiters": {names[("P", p.uid)]: count for p, count in resource.requested_by.items()},
+            }
+        return {
+            "processes": len(streaming.processes),
+            "resources": len(streaming.resources),
+            "events": streaming.events,
+            "rejected": streaming.rejected,
+            "commands": self.commands,
+            "detect_calls": self.detect_calls,
+            "detections": self.detections,
+            "connections": self.connections,
+        }
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Handle every complete frame of each read in one pass and write
+        their replies with a single call, so a pipelining client costs one
+        read and one write per batch rather than per command.
+        """
+        self.connections += 1
+        transport = writer.transport
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                buffer += data
+                replies = []
+                offset = 0
+                while len(buffer) - offset >= FRAME.size:
+                    (length,) = FRAME.unpack_from(buffer, offset)
+                    if length > MAX_FRAME:
+                        raise ValueError(f"frame of {length} bytes exceeds the {MAX_FRAME} byte limit")
+                    end = offset + FRAME.size + length
+                    if end > len(buffer):
+                        break
+                    frame = bytes(buffer[offset + FRAME.size:end])
+                    offset = end
+                    reply_id, reply = self._reply(frame)
+                    if isinstance(reply, asyncio.Future):
+                        # Later frames of this connection wait, keeping replies in order
+                        writer.write(b"".join(replies))
+                        replies = []
+                        try:
+                            reply = dict(await reply)
+                        except Exception as error:
+                            reply = {"error": f"{type(error).__name__}: {error}"}
+                    reply["id"] = reply_id
+                    replies.append(encode(reply))
+                del buffer[:offset]
+                writer.write(b"".join(replies))
+                if transport.get_write_buffer_size() > HIGH_WATER:
+                    await writer.drain()
+            if buffer:
+                raise ValueError("connection closed in the middle of a frame")
+            await writer.drain()
+        except ValueError as error:
+            writer.write(encode({"id": None, "error": f"bad frame: {error}"}))
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def _reply(self, frame: bytes) -> tuple:
+        """Request id and reply dict for one frame, or a future for detect"""
+        reply_id = None
+        try:
+            message = json.loads(frame)
+            reply_id = message.get("id")
+            return reply_id, self.handle(message)
+        except (KeyError, TypeError, ValueError, AttributeError, OverflowError) as error:
+            return reply_id, {"error": f"{type(error).__name__}: {error}"}
+
+
+async def serve(service: DetectionService, host: str = "127.0.0.1", port: int = 7878,
+                unix: Optional[str] = None) -> asyncio.AbstractServer:
+    if unix:
+        return await asyncio.start_unix_server(service.serve_connection, path=unix, backlog=4096)
+    return await asyncio.start_server(service.serve_connection, host, port, backlog=4096)
+
+
+class DetectorClient:
+    """Pipelining asyncio client; call() may be used concurrently"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.waiting: Dict[int, asyncio.Future] = {}
+        self.receiver = asyncio.ensure_future(self._receive())
+
+    @classmethod
+    async def connect(cls, host: str = "127.0.0.1", port: int = 7878,
+                      unix: Optional[str] = None) -> 'DetectorClient':
+        if unix:
+            reader, writer = await asyncio.open_unix_connection(unix)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    def send(self, cmd: str, **fields) -> asyncio.Future:
+        """Queue a command without waiting; the future resolves to its reply"""
+        self.next_id += 1
+        fields.update(id=self.next_id, cmd=cmd)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[self.next_id] = future
+        self.writer.write(encode(fields))
+        return future
+
+    async def call(self, cmd: str, **fields) -> dict:
+        future = self.send(cmd, **fields)
+        await self.writer.drain()
+        return await future
+
+    async def _receive(self):
+        try:
+            while True:
+                reply = await read_frame(self.reader)
+                if reply is None:
+                    break
+                future = self.waiting.pop(reply.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            self.waiting.clear()
+
+    async def close(self):
+        self.writer.close()
+        await self.receiver
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Deadlock detection service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7878)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    args = parser.parse_args(argv)
+
+    async def run():
+        server = await serve(DetectionService(), args.host, args.port, args.unix)
+        where = args.unix or f"{args.host}:{args.port}"
+        print(f"listening on {where}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+Streaming lock-event ingestion.
+
+Reads acquire/request/release events from JSONL or CSV traces (files or
+stdin), drives a DeadlockDetector one event at a time and yields a report
+as soon as an event closes a wait-for cycle.  Every stage is a generator,
+and processes and resources are evicted once they neither hold nor wait
+for anything, so memory stays proportional to the live graph.
+
+JSONL lines look like
+    {"op": "request", "process": "T1", "resource": "L1", "count": 1, "ts": 12.5}
+and CSV files use the header  op,process,resource[,count][,ts][,instances].
+"op" is one of request, acquire, release or cancel, or fork or join with
+the child thread as "resource"; fork and join only order threads for
+gui.predict and are ignored by detection.
+
+Run headless against a trace:
+    python -m gui.stream trace.jsonl
+    cat trace.csv | python -m gui.stream --format csv -
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+# Allow running as a script as well as with python -m
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from gui.deadlock_detector import DeadlockDetector
+from gui.graph_store import COUNT_MAX
+from gui.process import Process, Resource
+
+OPS = ("request", "acquire", "release", "cancel", "fork", "join")
+THREAD_OPS = ("fork", "join")
+
+
+class Event(NamedTuple):
+    op: str
+    process: str
+    resource: str
+    count: Optional[int] = None
+    timestamp: Optional[float] = None
+    instances: int = 1  # Capacity, used when the resource is first seen
+
+
+class DeadlockReport(NamedTuple):
+    index: int                       # Position of the cycle-closing event
+    event: Event
+    cycle: List[Tuple[str, str]]     # (process, resource it waits for) in wait order
+    latency: Optional[float] = None  # Seconds from the event to the report, when scheduled
+    lag: Optional[int] = None        # Events processed in between, when scheduled
+
+    def to_dict(self) -> dict:
+        result = {
+            "index": self.index,
+            "ts": self.event.timestamp,
+            "op": self.event.op,
+            "cycle": [{"process": p, "resource": r} for p, r in self.cycle],
+        }
+        if self.latency is not None:
+            result["latency_ms"] = self.latency * 1000
+            result["lag"] = self.lag
+        return result
+
+
+def _optional_int(value) -> Optional[int]:
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except OverflowError:
+        raise ValueError(f"not an integer: {value!r}") from None
+
+
+def _optional_float(value) -> Optional[float]:
+    return None if value in (None, "") else float(value)
+
+
+def _event(record: dict) -> Event:
+    if not isinstance(record, dict):
+        raise ValueError("event record is not an object")
+    for field in ("op", "process", "resource"):
+        if record.get(field) in (None, ""):
+            raise ValueError(f"event record has no {field!r}")
+    op = str(record["op"]).lower()
+    if op not in OPS:
+        raise ValueError(f"Unknown event op: {op!r}")
+    count = _optional_int(record.get("count"))
+    if count is not None and not 0 < count <= COUNT_MAX:
+        raise ValueError(f"count must be between 1 and {COUNT_MAX}, got {count}")
+    instances = _optional_int(record.get("instances"))
+    if instances is not None and not 0 < instances <= COUNT_MAX:
+        raise ValueError(f"instances must be between 1 and {COUNT_MAX}, got {instances}")
+    return Event(op, str(record["process"]), str(record["resource"]), count,
+                 _optional_float(record.get("ts", record.get("timestamp"))),
+                 1 if instances is None else instances)
+
+
+# Called with the line number and error of a malformed record, which is skipped
+ErrorHandler = Callable[[int, ValueError], None]
+
+
+def _parse(numbered: Iterable[Tuple[int, object]], parse: Callable[[object], Event],
+           on_error: Optional[ErrorHandler]) -> Iterator[Event]:
+    for number, item in numbered:
+        try:
+            event = parse(item)
+        except ValueError as error:
+            if on_error is None:
+                raise ValueError(f"line {number}: {error}") from None
+            on_error(number, error)
+            continue
+        yield event
+
+
+def read_jsonl(lines: Iterable[str], on_error: Optional[ErrorHandler] = None) -> Iterator[Event]:
+    """Parse JSON Lines, skipping blank lines"""
+    numbered = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+    return _parse(numbered, lambda line: _event(json.loads(line)), on_error)
+
+
+def read_csv(lines: Iterable[str], on_error: Optional[ErrorHandler] = None) -> Iterator[Event]:
+    """Parse CSV with a header row naming the event fields"""
+    reader = csv.DictReader(lines)
+    return _parse(((reader.line_num, record) for record in reader), _event, on_error)
+
+
+READERS = {"jsonl": read_jsonl, "csv": read_csv}
+
+
+def read_events(source: TextIO, fmt: str = "jsonl",
+                on_error: Optional[ErrorHandler] = None) -> Iterator[Event]:
+    """
+    Parse events lazily from an open text stream.  A malformed record
+    raises ValueError naming its line, or is passed to on_error and skipped.
+    """
+    return READERS[fmt](source, on_error)
+
+
+def guess_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+class StreamingDetector:
+    """Feeds events into a DeadlockDetector, mapping trace names to nodes"""
+
+    def __init__(self, detector: Optional[DeadlockDetector] = None, evict_idle: bool = True):
+        self.detector = detector or DeadlockDetector(contiguous_labels=False)
+        self.evict_idle = evict_idle
+        self.processes: Dict[str, Process] = {}
+        self.resources: Dict[str, Resource] = {}
+        self.names: Dict[Tuple[str, int], str] = {}  # (kind, uid) -> trace name
+        self.events = 0
+        self.rejected = 0  # Events inconsistent with the current graph
+
+    def feed(self, event: Event) -> Optional[DeadlockReport]:
+        """Apply one event; returns a report if it closed a cycle"""
+        index = self.events
+        cycle = self.apply(event.op, event.process, event.resource, event.count, event.instances)
+        if cycle:
+            return DeadlockReport(index, event, self.describe(cycle))
+        return None
+
+    def apply(self, op: str, process_name: str, resource_name: str,
+              count: Optional[int] = None, instances: int = 1) -> Optional[List[Process]]:
+        """Apply one event given as plain values; returns the cycle it closed"""
+        self.events += 1
+        if op in THREAD_OPS:
+            return None
+        process = self._process(process_name)
+        resource = self._resource(resource_name, instances)
+        store = self.detector.store
+
+        cycle = None
+        if op == "request":
+            before = store.requests.get(process.id, resource.id)
+            cycle = self.detector.request_resource(process, resource, 1 if count is None else count)
+            if store.requests.get(process.id, resource.id) == before:
+                self.rejected += 1
+        elif op == "acquire":
+            before = store.holds.get(process.id, resource.id)
+            cycle = self.detector.allocate_resource(resource, process, 1 if count is None else count)
+            if store.holds.get(process.id, resource.id) == before:
+                self.rejected += 1
+        elif op == "release":
+            if not self.detector.release_resource(process, resource, count):
+                self.rejected += 1
+        elif not self.detector.cancel_request(process, resource):
+            self.rejected += 1
+
+        if self.evict_idle and op in ("release", "cancel"):
+            self._evict(process, resource)
+        return cycle
+
+    def run(self, events: Iterable[Event]) -> Iterator[DeadlockReport]:
+        """Yield a report for every event that closes a cycle"""
+        for event in events:
+            report = self.feed(event)
+            if report is not None:
+                yield report
+
+    def _process(self, name: str) -> Process:
+        process = self.processes.get(name)
+        if process is None:
+            process = self.processes[name] = self.detector.add_process()
+            self.names[("P", process.uid)] = name
+        return process
+
+    def _resource(self, name: str, instances: int) -> Resource:
+        resource = self.resources.get(name)
+        if resource is None:
+            resource = self.resources[name] = self.detector.add_resource(instances=instances)
+            self.names[("R", resource.uid)] = name
+        return resource
+
+    def settle(self, process_name: str, resource_name: str, requested: int, held: int,
+               instances: Optional[int]):
+        """
+        Bring a resource that only process_name uses to its net state
+        after a batch of events, or drop it if instances is None (evicted).
+        Nobody else holds or waits for it, so this closes no cycle.
+        """
+        resource = self.resources.get(resource_name)
+        if resource is not None and resource.instances != instances:
+            del self.resources[self.names.pop(("R", resource.uid))]
+            self.detector.remove_resource(resource)
+        process = self.processes.get(process_name)
+        if instances is None:
+            if process is not None and self.evict_idle:
+                self._evict_process(process)
+            return
+        resource = self._resource(resource_name, instances)
+        if process is None:
+            if not held and not requested:
+                return
+            process = self._process(process_name)
+        store = self.detector.store
+        current = store.holds.get(process.id, resource.id)
+        if held < current:
+            self.detector.release_resource(process, resource, current - held if held else None)
+        elif held > current:
+            self.detector.allocate_resource(resource, process, held - current)
+        if store.requests.get(process.id, resource.id) != requested:
+            self.detector.cancel_request(process, resource)
+            if requested:
+                self.detector.request_resource(process, resource, requested)
+
+    def describe(self, cycle: List[Process]) -> List[Tuple[str, str]]:
+        """Name the resource connecting each process to the next one"""
+        store = self.detector.store
+        steps = []
+        for i, process in enumerate(cycle):
+            holder = cycle[(i + 1) % len(cycle)]
+            rid = next((r for r in store.requests.out(process.id)
+                        if store.holds.get(holder.id, r)), None)
+            resource = self.detector.resource_views[rid] if rid is not None else None
+            steps.append((self.names[("P", process.uid)],
+                          self.names[("R", resource.uid)] if resource else "?"))
+        return steps
+
+    def _evict(self, process: Process, resource: Resource):
+        """Drop nodes that no longer hold or wait for anything"""
+        store = self.detector.store
+        self._evict_process(process)
+        if not store.requests.into(resource.id) and not store.holds.into(resource.id):
+            del self.resources[self.names.pop(("R", resource.uid))]
+            self.detector.remove_resource(resource)
+
+    def _evict_process(self, process: Process):
+        store = self.detector.store
+        if not store.requests.out(process.id) and not store.holds.out(process.id):
+            del self.processes[self.names.pop(("P", process.uid))]
+            self.detector.remove_process(process)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Detect deadlocks in lock-event traces")
+    parser.add_argument("paths", nargs="*", default=["-"],
+                        help="trace files, '-' for stdin (default)")
+    parser.add_argument("--format", choices=sorted(READERS),
+                        help="trace format (default: from extension, jsonl for stdin)")
+    parser.add_argument("--no-evict", action="store_true",
+                        help="keep idle processes and resources in the graph")
+    parser.add_argument("--schedule", choices=("event", "events", "interval", "contended"),
+                        default="event",
+                        help="detect on every event (default), every N events, every T ms "
+                             "or on contended requests")
+    parser.add_argument("--every", type=int, default=1000,
+                        help="minimum events between detections for --schedule events")
+    parser.add_argument("--interval-ms", type=float, default=50.0,
+                        help="minimum milliseconds between detections for --schedule interval")
+    parser.add_argument("--budget", type=float, default=0.1,
+                        help="fraction of processing time detection may use (default: 0.1)")
+    parser.add_argument("--fixed", action="store_true",
+                        help="do not adapt the schedule to the measured detection cost")
+    args = parser.parse_args(argv)
+
+    if args.schedule == "event":
+        streaming = StreamingDetector(evict_idle=not args.no_evict)
+        scheduler = None
+        run = streaming.run
+    else:
+        from gui.scheduler import DetectionScheduler
+        streaming = StreamingDetector(DeadlockDetector(incremental=False, contiguous_labels=False),
+                                      evict_idle=not args.no_evict)
+        scheduler = DetectionScheduler(streaming, args.schedule, every=args.every,
+                                       interval_ms=args.interval_ms, adapt=not args.fixed,
+                                       budget=args.budget)
+        run = scheduler.run
+
+    found = 0
+    for path in args.paths:
+        fmt = args.format or ("jsonl" if path == "-" else guess_format(path))
+        source = sys.stdin if path == "-" else open(path, newline="")
+
+        def reject(number: int, error: ValueError, name: str = "<stdin>" if path == "-" else path):
+            streaming.rejected += 1
+            print(f"{name}:{number}: {error}", file=sys.stderr)
+
+        try:
+            for report in run(read_events(source, fmt, reject)):
+                found += 1
+                print(json.dumps(report.to_dict()), flush=True)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+    print(f"{streaming.events} events, {found} deadlocks, {streaming.rejected} rejected events",
+          file=sys.stderr)
+    if scheduler is not None:
+        stats = scheduler.stats()
+        print(f"{stats['detections']} detections, {stats['mean_detection_ms']:.3f} ms each, "
+              f"latency mean {stats['mean_latency_ms']:.3f} ms / max {stats['max_latency_ms']:.3f} ms, "
+              f"max lag {stats['max_lag_events']} events", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import networkx as nx
-import matplotlib.pyplot as plt
-from io import BytesIO
-import base64
+import hashlib
+
+from gui.cycles import CycleSearch
+from gui.layout import IncrementalLayout
+from gui.rag import analyze, export_graph, graph_fingerprint, import_graph, to_csr
+from gui.render import build_scene, canvas_html, render_png, to_svg
 
 # Set page config
 st.set_page_config(
@@ -41,6 +45,48 @@ st.markdown("""
 # Initialize session state for graph
 if 'graph' not in st.session_state:
     st.session_state.graph = nx.DiGraph()
+# Positions persist across reruns; only nodes new to the session are placed
+if 'layout' not in st.session_state:
+    st.session_state.layout = IncrementalLayout()
+    st.session_state.layout_of = None
+    st.session_state.layout_digest = None
+
+
+# Results are cached by graph content and shared by every session, so a
+# rerun that changes nothing structural only recomputes the fingerprint.
+# Arguments starting with an underscore are not hashed by Streamlit.
+@st.cache_data(max_entries=1024, show_spinner=False)
+def cached_analysis(fingerprint, _graph):
+    return analyze(_graph)
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_drawing(fingerprint, layout_digest, renderer, hot, _graph, _positions):
+    if renderer == "Matplotlib":
+        return render_png(_graph, _positions)
+    nodes = list(_graph.nodes())
+    kinds = [1 if _graph.nodes[n].get('type') == 'Resource' else 0 for n in nodes]
+    scene = build_scene(nodes, kinds, _positions, list(_graph.edges()), set(hot))
+    return to_svg(scene) if renderer == "SVG" else canvas_html(scene)
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def cached_cycles(fingerprint, _graph, min_length, max_length, max_cycles, time_budget):
+    # Cycles are written as they are found; on a cache hit the writes are replayed
+    nodes, indptr, indices = to_csr(_graph)
+    search = CycleSearch(len(nodes), indptr, indices, min_length, max_length or None,
+                         max_cycles, time_budget)
+    for i, cycle in enumerate(search, 1):
+        names = [str(nodes[v]) for v in cycle]
+        st.write(f"Cycle {i}: {' → '.join(names)} → {names[0]}")
+    return search.found, search.truncated, search.elapsed
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_export(fingerprint, fmt, _graph):
+    skipped = []
+    data = export_graph(_graph, fmt, skipped)
+    return data, skipped
 
 # Sidebar for controls
 with st.sidebar:
@@ -72,52 +118,106 @@ with st.sidebar:
     # Clear graph
     if st.button("Clear Graph"):
         st.session_state.graph = nx.DiGraph()
+        st.session_state.layout = IncrementalLayout()
+        st.session_state.layout_of = None
         st.success("Graph cleared")
 
+    st.subheader("Rendering")
+    renderer = st.radio("Renderer", ["SVG", "Canvas", "Matplotlib"],
+                        help="SVG and Canvas thin out what cannot be seen on large graphs; "
+                             "Matplotlib is the original drawing")
+
+    # Bounds on the cycle listing; dense graphs have exponentially many cycles
+    st.subheader("Cycle Search")
+    max_cycles = st.number_input("Max cycles", min_value=1, value=100, step=10)
+    time_budget = st.number_input("Time budget (s)", min_value=0.1, value=2.0, step=0.5)
+    min_length = st.number_input("Min cycle length", min_value=1, value=1)
+    max_length = st.number_input("Max cycle length (0 = no limit)", min_value=0, value=0)
+
+    # Whole graphs at once: the file is parsed as it streams and inserted in one batch
+    st.subheader("Import / Export")
+    uploaded = st.file_uploader("Graph file", type=["csv", "jsonl", "dlev"],
+                                help="A lock-event trace (CSV/JSONL), an edge list with source and "
+                                     "target columns, or a binary .dlev event log")
+    replace = st.checkbox("Replace current graph", value=True)
+    if st.button("Import") and uploaded is not None:
+        try:
+            imported = import_graph(uploaded, uploaded.name.rsplit(".", 1)[-1].lower())
+        except (ValueError, KeyError) as error:
+            st.error(f"Could not import {uploaded.name}: {error}")
+        else:
+            if replace:
+                st.session_state.graph = nx.DiGraph()
+                st.session_state.layout = IncrementalLayout()
+                st.session_state.layout_of = None
+            imported.into(st.session_state.graph)
+            st.success(f"Imported {len(imported.nodes)} nodes and {len(imported.edges)} edges "
+                       f"from {imported.records} records")
+
+    # All edits of this run are applied by now
+    fingerprint = graph_fingerprint(st.session_state.graph)
+    if st.session_state.graph.nodes():
+        export_format = st.selectbox("Export format", ["csv", "jsonl", "dlev"])
+        data, skipped = cached_export(fingerprint, export_format, st.session_state.graph)
+        st.download_button("Download", data, file_name=f"graph.{export_format}",
+                           mime="application/octet-stream")
+        if skipped:
+            st.caption(f"{len(skipped)} edge(s) that are not a request or an allocation are left out")
+
 # Main content area
 col1, col2 = st.columns(2)
+if st.session_state.layout_of != fingerprint:
+    graph = st.session_state.graph
+    positions = st.session_state.layout.update(list(graph.nodes()), graph.edges())
+    st.session_state.layout_of = fingerprint
+    st.session_state.layout_digest = hashlib.blake2b(
+        repr(sorted((str(n), xy) for n, xy in positions.items())).encode(), digest_size=16).hexdigest()
+
+# Deadlocked processes and the resources on their cycles are drawn highlighted
+analysis = cached_analysis(fingerprint, st.session_state.graph) if st.session_state.graph.nodes() else None
+hot = tuple(sorted({name for deadlock in analysis["deadlocks"]
+                    for step in deadlock["cycle"] for name in step})) if analysis else ()
 
 with col1:
     st.subheader("Graph Visualization")
     if st.session_state.graph.nodes():
-        # Create figure
-        fig, ax = plt.subplots(figsize=(10, 8))
-        
-        # Draw graph
-        pos = nx.spring_layout(st.session_state.graph)
-        node_colors = ['lightblue' if st.session_state.graph.nodes[n]['type'] == 'Process' else 'lightgreen' 
-                      for n in st.session_state.graph.nodes()]
-        
-        nx.draw(st.session_state.graph, pos, with_labels=True, node_color=node_colors,
-                node_size=2000, font_size=12, font_weight='bold', ax=ax)
-        
-        # Convert plot to image
-        buf = BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        img_str = base64.b64encode(buf.read()).decode()
-        
-        # Display image
-        st.markdown(f'<img src="data:image/png;base64,{img_str}" style="width:100%">', 
-                   unsafe_allow_html=True)
+        drawing = cached_drawing(fingerprint, st.session_state.layout_digest, renderer, hot,
+                                 st.session_state.graph, st.session_state.layout.positions)
+        if renderer == "Matplotlib":
+            st.markdown(f'<img src="data:image/png;base64,{drawing}" style="width:100%">',
+                        unsafe_allow_html=True)
+        else:
+            components.html(drawing, height=560)
     else:
         st.info("Add nodes and edges to visualize the graph")
 
 with col2:
     st.subheader("Deadlock Analysis")
     if st.session_state.graph.nodes():
-        # Check for cycles
-        try:
-            cycles = list(nx.simple_cycles(st.session_state.graph))
-            if cycles:
-                st.error("⚠️ Deadlock Detected!")
-                st.write("Cycles found:")
-                for i, cycle in enumerate(cycles, 1):
-                    st.write(f"Cycle {i}: {' → '.join(cycle)} → {cycle[0]}")
+        if analysis["deadlocks"]:
+            st.error("⚠️ Deadlock Detected!")
+            # Summary of the deadlocked components before any cycle is listed
+            st.write(f"{len(analysis['deadlocks'])} deadlocked component(s):")
+            for i, deadlock in enumerate(analysis["deadlocks"], 1):
+                steps = " → ".join(f"{p} waits for {r}" for p, r in deadlock["cycle"])
+                st.write(f"Component {i}: processes {', '.join(deadlock['processes'])}; {steps}")
+            st.write("Cycles found:")
+            found, truncated, elapsed = cached_cycles(fingerprint, st.session_state.graph,
+                                                      int(min_length), int(max_length),
+                                                      int(max_cycles), float(time_budget))
+            if truncated == "max_cycles":
+                st.warning(f"Stopped after {found} cycles; raise Max cycles to see more")
+            elif truncated == "time_budget":
+                st.warning(f"Stopped after {found} cycles when the {time_budget:g}s budget ran out")
+            elif found:
+                st.caption(f"All {found} cycles listed in {elapsed:.2f}s")
             else:
-                st.success("✅ No deadlocks detected")
-        except nx.NetworkXNoCycle:
+                st.info("No cycle within the length bounds")
+        else:
             st.success("✅ No deadlocks detected")
+        if analysis["ignored"]:
+            st.caption("Edges that are not a request or an allocation within capacity: "
+                       + ", ".join(f"{a} → {b}" for a, b in analysis["ignored"]))
     else:
         st.info("Add nodes and edges to perform deadlock analysis")
 